@@ -8,9 +8,10 @@ import json
 import time
 import asyncio
 from datetime import datetime
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, AsyncIterator
 from enum import Enum
 import httpx
+from llm_scheduler import LLMScheduler, Priority
 
 # Provider SDKs (will be imported conditionally)
 try:
@@ -38,11 +39,72 @@ class RotationStrategy(Enum):
     FALLBACK = "fallback"
 
 
+class TokenBucket:
+    """Token bucket refilled continuously: `per_minute` tokens every 60 seconds."""
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (requests bigger than capacity wait for a full bucket)."""
+        amount = min(amount, self.capacity)
+        missing = amount - self.available()
+        return max(0.0, missing / self.rate) if self.rate > 0 else float('inf')
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+def _process_count() -> int:
+    """
+    Processes that each run their own pool: gunicorn web workers (WEB_CONCURRENCY) + the ingest
+    worker. AI_POOL_PROCESSES overrides it; without either (local uvicorn) it is 1.
+    """
+    explicit = int(os.getenv("AI_POOL_PROCESSES", "0"))
+    if explicit > 0:
+        return explicit
+    web = int(os.getenv("WEB_CONCURRENCY", "0"))
+    return web + 1 if web > 0 else 1
+
+
 class AIProvider:
     """Base class for AI providers"""
+    # Max prompt tokens we send to this provider (context window / free-tier TPM, whichever bites first)
+    max_prompt_tokens = 8000
+    # Env prefix for per-key limits: {PREFIX}_PROMPT_TOKEN_BUDGET, _MAX_CONCURRENCY, _RPM, _TPM (0 = unlimited)
+    env_prefix = None
+    default_limits = {"MAX_CONCURRENCY": 2, "RPM": 0, "TPM": 0}
+    rate_limit_cooldown_s = 30
+
     def __init__(self, name: str, api_key: str):
         self.name = name
         self.api_key = api_key
+        self.max_prompt_tokens = int(self._limit("PROMPT_TOKEN_BUDGET", self.max_prompt_tokens))
+
+        # Capacity control: concurrent calls per key + requests/tokens per minute. The limits are
+        # per key for the whole deployment and every process keeps its own buckets, so each one
+        # takes an equal share (concurrency never drops below 1 slot per process)
+        self.process_share = _process_count()
+        self.max_concurrency = max(1, int(self._limit("MAX_CONCURRENCY", self.default_limits["MAX_CONCURRENCY"])) // self.process_share)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+        rpm = float(self._limit("RPM", self.default_limits["RPM"])) / self.process_share
+        tpm = float(self._limit("TPM", self.default_limits["TPM"])) / self.process_share
+        self.rpm_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.tpm_bucket = TokenBucket(tpm) if tpm > 0 else None
+        self.cooldown_until = 0.0
         self.stats = {
             "total_requests": 0,
             "successful": 0,
@@ -53,9 +115,76 @@ class AIProvider:
             "last_used": None
         }
     
+    def _limit(self, key: str, default):
+        if self.env_prefix and os.getenv(f"{self.env_prefix}_{key}"):
+            return os.getenv(f"{self.env_prefix}_{key}")
+        return default
+
+    def wait_time(self, est_tokens: int = 0) -> float:
+        """Seconds until this key can take a request of `est_tokens` (0 = capacity available now)."""
+        waits = [max(0.0, self.cooldown_until - time.monotonic())]
+        if self.rpm_bucket:
+            waits.append(self.rpm_bucket.wait_time(1))
+        if self.tpm_bucket:
+            waits.append(self.tpm_bucket.wait_time(est_tokens))
+        return max(waits)
+
+    def has_capacity(self, est_tokens: int = 0) -> bool:
+        return self.in_flight < self.max_concurrency and self.wait_time(est_tokens) == 0
+
+    async def acquire(self, est_tokens: int = 0, max_wait_s: float = None) -> bool:
+        """
+        Takes a concurrency slot and waits for the rate buckets before calling the API.
+        Returns False (holding nothing) if the slot or the buckets would take over max_wait_s.
+        """
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), max_wait_s)
+        except asyncio.TimeoutError:
+            return False
+        try:
+            delay = self.wait_time(est_tokens)
+            if max_wait_s is not None and time.monotonic() - started + delay > max_wait_s:
+                self._semaphore.release()
+                return False
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = self.wait_time(est_tokens)
+            if self.rpm_bucket:
+                self.rpm_bucket.consume(1)
+            if self.tpm_bucket:
+                self.tpm_bucket.consume(est_tokens)
+            self.in_flight += 1
+            return True
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def mark_rate_limited(self):
+        """Called on 429/quota errors: keep this key out of rotation for a while."""
+        self.cooldown_until = time.monotonic() + self.rate_limit_cooldown_s
+
+    def capacity_info(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "process_share": self.process_share,
+            "rpm_available": round(self.rpm_bucket.available(), 1) if self.rpm_bucket else None,
+            "tpm_available": round(self.tpm_bucket.available()) if self.tpm_bucket else None,
+            "cooldown_s": round(max(0.0, self.cooldown_until - time.monotonic()), 1)
+        }
+
     async def generate(self, prompt: str) -> str:
         """Generate response from AI provider"""
         raise NotImplementedError
+
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """Stream response chunks. Providers without a streaming API yield the full answer once."""
+        yield await self.generate(prompt)
     
     def update_stats(self, success: bool, latency_ms: float, error: Optional[str] = None):
         """Update provider statistics"""
@@ -71,8 +200,30 @@ class AIProvider:
             self.stats["last_error"] = error
 
 
+async def _stream_openai_compatible(url: str, headers: dict, payload: dict) -> AsyncIterator[str]:
+    """Parses the SSE stream of an OpenAI-compatible /chat/completions endpoint."""
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        async with client.stream("POST", url, headers=headers, json={**payload, "stream": True}) as response:
+            if response.status_code != 200:
+                error_detail = (await response.aread()).decode("utf-8", errors="ignore")
+                raise Exception(f"API Error {response.status_code}: {error_detail}")
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+
 class GeminiProvider(AIProvider):
     """Google Gemini provider"""
+    max_prompt_tokens = 30000
+    env_prefix = "GEMINI"
+    default_limits = {"MAX_CONCURRENCY": 2, "RPM": 15, "TPM": 250000}
+
     def __init__(self, name: str, api_key: str, model: str = "models/gemini-flash-latest"):
         super().__init__(name, api_key)
         self.model_name = model
@@ -100,16 +251,32 @@ class GeminiProvider(AIProvider):
             self.update_stats(False, latency_ms, error_msg)
             raise Exception(f"Gemini error: {error_msg}")
 
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        start_time = time.time()
+        try:
+            response = await self.model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                text = getattr(chunk, "text", "")
+                if text:
+                    yield text
+            self.update_stats(True, (time.time() - start_time) * 1000)
+        except Exception as e:
+            self.update_stats(False, (time.time() - start_time) * 1000, str(e))
+            raise Exception(f"Gemini error: {e}")
+
 
 class GroqProvider(AIProvider):
     """Groq provider (ultra-fast inference)"""
+    max_prompt_tokens = 5000
+    env_prefix = "GROQ"
+    default_limits = {"MAX_CONCURRENCY": 2, "RPM": 30, "TPM": 6000}
+
     def __init__(self, name: str, api_key: str, model: str = "llama-3.3-70b-versatile"):
         super().__init__(name, api_key)
         self.model_name = model
         self.base_url = "https://api.groq.com/openai/v1"
     
-    async def generate(self, prompt: str) -> str:
-        start_time = time.time()
+    def _request(self, prompt: str):
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -125,6 +292,11 @@ class GroqProvider(AIProvider):
             "temperature": 0.5,
             "max_tokens": 1024
         }
+        return headers, payload
+
+    async def generate(self, prompt: str) -> str:
+        start_time = time.time()
+        headers, payload = self._request(prompt)
         
         try:
             async with httpx.AsyncClient(timeout=30.0) as client:
@@ -150,16 +322,30 @@ class GroqProvider(AIProvider):
             self.update_stats(False, latency_ms, error_msg)
             raise Exception(f"Groq error: {error_msg}")
 
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        start_time = time.time()
+        headers, payload = self._request(prompt)
+        try:
+            async for delta in _stream_openai_compatible(f"{self.base_url}/chat/completions", headers, payload):
+                yield delta
+            self.update_stats(True, (time.time() - start_time) * 1000)
+        except Exception as e:
+            self.update_stats(False, (time.time() - start_time) * 1000, str(e))
+            raise Exception(f"Groq error: {e}")
+
 
 class GrokProvider(AIProvider):
     """xAI Grok provider"""
+    max_prompt_tokens = 20000
+    env_prefix = "GROK"
+    default_limits = {"MAX_CONCURRENCY": 4, "RPM": 60, "TPM": 100000}
+
     def __init__(self, name: str, api_key: str, model: str = "grok-beta"):
         super().__init__(name, api_key)
         self.model_name = model
         self.base_url = "https://api.x.ai/v1"
     
-    async def generate(self, prompt: str) -> str:
-        start_time = time.time()
+    def _request(self, prompt: str):
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -170,6 +356,11 @@ class GrokProvider(AIProvider):
             "temperature": 0.7,
             "max_tokens": 2000
         }
+        return headers, payload
+
+    async def generate(self, prompt: str) -> str:
+        start_time = time.time()
+        headers, payload = self._request(prompt)
         
         try:
             async with httpx.AsyncClient(timeout=30.0) as client:
@@ -192,9 +383,24 @@ class GrokProvider(AIProvider):
             self.update_stats(False, latency_ms, error_msg)
             raise Exception(f"Grok error: {error_msg}")
 
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        start_time = time.time()
+        headers, payload = self._request(prompt)
+        try:
+            async for delta in _stream_openai_compatible(f"{self.base_url}/chat/completions", headers, payload):
+                yield delta
+            self.update_stats(True, (time.time() - start_time) * 1000)
+        except Exception as e:
+            self.update_stats(False, (time.time() - start_time) * 1000, str(e))
+            raise Exception(f"Grok error: {e}")
+
 
 class OpenAIProvider(AIProvider):
     """OpenAI provider"""
+    max_prompt_tokens = 20000
+    env_prefix = "OPENAI"
+    default_limits = {"MAX_CONCURRENCY": 4, "RPM": 500, "TPM": 200000}
+
     def __init__(self, name: str, api_key: str, model: str = "gpt-4o-mini"):
         super().__init__(name, api_key)
         self.model_name = model
@@ -224,6 +430,25 @@ class OpenAIProvider(AIProvider):
             self.update_stats(False, latency_ms, error_msg)
             raise Exception(f"OpenAI error: {error_msg}")
 
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        start_time = time.time()
+        try:
+            stream = await self.client.chat.completions.create(
+                model=self.model_name,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens=2000,
+                stream=True
+            )
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+            self.update_stats(True, (time.time() - start_time) * 1000)
+        except Exception as e:
+            self.update_stats(False, (time.time() - start_time) * 1000, str(e))
+            raise Exception(f"OpenAI error: {e}")
+
 
 class AIPool:
     """Manages multiple AI providers with automatic rotation and fallback"""
@@ -233,13 +458,18 @@ class AIPool:
         self.strategy = strategy
         self.current_index = 0
         self.stats_file = "performance_tracker.json"
-        self._quota_blacklist: set = set()  # Providers with 429 in current request cycle
+        # Longest we queue on a saturated/cooling-down key before moving to the next one
+        self.max_wait_s = float(os.getenv("AI_POOL_MAX_WAIT_S", "20"))
         
         # Load providers from environment
         self._load_providers()
         
         # Load historical stats
         self._load_stats()
+
+        # Priority scheduler in front of the providers (defaults to the pool's total concurrency)
+        slots = int(os.getenv("LLM_SCHEDULER_SLOTS", "0")) or sum(p.max_concurrency for p in self.providers)
+        self.scheduler = LLMScheduler(slots, background_slots=int(os.getenv("LLM_BACKGROUND_SLOTS", "0")) or None)
     
     def _load_providers(self):
         """Load AI providers from environment variables"""
@@ -338,51 +568,90 @@ class AIPool:
         except Exception as e:
             print(f"Warning: Could not save stats: {e}")
     
-    def _get_next_provider(self, exclude: set = None) -> AIProvider:
-        """Get next provider based on rotation strategy, skipping excluded ones."""
+    def _expected_latency(self, provider: AIProvider, known_avg: float) -> float:
+        """Average latency scaled by the calls already queued on this key."""
+        if provider.stats["successful"] > 0:
+            base = provider.stats["avg_latency_ms"]
+        elif provider.stats["failed"] > 0:
+            return float('inf')
+        else:
+            base = known_avg  # Untried keys compete with the pool average instead of going last
+        return base * (1 + provider.in_flight)
+
+    def _get_next_provider(self, exclude: set = None, est_tokens: int = 0) -> AIProvider:
+        """
+        Get next provider based on rotation strategy, skipping excluded ones.
+        Providers with free capacity (concurrency slot + RPM/TPM budget) go first; if every key
+        is saturated, the one that frees up soonest is returned and the caller waits on it.
+        """
         excluded = exclude or set()
         available = [p for p in self.providers if p.name not in excluded]
         if not available:
             return None
+        ready = [p for p in available if p.has_capacity(est_tokens)]
+        if not ready:
+            return min(available, key=lambda p: (p.wait_time(est_tokens), p.in_flight))
 
         if self.strategy == RotationStrategy.ROUND_ROBIN:
-            # Pick next available provider in circular order
+            # Pick next ready provider in circular order
             for _ in range(len(self.providers)):
                 provider = self.providers[self.current_index]
                 self.current_index = (self.current_index + 1) % len(self.providers)
-                if provider.name not in excluded:
+                if provider in ready:
                     return provider
-            return available[0]
+            return ready[0]
 
         elif self.strategy == RotationStrategy.FASTEST_FIRST:
-            # Sort by average latency; providers with no success go last
-            sorted_providers = sorted(
-                available,
-                key=lambda p: p.stats["avg_latency_ms"] if p.stats["successful"] > 0 else float('inf')
-            )
-            return sorted_providers[0]
+            # Best expected latency given current load; providers that only failed go last
+            latencies = [p.stats["avg_latency_ms"] for p in self.providers if p.stats["successful"] > 0]
+            known_avg = sum(latencies) / len(latencies) if latencies else 1.0
+            return min(ready, key=lambda p: (self._expected_latency(p, known_avg), p.in_flight))
 
-        else:  # FALLBACK — try in list order, skipping excluded
-            return available[0]
-    
-    async def generate(self, prompt: str, max_retries: int = None) -> str:
+        else:  # FALLBACK — try in list order, skipping excluded and saturated
+            return ready[0]
+
+    @staticmethod
+    def _is_rate_limit_error(error: Exception) -> bool:
+        text = str(error).lower()
+        return "429" in text or "quota" in text or "rate limit" in text or "resource_exhausted" in text
+
+    def get_prompt_token_budget(self) -> int:
+        """
+        Prompt token budget that fits every provider generate() may fall back to (on 429 or
+        error it tries each key once), i.e. the smallest max_prompt_tokens in the pool.
+        """
+        if not self.providers:
+            return AIProvider.max_prompt_tokens
+        return min(p.max_prompt_tokens for p in self.providers)
+
+    async def generate(self, prompt: str, max_retries: int = None,
+                       priority: Priority = Priority.INTERACTIVE, deadline_s: float = None) -> str:
         """
         Generate response using AI pool with automatic fallback.
-        Tries each provider at most once per call; skips providers on 429.
+        Waits for a scheduler slot of the given priority, then tries each provider at most once;
+        keys that answer 429 cool down before reuse.
         """
+        async with self.scheduler.slot(priority, deadline_s):
+            return await self._generate(prompt, max_retries)
+
+    async def _generate(self, prompt: str, max_retries: int = None) -> str:
         if max_retries is None:
             max_retries = len(self.providers)
         
         last_error = None
         tried: set = set()  # Track providers tried in this call
+        est_tokens = len(prompt) // 4 + 1  # same ~4 chars/token estimate as utils.estimate_tokens
 
         while len(tried) < len(self.providers):
-            provider = self._get_next_provider(exclude=tried)
+            provider = self._get_next_provider(exclude=tried, est_tokens=est_tokens)
             if provider is None:
                 break
 
             tried.add(provider.name)
             
+            if provider.wait_time(est_tokens) > self.max_wait_s or not await provider.acquire(est_tokens, self.max_wait_s):
+                last_error = f"{provider.name} saturated (rate limit or concurrency)"
+                continue
             try:
                 print(f"🤖 Trying {provider.name}...")
                 response = await provider.generate(prompt)
@@ -392,23 +661,82 @@ class AIPool:
             except Exception as e:
                 last_error = str(e)
                 print(f"⚠️  {provider.name} failed: {last_error}")
+                if self._is_rate_limit_error(e):
+                    provider.mark_rate_limited()
                 # Always continue to next provider regardless of error type
                 continue
+            finally:
+                provider.release()
         
         # All providers failed
         self._save_stats()
         raise Exception(f"All AI providers failed. Last error: {last_error}")
     
+    async def generate_stream(self, prompt: str, priority: Priority = Priority.INTERACTIVE,
+                              deadline_s: float = None) -> AsyncIterator[str]:
+        """
+        Stream a response chunk by chunk (holding one scheduler slot for the whole stream).
+        Falls back to the next provider only if the stream fails before its first chunk;
+        once text has been sent to the client a failure is propagated.
+        """
+        async with self.scheduler.slot(priority, deadline_s):
+            async for chunk in self._generate_stream(prompt):
+                yield chunk
+
+    async def _generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        last_error = None
+        tried: set = set()
+        est_tokens = len(prompt) // 4 + 1  # same ~4 chars/token estimate as utils.estimate_tokens
+
+        while len(tried) < len(self.providers):
+            provider = self._get_next_provider(exclude=tried, est_tokens=est_tokens)
+            if provider is None:
+                break
+
+            tried.add(provider.name)
+            started = False
+
+            if provider.wait_time(est_tokens) > self.max_wait_s or not await provider.acquire(est_tokens, self.max_wait_s):
+                last_error = f"{provider.name} saturated (rate limit or concurrency)"
+                continue
+            try:
+                print(f"🤖 Streaming from {provider.name}...")
+                async for chunk in provider.generate_stream(prompt):
+                    if chunk:
+                        started = True
+                        yield chunk
+                if not started:
+                    raise Exception("Empty stream")
+                self._save_stats()
+                return
+
+            except Exception as e:
+                if started:
+                    self._save_stats()
+                    raise
+                last_error = str(e)
+                print(f"⚠️  {provider.name} stream failed before first token: {last_error}")
+                if self._is_rate_limit_error(e):
+                    provider.mark_rate_limited()
+                continue
+            finally:
+                provider.release()
+
+        self._save_stats()
+        raise Exception(f"All AI providers failed. Last error: {last_error}")
+
     def get_stats(self) -> Dict[str, Any]:
         """Get performance statistics for all providers"""
         return {
             "providers": [
                 {
                     "name": p.name,
-                    "stats": p.stats
+                    "stats": p.stats,
+                    "capacity": p.capacity_info()
                 }
                 for p in self.providers
             ],
             "strategy": self.strategy.value,
-            "total_providers": len(self.providers)
+            "total_providers": len(self.providers),
+            "scheduler": self.scheduler.get_stats()
         }
@@ -0,0 +1,78 @@
+"""
+Benchmark: legacy per-row rule_based_normalization vs the compiled, vectorized matcher.
+Verifies both produce identical categoria/marca labels and prints the per-inventory cost.
+
+Usage: python benchmark_normalization.py [repeticiones]
+Descriptions come from storage/processed_inventory.json, or inventory_text.txt if missing.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import pandas as pd
+from processor import (
+    rule_based_normalization, rule_based_normalization_vectorized,
+    CATEGORY_RULES, BRAND_KEYWORDS, PROCESSED_DATA_FILE, BASE_DIR
+)
+
+
+def legacy_rule_based_normalization(desc):
+    """Original implementation (one any() scan per category + brand loop), kept as reference."""
+    desc_upper = desc.upper()
+    res = {"categoria": "N/A", "marca": "N/A", "modelo_limpio": desc, "especificaciones": ""}
+    for label, keys in CATEGORY_RULES:
+        if any(k in desc_upper for k in keys):
+            res["categoria"] = label
+            break
+    for k, v in BRAND_KEYWORDS.items():
+        if f" {k}" in f" {desc_upper}" or f"{k} " in f"{desc_upper} " or desc_upper.endswith(k):
+            res["marca"] = v
+            break
+    return res
+
+
+def load_descriptions():
+    if os.path.exists(PROCESSED_DATA_FILE):
+        with open(PROCESSED_DATA_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        records = data.get("records", data) if isinstance(data, dict) else data
+        return [str(r["Subproducto"]) for r in records if r.get("Subproducto")]
+
+    with open(os.path.join(BASE_DIR, "inventory_text.txt"), "r", encoding="utf-16") as f:
+        text = f.read()
+    return [m.group(1).strip() for m in re.finditer(r"\d{7,8}\s*(.+?)\s+\d+\s+\d+", text)]
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    base = load_descriptions()
+    descriptions = pd.Series(base * repeat)
+    print(f"Descripciones: {len(base)} únicas x {repeat} = {len(descriptions)} filas")
+
+    start = time.perf_counter()
+    legacy = descriptions.apply(legacy_rule_based_normalization)
+    legacy_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    per_row = descriptions.apply(rule_based_normalization)
+    per_row_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    vectorized = rule_based_normalization_vectorized(descriptions)
+    vectorized_ms = (time.perf_counter() - start) * 1000
+
+    for field in ["categoria", "marca"]:
+        expected = legacy.map(lambda r: r[field])
+        assert (per_row.map(lambda r: r[field]) == expected).all(), f"{field}: per-row mismatch"
+        assert (vectorized[field] == expected).all(), f"{field}: vectorized mismatch"
+    print("✓ Etiquetas idénticas (categoria y marca)")
+
+    rows = len(descriptions)
+    for name, ms in [("legacy (apply)", legacy_ms), ("compiled (apply)", per_row_ms), ("compiled (vectorized)", vectorized_ms)]:
+        print(f"{name:24s} {ms:9.1f} ms total | {ms * 1000 / rows:7.2f} µs/fila")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import os
 import json
+import hashlib
 from dotenv import load_dotenv
 from ai_pool import AIPool, RotationStrategy
 
@@ -51,6 +52,12 @@ SYNONYMS = {
     "ryzen": "rzn", "intel": "ic", "core": "ic", "ram": "g", "gb": "g"
 }
 
+# Official categories the intent classifier (local rules and LLM prompt) may return
+OFFICIAL_CATEGORIES = [
+    "TELEVISOR", "AUDIFONOS", "CONSOLA", "TABLET", "ASPIRADORA", "PATINETA", "BARRA SONIDO", "PORTATIL",
+    "TORRE SONIDO", "SMARTWATCH", "PARLANTE", "COMBO", "CAMARA", "COMPUTADOR", "CELULAR"
+]
+
 NOISE_WORDS = {"ngr", "grs", "slv", "negro", "gris", "silver", "pulg", "pulgadas", "inches", "smart"}
 
 CLEO_PROMPT = """
@@ -67,3 +74,7 @@ REGLAS CRÍTICAS DE VERACIDAD:
 2. TABLA: (Referencia | Ficha | Imagen | Marca | Modelo | Precio | Unidades | Caracteristicas | Tip). La columna "Referencia" DEBE contener el código de "Material" exacto. La columna "Ficha" debe decir "SI" o "NO" según el campo FICHA del inventario. La columna "Imagen" debe decir "VER" si el campo IMG del inventario es SI, de lo contrario déjala vacía o con "-". La columna "Modelo" DEBE ser el nombre DESCRIPTIVO COMPLETO (Subproducto) tal como aparece en el contexto, NO lo resumas (Ej: "TV UN50U8200 50+BRRA..."). La columna "Tip" debe contener el texto del campo TIP proporcionado en el contexto.
 3. FUENTES DE DATOS: Usa ÚNICAMENTE la información proporcionada. Prohibido usar Google o conocimiento externo.
 """
+
+# Bump CHAT_TEMPLATE_REVISION when the /chat prompt wrapper changes; cached answers are keyed on it
+CHAT_TEMPLATE_REVISION = "1"
+PROMPT_VERSION = hashlib.sha1(f"{CHAT_TEMPLATE_REVISION}:{CLEO_PROMPT}".encode("utf-8")).hexdigest()[:12]
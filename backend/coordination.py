@@ -0,0 +1,209 @@
+"""
+Local coordination between gunicorn workers on the same machine.
+- File locks (fcntl.flock, O_EXCL lock files where fcntl is missing) for read-modify-write
+  sections and for electing a single worker to ingest an upload or run the startup sync.
+- A version file bumped on every data change; each worker watches it (a local stat every
+  COORD_POLL_INTERVAL seconds, no Supabase calls) and runs its registered cache invalidators.
+"""
+
+import os
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from config import STORAGE_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines
+    fcntl = None
+
+COORD_DIR = os.path.join(STORAGE_DIR, "coordination")
+VERSION_FILE = os.path.join(COORD_DIR, "version.json")
+POLL_INTERVAL = float(os.getenv("COORD_POLL_INTERVAL", "0.5"))
+STALE_LOCK_SECONDS = 600  # O_EXCL fallback only: a lock file older than this is from a dead worker
+
+_invalidators = []  # (callback(reason), reasons or None for all)
+_seen_version = None
+_version_stat = None
+_watcher_task = None
+
+
+def _lock_path(name: str) -> str:
+    os.makedirs(COORD_DIR, exist_ok=True)
+    return os.path.join(COORD_DIR, f"{name}.lock")
+
+
+def _try_lock(name: str):
+    """Non-blocking lock attempt. Returns a handle to pass to _unlock, or None if held elsewhere."""
+    path = _lock_path(name)
+    if fcntl is not None:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        return fd
+
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(path) > STALE_LOCK_SECONDS:
+                os.remove(path)
+        except OSError:
+            pass
+        return None
+    os.write(fd, str(os.getpid()).encode())
+    return (fd, path)
+
+
+def _unlock(handle):
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        os.close(handle)
+    else:
+        fd, path = handle
+        os.close(fd)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@asynccontextmanager
+async def locked(name: str, poll: float = 0.1):
+    """Cross-worker mutex for a short critical section (waits without blocking the event loop)."""
+    handle = _try_lock(name)
+    while handle is None:
+        await asyncio.sleep(poll)
+        handle = _try_lock(name)
+    try:
+        yield
+    finally:
+        _unlock(handle)
+
+
+@asynccontextmanager
+async def elect(name: str, wait: bool = True, poll: float = 0.2):
+    """
+    Leader election for one-off work (ingesting an upload, startup sync).
+    Yields True in the worker that won the lock. The others yield False, after the leader
+    finished when wait=True (so they can pick up its result) or immediately when wait=False.
+    """
+    handle = _try_lock(name)
+    if handle is not None:
+        try:
+            yield True
+        finally:
+            _unlock(handle)
+        return
+
+    if wait:
+        print(f"⏳ Otro worker está ejecutando '{name}'. Esperando su resultado...")
+        handle = _try_lock(name)
+        while handle is None:
+            await asyncio.sleep(poll)
+            handle = _try_lock(name)
+        _unlock(handle)
+    yield False
+
+
+def ingest_key(file_path: str) -> str:
+    """Election name for processing a given upload (same file + mtime => same ingestion)."""
+    name = "".join(c if c.isalnum() else "_" for c in os.path.basename(file_path))
+    try:
+        return f"ingest-{name}-{int(os.path.getmtime(file_path))}"
+    except OSError:
+        return f"ingest-{name}"
+
+
+def register_invalidator(callback, reasons: list = None):
+    """callback(reason) runs in every worker when a bump with one of `reasons` (None = any) is seen."""
+    _invalidators.append((callback, set(reasons) if reasons else None))
+
+
+def _run_invalidators(reason: str):
+    for callback, reasons in _invalidators:
+        if reasons is None or reason in reasons or reason == "all":
+            try:
+                callback(reason)
+            except Exception as e:
+                print(f"Error invalidando caché ({reason}): {e}")
+
+
+def _read_version() -> dict:
+    try:
+        with open(VERSION_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {"version": 0, "reason": "all"}
+
+
+def current_version() -> int:
+    return _read_version().get("version", 0)
+
+
+def bump_version(reason: str) -> int:
+    """Announces a data change (inventory, specs, knowledge, quotas) to every worker, this one included."""
+    global _seen_version
+    handle = _try_lock("version")
+    while handle is None:  # Held only for a read + atomic write
+        time.sleep(0.01)
+        handle = _try_lock("version")
+    try:
+        version = _read_version().get("version", 0) + 1
+        tmp_file = f"{VERSION_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"version": version, "reason": reason, "pid": os.getpid(), "at": time.time()}, f)
+        os.replace(tmp_file, VERSION_FILE)
+    finally:
+        _unlock(handle)
+    _seen_version = version
+    _run_invalidators(reason)
+    return version
+
+
+def check_for_updates():
+    """Runs invalidators if another worker bumped the version since the last check."""
+    global _seen_version, _version_stat
+    try:
+        st = os.stat(VERSION_FILE)
+    except FileNotFoundError:
+        if _seen_version is None:
+            _seen_version = 0  # No bump yet: the first one must be applied
+        return
+    stamp = (st.st_mtime_ns, st.st_ino, st.st_size)
+    if stamp == _version_stat:
+        return
+    _version_stat = stamp
+    data = _read_version()
+    version = data.get("version", 0)
+    if _seen_version is None:
+        _seen_version = version  # First look at startup: nothing cached yet
+        return
+    if version != _seen_version:
+        skipped = version - _seen_version > 1
+        _seen_version = version
+        # Several bumps between two checks: we only know the last reason, so clear everything
+        _run_invalidators("all" if skipped else data.get("reason", "all"))
+
+
+async def _watch():
+    while True:
+        try:
+            check_for_updates()
+        except Exception as e:
+            print(f"Error en watcher de coordinación: {e}")
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+def start_watcher():
+    """Starts the per-worker version watcher (call once from the startup event)."""
+    global _watcher_task
+    if _watcher_task is None or _watcher_task.done():
+        check_for_updates()
+        _watcher_task = asyncio.create_task(_watch())
@@ -25,19 +25,51 @@ class EmbeddingsService:
         self.cache = self._load_cache()
 
     def _load_cache(self) -> Dict[str, List[float]]:
+        """
+        Image embeddings as rows of the shared mmap'd matrix (one copy for all workers).
+        The JSON file stays the source of truth; it is only parsed when the snapshot is older.
+        """
+        mapped = self._load_shared()
+        if mapped is not None:
+            return mapped
         if os.path.exists(EMBEDDINGS_CACHE_FILE):
             try:
                 with open(EMBEDDINGS_CACHE_FILE, "r", encoding="utf-8") as f:
-                    return json.load(f)
+                    cache = json.load(f)
+                self._publish_shared(cache)
+                return self._load_shared() or cache
             except Exception as e:
                 print(f"Error loading embeddings cache: {e}")
         return {}
 
+    def _load_shared(self) -> Optional[Dict[str, np.ndarray]]:
+        try:
+            import shared_snapshot
+            obj, meta = shared_snapshot.load_embeddings()
+            if obj is None or not os.path.exists(EMBEDDINGS_CACHE_FILE):
+                return None
+            if meta.get("source_mtime", 0) < os.path.getmtime(EMBEDDINGS_CACHE_FILE):
+                return None
+            keys, matrix = obj
+            return dict(zip(keys, matrix))  # Row views, no copy
+        except Exception as e:
+            print(f"Snapshot de embeddings no disponible: {e}")
+            return None
+
+    def _publish_shared(self, cache: Dict[str, List[float]]):
+        try:
+            import shared_snapshot
+            shared_snapshot.publish(embeddings=cache,
+                                    embeddings_info={"source_mtime": os.path.getmtime(EMBEDDINGS_CACHE_FILE)})
+        except Exception as e:
+            print(f"No se pudo publicar el snapshot de embeddings: {e}")
+
     def _save_cache(self):
         if not os.path.exists(STORAGE_DIR):
             os.makedirs(STORAGE_DIR)
         with open(EMBEDDINGS_CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(self.cache, f, indent=2)
+            json.dump({k: np.asarray(v).tolist() for k, v in self.cache.items()}, f, indent=2)
+        self._publish_shared(self.cache)
 
     def get_embedding(self, text: str) -> List[float]:
         """Fetch embedding from Gemini API."""
@@ -69,11 +101,11 @@ class EmbeddingsService:
 
     def cosine_similarity(self, v1: List[float], v2: List[float]) -> float:
         """Calculate cosine similarity between two vectors."""
-        if not v1 or not v2:
+        if v1 is None or v2 is None or len(v1) == 0 or len(v2) == 0:
             return 0.0
         
-        a = np.array(v1)
-        b = np.array(v2)
+        a = np.asarray(v1, dtype=np.float32)
+        b = np.asarray(v2, dtype=np.float32)
         
         dot_product = np.dot(a, b)
         norm_a = np.linalg.norm(a)
@@ -99,7 +131,7 @@ class EmbeddingsService:
         
         for filename in available_filenames:
             img_vec = self.get_image_embedding(filename)
-            if not img_vec:
+            if img_vec is None or len(img_vec) == 0:
                 continue
                 
             score = self.cosine_similarity(product_vec, img_vec)
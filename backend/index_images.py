@@ -26,7 +26,7 @@ async def index_all_images():
         try:
             # This handles caching internally
             embedding = embeddings_service.get_image_embedding(filename)
-            if embedding:
+            if embedding is not None and len(embedding) > 0:
                 print("✓")
                 indexed_count += 1
             else:
@@ -0,0 +1,179 @@
+"""
+Ingestion worker: a separate process that consumes storage/jobs.db (see job_queue.py).
+render_start.sh starts it next to gunicorn, so PDF and Excel parsing never run inside a web
+worker that is serving chat. Web workers only enqueue: a job submitted while the worker is down
+(startup, restart gap) waits in the queue until it is back. INGEST_INLINE_FALLBACK=1 (local dev
+without the worker) makes the web app run the job in-process instead.
+
+Usage: python ingest_worker.py
+"""
+
+import os
+import time
+import socket
+import asyncio
+import threading
+from contextlib import contextmanager
+import shutil
+import job_queue
+import coordination
+from config import STORAGE_DIR
+
+UPLOADS_DIR = os.path.join(STORAGE_DIR, "uploads")
+POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "1"))
+HEARTBEAT_SECONDS = 5
+RETRY_DELAY_SECONDS = 5
+INLINE_FALLBACK = os.getenv("INGEST_INLINE_FALLBACK", "0") == "1"
+
+
+async def run_inventory_job(job: dict, progress) -> dict:
+    """Parses an uploaded PDF (staged in storage/uploads), publishes it and archives the PDF."""
+    from processor import process_inventory_pdf, rotate_inventories, load_inventory_snapshot
+    from supabase_db import upload_inventory_pdf_to_supabase
+
+    staged_path, filename = job["payload"]["file_path"], job["payload"]["filename"]
+    final_path = os.path.join(STORAGE_DIR, filename)
+    if not os.path.exists(staged_path) and os.path.exists(final_path):
+        staged_path = final_path  # Retry after the PDF was already archived
+
+    async with coordination.elect(coordination.ingest_key(staged_path)) as leader:
+        if not leader:
+            return {"message": "Procesado por otro worker."}
+        if staged_path == final_path:
+            # Archived PDF queued by a web worker: skip it if a later snapshot already covers it
+            _, snap_version, _ = load_inventory_snapshot()
+            if snap_version is not None and snap_version >= os.path.getmtime(final_path):
+                return {"message": "Inventario ya procesado."}
+        df = await process_inventory_pdf(staged_path, progress=progress)
+        if df is None:
+            raise Exception("No se extrajeron productos del PDF.")
+
+    # The PDF joins the archive only once its snapshot exists, so web workers never see
+    # a newer unprocessed PDF and start parsing it themselves
+    if staged_path != final_path:
+        shutil.move(staged_path, final_path)
+    rotate_inventories()
+    progress({"stage": "uploading", "items": len(df)})
+    await upload_inventory_pdf_to_supabase(final_path, filename)
+    print(f"✓ Inventario {filename} procesado y sincronizado.")
+    return {"items": len(df)}
+
+
+async def run_quotas_job(job: dict, progress) -> dict:
+    """Parses an uploaded quota workbook off the event loop and swaps the mapping in when done."""
+    from process_quotas import process_quotas, QUOTAS_EXCEL
+    from supabase_db import save_quotas_to_db, upload_spec_to_supabase
+
+    staged_path = job["payload"]["file_path"]
+    if not os.path.exists(staged_path):
+        staged_path = QUOTAS_EXCEL  # Retry after the workbook was already promoted
+
+    progress({"stage": "parsing"})
+    async with coordination.locked("quotas"):
+        mapping = await asyncio.to_thread(process_quotas, staged_path)
+        # Only a workbook that parsed replaces the current cuotas.xlsx
+        if staged_path != QUOTAS_EXCEL:
+            os.replace(staged_path, QUOTAS_EXCEL)
+    coordination.bump_version("quotas")
+
+    progress({"stage": "uploading", "items": len(mapping)})
+    await save_quotas_to_db(mapping)
+    await upload_spec_to_supabase(QUOTAS_EXCEL, "cuotas.xlsx")
+    return {"count": len(mapping), "message": f"Cuotas procesadas exitosamente. {len(mapping)} equipos mapeados."}
+
+
+HANDLERS = {
+    "inventory": run_inventory_job,
+    "quotas": run_quotas_job,
+}
+
+
+@contextmanager
+def _beating(beat, label: str):
+    """Calls beat() every HEARTBEAT_SECONDS from a thread, so a busy event loop cannot starve it."""
+    stop = threading.Event()
+    def loop():
+        while not stop.is_set():
+            try:
+                beat()
+            except Exception as e:
+                print(f"Error en heartbeat ({label}): {e}")
+            stop.wait(HEARTBEAT_SECONDS)
+    thread = threading.Thread(target=loop, name=f"heartbeat-{label}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+
+
+async def run_job(job: dict):
+    """Runs one claimed job and records success or failure (failed jobs are requeued while attempts remain)."""
+    handler = HANDLERS.get(job["kind"])
+    print(f"⚙️ Job {job['id']} ({job['kind']}) intento {job['attempts']}/{job['max_attempts']}")
+    started = time.time()
+    try:
+        if handler is None:
+            raise Exception(f"Tipo de job desconocido: {job['kind']}")
+        # Keeps the job claimed through long stages without progress (AI normalization, uploads)
+        with _beating(lambda: job_queue.heartbeat(job["id"]), job["id"]):
+            result = await handler(job, lambda info: job_queue.update_progress(job["id"], info))
+        job_queue.complete(job["id"], result)
+        print(f"✓ Job {job['id']} terminado en {time.time() - started:.1f}s")
+        return True
+    except Exception as e:
+        print(f"✗ Job {job['id']} falló: {e}")
+        job_queue.fail(job["id"], str(e))
+        return False
+
+
+async def run_job_inline(job_id: str):
+    """In-process fallback used by the web app when no ingest worker is alive (INGEST_INLINE_FALLBACK=1 only)."""
+    worker = f"web-{os.getpid()}"
+    while True:
+        job = job_queue.claim(job_id, worker)
+        if job is None:
+            return
+        if await run_job(job):
+            return
+        await asyncio.sleep(RETRY_DELAY_SECONDS * job["attempts"])
+
+
+def submit(kind: str, payload: dict) -> str:
+    """Queues a job for the ingest worker process (run here only with INGEST_INLINE_FALLBACK=1 and no worker alive)."""
+    job_id = job_queue.enqueue(kind, payload)
+    if not is_available(kind):
+        if INLINE_FALLBACK:
+            print(f"⚠ Ingest worker no disponible. Procesando job {kind} en este proceso.")
+            asyncio.create_task(run_job_inline(job_id))
+        else:
+            print(f"⚠ Ingest worker no disponible. Job {kind} ({job_id}) en cola hasta que vuelva.")
+    return job_id
+
+
+def is_available(kind: str) -> bool:
+    try:
+        return job_queue.worker_alive(kind)
+    except Exception as e:
+        print(f"Error consultando workers: {e}")
+        return False
+
+
+async def main():
+    name = f"ingest-{socket.gethostname()}-{os.getpid()}"
+    kinds = list(HANDLERS)
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    print(f"🛠 Ingest worker {name} escuchando jobs: {kinds}")
+    # From a thread: the worker stays "alive" for the web app even while a job holds the loop
+    with _beating(lambda: job_queue.worker_heartbeat(name, kinds), "worker"):
+        while True:
+            job = job_queue.claim_next(name, kinds)
+            if job is None:
+                await asyncio.sleep(POLL_SECONDS)
+                continue
+            if not await run_job(job):
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
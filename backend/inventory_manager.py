@@ -0,0 +1,217 @@
+"""
+Single owner of the inventory the app serves.
+Compares the Supabase version with the local one, downloads the table, persists
+processed_inventory.json, publishes the shared mmap snapshot and holds this worker's
+DataFrame. Startup (main._warm_up) and the request path (processor.get_latest_inventory)
+both go through here, and refreshes are single-flight: concurrent callers share one refresh,
+and across workers one elected worker downloads while the others map its snapshot.
+"""
+
+import os
+import glob
+import json
+import time
+import asyncio
+import pandas as pd
+from datetime import datetime
+import shared_snapshot
+import coordination
+from config import STORAGE_DIR
+from processor import (
+    PROCESSED_DATA_FILE, publish_inventory_snapshot, load_inventory_snapshot
+)
+
+CLOUD_CHECK_INTERVAL_S = float(os.getenv("INVENTORY_CLOUD_CHECK_INTERVAL_S", "30"))
+CLOUD_NEWER_BUFFER_S = 5  # Cloud must be at least this much newer than local to download
+
+
+class InventorySnapshotManager:
+    def __init__(self):
+        self._df = None
+        self._version = 0           # last_update timestamp of the loaded inventory
+        self._snapshot = None       # Shared snapshot the DataFrame is mapped from
+        self._last_cloud_check = 0
+        self._ingest_requested = None  # Archived PDF handed to the ingest worker (served stale until published)
+        self._lock = asyncio.Lock()
+        coordination.register_invalidator(self._invalidate, ["inventory"])
+
+    @property
+    def version(self):
+        return self._version
+
+    def _invalidate(self, reason):
+        """Another worker (or this one) published a new inventory: the next get() maps it."""
+        self._df = None
+        self._snapshot = None
+
+    def _set(self, df, version, snapshot):
+        self._df, self._version, self._snapshot = df, version, snapshot
+        return df
+
+    @staticmethod
+    def _latest_pdf():
+        local_pdfs = glob.glob(os.path.join(STORAGE_DIR, "*.pdf"))
+        return max(local_pdfs, key=os.path.getmtime) if local_pdfs else None
+
+    def _is_fresh(self, latest_pdf) -> bool:
+        if self._df is None or self._snapshot != shared_snapshot.current_name():
+            return False
+        if latest_pdf and latest_pdf == self._ingest_requested:
+            return True  # Stale on purpose: the ingest worker's snapshot will invalidate it
+        return not latest_pdf or self._version >= os.path.getmtime(latest_pdf)
+
+    def _request_ingest(self, latest_pdf):
+        """Queues the PDF for the ingest worker (once): web workers never parse in-process."""
+        if latest_pdf == self._ingest_requested:
+            return
+        import job_queue
+        import ingest_worker
+        payload = {"file_path": latest_pdf, "filename": os.path.basename(latest_pdf)}
+        try:
+            job_id = job_queue.find_active("inventory", payload) or ingest_worker.submit("inventory", payload)
+            self._ingest_requested = latest_pdf
+            print(f"⏳ PDF {payload['filename']} enviado al ingest worker (job {job_id}).")
+        except Exception as e:
+            print(f"Error encolando ingest de {latest_pdf}: {e}")
+
+    def _map_snapshot(self) -> bool:
+        snap_df, snap_version, snap_name = load_inventory_snapshot()
+        if snap_df is None:
+            return False
+        self._set(snap_df, snap_version, snap_name)
+        return True
+
+    def _local_version(self):
+        """Version of the local inventory: memory, then snapshot meta, then the JSON file. None if absent."""
+        if self._df is not None:
+            return self._version
+        _, snap_version, _ = load_inventory_snapshot()
+        if snap_version is not None:
+            return snap_version
+        if not os.path.exists(PROCESSED_DATA_FILE):
+            return None
+        try:
+            with open(PROCESSED_DATA_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict) and "last_update" in data:
+                return datetime.fromisoformat(data["last_update"]).timestamp()
+        except Exception:
+            return 0  # Unreadable: any cloud version wins
+        return os.path.getmtime(PROCESSED_DATA_FILE)
+
+    async def sync_from_cloud(self) -> str:
+        """
+        Downloads the Supabase inventory if it is newer than the local one (or there is none).
+        Returns "ok" (new inventory loaded), "skipped" (local is current) or "empty" (nothing in the cloud).
+        """
+        from supabase_db import get_metadata_db, get_inventory_from_db, download_latest_inventory_pdf_from_supabase
+        self._last_cloud_check = time.time()
+        metadata = await get_metadata_db()
+        cloud_version = None
+        if metadata and metadata.get("last_update"):
+            cloud_version = datetime.fromisoformat(metadata["last_update"]).timestamp()
+
+        local_version = self._local_version()
+        if local_version is not None and (cloud_version is None or cloud_version <= local_version + CLOUD_NEWER_BUFFER_S):
+            return "skipped"
+
+        # One worker downloads; the others wait and map what it published
+        async with coordination.elect("inventory-cloud-sync") as leader:
+            local_version = self._local_version()
+            if not leader or (local_version is not None and cloud_version is not None
+                              and cloud_version <= local_version + CLOUD_NEWER_BUFFER_S):
+                return "ok" if self._map_snapshot() else "skipped"
+
+            print("☁ Sincronizando inventario desde Supabase DB...")
+            df = await get_inventory_from_db()
+            if df is None or df.empty:
+                if local_version is None and not self._latest_pdf():
+                    print("No DB inventory found. Attempting PDF download...")
+                    path = await download_latest_inventory_pdf_from_supabase(STORAGE_DIR)
+                    return "ok" if path else "empty"
+                return "empty"
+
+            inventory_payload = {
+                "last_update": metadata["last_update"],
+                "records": df.to_dict('records')
+            }
+            tmp_file = f"{PROCESSED_DATA_FILE}.{os.getpid()}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(inventory_payload, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_file, PROCESSED_DATA_FILE)
+            publish_inventory_snapshot(df, cloud_version)
+            coordination.bump_version("inventory")
+            if not self._map_snapshot():
+                self._set(df, cloud_version, shared_snapshot.current_name())
+            print(f"✓ Inventario restaurado desde Supabase: {len(df)} productos.")
+            return "ok"
+
+    async def warm_up(self):
+        """Boot-time load, right after the startup cloud sync: no second cloud check."""
+        self._last_cloud_check = time.time()
+        return await self.get()
+
+    async def get(self):
+        """The current inventory DataFrame (None if there is none)."""
+        latest_pdf = self._latest_pdf()
+        if self._is_fresh(latest_pdf) and time.time() - self._last_cloud_check < CLOUD_CHECK_INTERVAL_S:
+            return self._df
+
+        async with self._lock:  # Single flight: callers that queued here reuse the refresh
+            latest_pdf = self._latest_pdf()
+            if time.time() - self._last_cloud_check >= CLOUD_CHECK_INTERVAL_S:
+                try:
+                    await self.sync_from_cloud()
+                except Exception as e:
+                    print(f"! Error sincronizando con Supabase: {e}")
+            if self._is_fresh(latest_pdf):
+                return self._df
+            return await self._load_local(latest_pdf)
+
+    async def _load_local(self, latest_pdf):
+        pdf_version = os.path.getmtime(latest_pdf) if latest_pdf else None
+        stale = None  # Older inventory to serve while a newer PDF is being ingested
+
+        # 1. SHARED SNAPSHOT (mmap, same pages in every worker)
+        snap_df, snap_version, snap_name = load_inventory_snapshot()
+        if snap_df is not None:
+            if pdf_version is None or snap_version >= pdf_version:
+                print(f"✓ Inventario mapeado desde snapshot compartido ({snap_name}).")
+                return self._set(snap_df, snap_version, snap_name)
+            stale = (snap_df, snap_version, snap_name)
+
+        # 2. LOCAL JSON (Disk Cache) -> published as snapshot for the other workers
+        if os.path.exists(PROCESSED_DATA_FILE) and stale is None:
+            try:
+                with open(PROCESSED_DATA_FILE, "r", encoding="utf-8") as f:
+                    local_data = json.load(f)
+
+                if isinstance(local_data, dict) and "records" in local_data:
+                    local_df = pd.DataFrame(local_data["records"])
+                    json_version = datetime.fromisoformat(local_data.get("last_update", datetime.now().isoformat())).timestamp()
+                else:
+                    local_df = pd.DataFrame(local_data) # Legacy support
+                    json_version = os.path.getmtime(PROCESSED_DATA_FILE)
+
+                print("✓ Cargando inventario local (Caché disco).")
+                publish_inventory_snapshot(local_df, json_version)
+                if not self._map_snapshot():
+                    self._set(local_df, json_version, shared_snapshot.current_name())
+                if pdf_version is None or json_version >= pdf_version:
+                    return self._df
+                stale = (self._df, self._version, self._snapshot)
+            except Exception as e:
+                print(f"Error cargando JSON local: {e}")
+
+        # 3. LOCAL PDF newer than anything processed: the ingest worker parses it (pdfplumber +
+        # LLM normalization would block this web worker); meanwhile serve what we have
+        if latest_pdf:
+            self._request_ingest(latest_pdf)
+            if stale is not None:
+                print(f"⏳ Sirviendo inventario anterior mientras se procesa {os.path.basename(latest_pdf)}.")
+                return self._set(*stale)
+
+        return None
+
+
+inventory_manager = InventorySnapshotManager()
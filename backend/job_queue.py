@@ -0,0 +1,203 @@
+"""
+SQLite-backed job queue shared by the web workers and ingest_worker.py.
+Jobs survive restarts; a job whose worker stopped sending heartbeats is picked up again
+(up to max_attempts). Progress is stored per job so /jobs/{id} can report it.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+from contextlib import contextmanager
+from config import STORAGE_DIR
+
+JOBS_DB = os.path.join(STORAGE_DIR, "jobs.db")
+STALE_JOB_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))     # Running job without heartbeat => worker died
+WORKER_ALIVE_SECONDS = float(os.getenv("JOB_WORKER_ALIVE_SECONDS", "15"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,            -- queued | running | succeeded | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY,
+    pid INTEGER,
+    kinds TEXT,
+    heartbeat_at REAL
+);
+"""
+
+_initialized = False
+
+
+@contextmanager
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(JOBS_DB, timeout=10, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        if not _initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            _initialized = True
+        yield conn
+    finally:
+        conn.close()
+
+
+def _to_dict(row) -> dict:
+    if row is None:
+        return None
+    job = dict(row)
+    for field in ("payload", "progress", "result"):
+        job[field] = json.loads(job[field]) if job.get(field) else None
+    now = time.time()
+    started, finished = job.get("started_at"), job.get("finished_at")
+    job["queued_ms"] = round(((started or now) - job["created_at"]) * 1000)
+    job["duration_ms"] = round(((finished or now) - started) * 1000) if started else None
+    return job
+
+
+def enqueue(kind: str, payload: dict, max_attempts: int = MAX_ATTEMPTS) -> str:
+    job_id = uuid.uuid4().hex[:12]
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, payload, status, max_attempts, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, kind, json.dumps(payload, ensure_ascii=False), max_attempts, time.time())
+        )
+    return job_id
+
+
+def find_active(kind: str, payload: dict) -> str:
+    """Id of a queued or running job with exactly this kind and payload (None if there is none)."""
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE kind = ? AND payload = ? AND status IN ('queued', 'running') LIMIT 1",
+            (kind, json.dumps(payload, ensure_ascii=False))
+        ).fetchone()
+    return row["id"] if row else None
+
+
+def claim_next(worker: str, kinds: list = None) -> dict:
+    """Atomically takes the oldest queued job (or a running one whose worker died). None if idle."""
+    now = time.time()
+    kind_filter, params = "", []
+    if kinds:
+        kind_filter = f" AND kind IN ({','.join('?' for _ in kinds)})"
+        params = list(kinds)
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' OR (status = 'running' AND heartbeat_at < ?))"
+                " AND attempts < max_attempts" + kind_filter + " ORDER BY created_at LIMIT 1",
+                [now - STALE_JOB_SECONDS] + params
+            ).fetchone()
+            if row is None:
+                # Stale jobs that already used every attempt are closed as failed
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, error = COALESCE(error, 'Worker perdido')"
+                    " WHERE status = 'running' AND heartbeat_at < ? AND attempts >= max_attempts",
+                    (now, now - STALE_JOB_SECONDS)
+                )
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, started_at = ?,"
+                " heartbeat_at = ?, finished_at = NULL WHERE id = ?",
+                (worker, now, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return _to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+
+def claim(job_id: str, worker: str) -> dict:
+    """Takes one specific queued job (in-process fallback). None if someone else already has it."""
+    now = time.time()
+    with _connect() as conn:
+        cur = conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, started_at = ?, heartbeat_at = ?,"
+            " finished_at = NULL WHERE id = ? AND status = 'queued'",
+            (worker, now, now, job_id)
+        )
+        if cur.rowcount == 0:
+            return None
+        return _to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def update_progress(job_id: str, progress: dict):
+    """Stores progress and doubles as the job heartbeat."""
+    with _connect() as conn:
+        conn.execute("UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE id = ?",
+                     (json.dumps(progress, ensure_ascii=False), time.time(), job_id))
+
+
+def heartbeat(job_id: str):
+    with _connect() as conn:
+        conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+
+def complete(job_id: str, result: dict = None):
+    with _connect() as conn:
+        conn.execute("UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, finished_at = ? WHERE id = ?",
+                     (json.dumps(result or {}, ensure_ascii=False), time.time(), job_id))
+
+
+def fail(job_id: str, error: str):
+    """Requeues the job while it has attempts left, otherwise marks it failed."""
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE jobs SET error = ?, finished_at = ?,"
+            " status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END WHERE id = ?",
+            (error, time.time(), job_id)
+        )
+
+
+def get_job(job_id: str) -> dict:
+    with _connect() as conn:
+        return _to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def list_jobs(limit: int = 20, kind: str = None) -> list:
+    with _connect() as conn:
+        if kind:
+            rows = conn.execute("SELECT * FROM jobs WHERE kind = ? ORDER BY created_at DESC LIMIT ?", (kind, limit))
+        else:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [_to_dict(r) for r in rows.fetchall()]
+
+
+def worker_heartbeat(name: str, kinds: list):
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO workers (name, pid, kinds, heartbeat_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(name) DO UPDATE SET pid = excluded.pid, kinds = excluded.kinds, heartbeat_at = excluded.heartbeat_at",
+            (name, os.getpid(), json.dumps(kinds), time.time())
+        )
+
+
+def worker_alive(kind: str) -> bool:
+    """True if a separate worker process handling `kind` sent a heartbeat recently."""
+    with _connect() as conn:
+        rows = conn.execute("SELECT kinds FROM workers WHERE heartbeat_at > ?",
+                            (time.time() - WORKER_ALIVE_SECONDS,)).fetchall()
+    return any(kind in json.loads(r["kinds"] or "[]") for r in rows)
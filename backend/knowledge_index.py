@@ -1,65 +1,134 @@
 import os
 import json
 import re
+import asyncio
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import pdfplumber
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SPECS_DIR = os.path.join(BASE_DIR, "specs")
+STORAGE_DIR = os.path.join(BASE_DIR, "storage")
 KNOWLEDGE_FILE = os.path.join(BASE_DIR, "expert_knowledge.json")
+# filename -> {sha1, size, mtime_ns, record}: PDFs whose content did not change are not parsed again
+MANIFEST_FILE = os.path.join(STORAGE_DIR, "specs_manifest.json")
+INDEX_WORKERS = int(os.getenv("KNOWLEDGE_INDEX_WORKERS", "0")) or os.cpu_count() or 1
 
 def extract_from_pdf(file_path):
     """Simple extractor for text-based PDFs"""
-    text = ""
     try:
         with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() + "\n"
-        
+            text = "\n".join(page.extract_text() or "" for page in pdf.pages) + "\n"
+
         # Look for SKU pattern: XXXXXXX#XXX or similar
         sku_match = re.search(r"([A-Z0-9]{7,}(?:#[A-Z0-9]{3})?)", text)
         sku = sku_match.group(1) if sku_match else "Desconocido"
-        
+
         # Very basic heuristics for model and specs
         lines = text.split("\n")
         model = lines[0].strip() if lines else "Modelo Desconocido"
         specs = " ".join(lines[1:5]).strip()
-        
+
         return {"sku": sku, "model": model, "specs": specs}
     except Exception as e:
         print(f"Error reading PDF {file_path}: {e}")
         return None
 
+def _file_hash(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _load_manifest():
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _save_manifest(manifest):
+    os.makedirs(STORAGE_DIR, exist_ok=True)
+    tmp_file = f"{MANIFEST_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_file, MANIFEST_FILE)
+
+def _extract_changed(pdf_files, manifest):
+    """
+    Updates the manifest for the given PDFs: unchanged files (same size/mtime, or same hash)
+    keep their record; the rest (and past failures) are parsed, in a process pool when there
+    is more than one. Returns how many were parsed.
+    """
+    to_parse = {}
+    for filename in pdf_files:
+        file_path = os.path.join(SPECS_DIR, filename)
+        st = os.stat(file_path)
+        cached = manifest.get(filename)
+        if cached and cached.get("record") is None:
+            cached = None  # Extraction failed last time: try again
+        if cached and cached.get("size") == st.st_size and cached.get("mtime_ns") == st.st_mtime_ns:
+            continue
+        sha1 = _file_hash(file_path)
+        if cached and cached.get("sha1") == sha1:
+            cached.update({"size": st.st_size, "mtime_ns": st.st_mtime_ns})
+            continue
+        manifest[filename] = {"sha1": sha1, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "record": None}
+        to_parse[filename] = file_path
+
+    if not to_parse:
+        return 0
+    paths = list(to_parse.values())
+    if len(paths) == 1 or INDEX_WORKERS == 1:
+        records = [extract_from_pdf(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=min(INDEX_WORKERS, len(paths))) as pool:
+            records = list(pool.map(extract_from_pdf, paths))
+    for filename, record in zip(to_parse, records):
+        manifest[filename]["record"] = record
+    return len(paths)
+
+async def _merge_records(records):
+    """Adds the records whose SKU is not in the knowledge store yet; returns (added, total items)."""
+    import coordination
+    import knowledge_store
+    from supabase_db import save_knowledge_items_to_db
+
+    async with coordination.locked("knowledge"):
+        known = {item.get("sku") for item in knowledge_store.entries()}
+        added = []
+        for data in records:
+            if data and data["sku"] not in known:
+                added.append(knowledge_store.upsert(data))
+                known.add(data["sku"])
+        if added:
+            knowledge_store.save()
+    if added:
+        coordination.bump_version("knowledge")
+        await save_knowledge_items_to_db(added)
+    return len(added), len(knowledge_store.entries())
+
 def rebuild_knowledge():
-    """Scans the specs folder and rebuilds the JSON index"""
+    """Scans the specs folder and rebuilds the JSON index (only new or changed PDFs are parsed)"""
     if not os.path.exists(SPECS_DIR):
         return
-        
-    knowledge = []
-    # Load existing to avoid losing manual edits if we add a 'manual' flag
-    if os.path.exists(KNOWLEDGE_FILE):
-        with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
-            knowledge = json.load(f)
-
-    existing_skus = {item.get("sku") for item in knowledge}
-    
-    files = os.listdir(SPECS_DIR)
+
+    files = sorted(os.listdir(SPECS_DIR))
+    pdf_files = [f for f in files if f.lower().endswith(".pdf")]
     for filename in files:
-        file_path = os.path.join(SPECS_DIR, filename)
-        if filename.lower().endswith(".pdf"):
-            # Try extraction
-            data = extract_from_pdf(file_path)
-            if data and data["sku"] not in existing_skus:
-                knowledge.append(data)
-                existing_skus.add(data["sku"])
         # For images, we'll need either OCR or manual assistance
         # For now, we just log them
-        elif filename.lower().endswith((".jpg", ".jpeg", ".png")):
+        if filename.lower().endswith((".jpg", ".jpeg", ".png")):
              print(f"Imagen detectada: {filename}. Pendiente de OCR o revisión manual.")
 
-    with open(KNOWLEDGE_FILE, "w", encoding="utf-8") as f:
-        json.dump(knowledge, f, indent=4)
-    
-    print(f"Memoria Maestra sincronizada. Total items: {len(knowledge)}")
+    manifest = _load_manifest()
+    parsed = _extract_changed(pdf_files, manifest)
+    manifest = {f: manifest[f] for f in pdf_files}  # Forget deleted files
+    _save_manifest(manifest)
+
+    added, total = asyncio.run(_merge_records([manifest[f]["record"] for f in pdf_files]))
+    print(f"Memoria Maestra sincronizada. Total items: {total} (nuevos: {added}, PDFs procesados: {parsed}/{len(pdf_files)}).")
 
 if __name__ == "__main__":
     rebuild_knowledge()
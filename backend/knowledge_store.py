@@ -0,0 +1,125 @@
+"""
+Keyed store over expert_knowledge.json (a list of {sku, model, specs, tip_venta}).
+The list is held in memory as {sku: entry} and re-read only when the file changes, so lookups
+and upserts are dict operations instead of list scans. Writers mutate under
+coordination.locked("knowledge") and then save() once (atomic file swap) and push only the
+entries they changed to Supabase (one row per SKU in expert_knowledge_items).
+"""
+
+import os
+import json
+from config import KNOWLEDGE_FILE
+
+_stamp = None
+_entries = {}   # sku -> entry, in file order
+
+
+def _has_tip(entry) -> bool:
+    tip = entry.get("tip_venta")
+    return bool(tip) and tip != "-"
+
+
+def _load():
+    global _stamp, _entries
+    try:
+        st = os.stat(KNOWLEDGE_FILE)
+    except FileNotFoundError:
+        _stamp, _entries = None, {}
+        return
+    stamp = (st.st_mtime_ns, st.st_ino, st.st_size)
+    if stamp == _stamp:
+        return
+    try:
+        with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"Error leyendo conocimiento experto: {e}")
+        return  # Keep serving the previous copy
+    entries = {}
+    for item in data:
+        entries.setdefault(item.get("sku"), item)  # First entry per SKU wins, like the old scans
+    _entries = entries
+    _stamp = stamp
+
+
+def entries() -> list:
+    _load()
+    return list(_entries.values())
+
+
+def get(sku):
+    _load()
+    return _entries.get(sku)
+
+
+def tips() -> dict:
+    """{sku: tip_venta} for the entries that have a tip."""
+    _load()
+    return {sku: item.get("tip_venta") for sku, item in _entries.items() if item.get("tip_venta")}
+
+
+def skus_with_tip() -> set:
+    _load()
+    return {sku for sku, item in _entries.items() if _has_tip(item)}
+
+
+def upsert(entry: dict) -> dict:
+    """Replaces (or adds) the entry for entry['sku']. Call save() afterwards."""
+    _load()
+    _entries[entry.get("sku")] = entry
+    return entry
+
+
+def merge_tips(tips: dict, products: dict) -> tuple:
+    """
+    Writes {sku: tip} into the store without overwriting existing tips; SKUs not in the store
+    are added with model/specs from products. Set-based: one pass over the requested SKUs.
+    Returns (filled existing entries, created entries).
+    """
+    _load()
+    known = tips.keys() & _entries.keys()
+    filled = [_entries[sku] for sku in known if not _has_tip(_entries[sku])]
+    for entry in filled:
+        entry["tip_venta"] = tips[entry.get("sku")]
+
+    created = []
+    for sku in (sku for sku in tips if sku not in known):  # Appended in request order
+        product = products.get(sku, {})
+        entry = {"sku": sku, "model": product.get("model", ""), "specs": product.get("specs", "-"), "tip_venta": tips[sku]}
+        _entries[sku] = entry
+        created.append(entry)
+    return filled, created
+
+
+def merge_from_cloud(knowledge: list) -> list:
+    """
+    Cloud restore: cloud entries replace the local ones per SKU, local-only entries are kept
+    (the cloud copy may be incomplete, and nothing is ever deleted). Saves the store and
+    returns the local-only entries, for the caller to push back to the cloud.
+    """
+    global _entries
+    _load()
+    entries = {}
+    for item in knowledge:
+        entries.setdefault(item.get("sku"), item)
+    local_only = [item for sku, item in _entries.items() if sku not in entries]
+    for item in local_only:
+        entries[item.get("sku")] = item
+    _entries = entries
+    save()
+    return local_only
+
+
+def save():
+    """Writes the store back to expert_knowledge.json (write + rename: readers never see half a file)."""
+    global _stamp
+    tmp_file = f"{KNOWLEDGE_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(list(_entries.values()), f, indent=4, ensure_ascii=False)
+        os.replace(tmp_file, KNOWLEDGE_FILE)
+    except Exception:
+        _stamp = None  # Memory may be ahead of the file now: re-read it on the next access
+        raise
+    st = os.stat(KNOWLEDGE_FILE)
+    _stamp = (st.st_mtime_ns, st.st_ino, st.st_size)
@@ -0,0 +1,162 @@
+"""
+Priority scheduler in front of the AI Pool.
+Every LLM call takes a slot; waiting calls are served by priority class
+(interactive > intent > background) and FIFO inside each class. Background work
+is capped to a fraction of the slots so a chat answer never queues behind it.
+"""
+
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Optional, Dict, Any
+
+
+class Priority(IntEnum):
+    """Lower value = served first"""
+    INTERACTIVE = 0  # /chat answers and anything a salesperson is waiting on
+    INTENT = 1       # Intent analysis (runs before the interactive answer)
+    BACKGROUND = 2   # Tip jobs, normalization, bulk work
+
+
+class SchedulerQueueFull(Exception):
+    """The queue for this priority is at its limit; the call is rejected instead of piling up."""
+
+
+class SchedulerDeadlineExceeded(Exception):
+    """The call waited longer than its deadline for a slot and was dropped."""
+
+
+def _env_per_priority(name: str, defaults: Dict[Priority, float]) -> Dict[Priority, float]:
+    """Reads {name}_{INTERACTIVE|INTENT|BACKGROUND} overrides."""
+    values = {}
+    for priority, default in defaults.items():
+        values[priority] = float(os.getenv(f"{name}_{priority.name}", default))
+    return values
+
+
+class LLMScheduler:
+    """Slot-based admission control with priority classes, bounded queues and deadlines."""
+
+    def __init__(self, slots: int, background_slots: int = None,
+                 queue_limits: Dict[Priority, float] = None, deadlines: Dict[Priority, float] = None):
+        self.slots = max(1, slots)
+        self.background_slots = max(1, min(background_slots or max(1, self.slots // 4), self.slots))
+        self.queue_limits = queue_limits or _env_per_priority(
+            "LLM_QUEUE_LIMIT", {Priority.INTERACTIVE: 50, Priority.INTENT: 50, Priority.BACKGROUND: 200})
+        # Max seconds waiting for a slot (0 = wait indefinitely)
+        self.deadlines = deadlines or _env_per_priority(
+            "LLM_DEADLINE", {Priority.INTERACTIVE: 30, Priority.INTENT: 10, Priority.BACKGROUND: 0})
+
+        self._queues = {p: deque() for p in Priority}
+        self._active = {p: 0 for p in Priority}
+        self.stats = {p.name.lower(): {"served": 0, "expired": 0, "rejected": 0, "total_wait_ms": 0.0, "max_depth": 0}
+                      for p in Priority}
+
+    def _can_start(self, priority: Priority) -> bool:
+        if sum(self._active.values()) >= self.slots:
+            return False
+        return priority != Priority.BACKGROUND or self._active[Priority.BACKGROUND] < self.background_slots
+
+    def _start(self, priority: Priority, enqueued_at: float):
+        self._active[priority] += 1
+        stats = self.stats[priority.name.lower()]
+        stats["served"] += 1
+        stats["total_wait_ms"] += (time.monotonic() - enqueued_at) * 1000
+
+    def _dispatch(self):
+        """Hands free slots to the highest-priority waiters, dropping those past their deadline."""
+        now = time.monotonic()
+        for priority in Priority:
+            queue = self._queues[priority]
+            while queue and self._can_start(priority):
+                entry = queue.popleft()
+                if entry["future"].done():
+                    continue
+                if entry["deadline"] and entry["deadline"] < now:
+                    self.stats[priority.name.lower()]["expired"] += 1
+                    entry["future"].set_exception(SchedulerDeadlineExceeded(f"{priority.name} call dropped after deadline"))
+                    continue
+                self._start(priority, entry["enqueued_at"])
+                entry["future"].set_result(True)
+
+    def _release(self, priority: Priority):
+        self._active[priority] -= 1
+        self._dispatch()
+
+    async def _acquire(self, priority: Priority, deadline_s: Optional[float]):
+        enqueued_at = time.monotonic()
+        waiting_ahead = any(self._queues[p] for p in Priority if p <= priority)
+        if not waiting_ahead and self._can_start(priority):
+            self._start(priority, enqueued_at)
+            return
+
+        stats = self.stats[priority.name.lower()]
+        queue = self._queues[priority]
+        if len(queue) >= self.queue_limits[priority]:
+            stats["rejected"] += 1
+            raise SchedulerQueueFull(f"{priority.name} queue full ({len(queue)} waiting)")
+
+        if deadline_s is None:
+            deadline_s = self.deadlines[priority]
+        future = asyncio.get_running_loop().create_future()
+        entry = {"future": future, "enqueued_at": enqueued_at,
+                 "deadline": enqueued_at + deadline_s if deadline_s else None}
+        queue.append(entry)
+        stats["max_depth"] = max(stats["max_depth"], len(queue))
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=deadline_s or None)
+        except asyncio.TimeoutError:
+            if future.done() and not future.exception():
+                return  # Granted right as the deadline fired: keep the slot
+            self._forget(priority, entry)
+            stats["expired"] += 1
+            raise SchedulerDeadlineExceeded(f"{priority.name} call waited more than {deadline_s}s for a slot")
+        except asyncio.CancelledError:
+            # Caller went away (e.g. client disconnected): give back the slot or leave the queue
+            if future.done() and not future.cancelled() and not future.exception():
+                self._release(priority)
+            else:
+                self._forget(priority, entry)
+            raise
+
+    def _forget(self, priority: Priority, entry: dict):
+        if not entry["future"].done():
+            entry["future"].cancel()
+        try:
+            self._queues[priority].remove(entry)
+        except ValueError:
+            pass
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.INTERACTIVE, deadline_s: Optional[float] = None):
+        """Holds one scheduler slot for the duration of the block (a whole call or stream)."""
+        await self._acquire(priority, deadline_s)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def get_stats(self) -> Dict[str, Any]:
+        classes = {}
+        for priority in Priority:
+            name = priority.name.lower()
+            stats = self.stats[name]
+            classes[name] = {
+                **stats,
+                "total_wait_ms": round(stats["total_wait_ms"], 1),
+                "avg_wait_ms": round(stats["total_wait_ms"] / stats["served"], 1) if stats["served"] else 0.0,
+                "active": self._active[priority],
+                "queued": len(self._queues[priority]),
+                "queue_limit": int(self.queue_limits[priority]),
+                "deadline_s": self.deadlines[priority]
+            }
+        return {
+            "slots": self.slots,
+            "background_slots": self.background_slots,
+            "active": sum(self._active.values()),
+            "classes": classes
+        }
@@ -1,12 +1,16 @@
 import uvicorn
 from fastapi import FastAPI, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from datetime import datetime
 import asyncio
+import json
+import time
 import os
+import readiness
 
 # Import modular routers
-from routers import inventory, chat, specs, quotas, knowledge
+from routers import inventory, chat, specs, quotas, knowledge, jobs
 
 app = FastAPI(title="Cleo Inventory AI API")
 
@@ -29,96 +33,112 @@ async def health():
     """Diligent health check for Render"""
     return {"status": "ok", "uptime": "active"}
 
+# Readiness: 200 once this worker has its inventory mapped, 503 while it is still warming up
+@app.get("/ready")
+async def ready():
+    state = readiness.get_state()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
 # --- STARTUP SYNC ---
+SYNC_TIMEOUT_S = float(os.getenv("STARTUP_SYNC_TIMEOUT_S", "20"))
+INVENTORY_SYNC_TIMEOUT_S = float(os.getenv("STARTUP_INVENTORY_SYNC_TIMEOUT_S", "90"))
+_warmup_task = None
+
 @app.on_event("startup")
 async def startup_event():
     """
-    On Render startup:
-    1. Restore specs_mapping.json from Supabase
-    2. Restore expert_knowledge.json from Supabase
-    3. Try to restore processed_inventory.json or download PDF
+    On Render startup (every worker), without blocking the server:
+    - Start the cross-worker cache invalidation watcher
+    - Launch the warm-up (cloud sync in one elected worker, then inventory load) in the background
     """
-    print("Starting Cleo AI Cloud Sync...")
-    from config import STORAGE_DIR, SPECS_MAPPING_FILE, KNOWLEDGE_FILE
-    import json
-    from supabase_db import (
-        get_specs_mapping_from_db, 
-        get_knowledge_from_db, 
-        get_inventory_from_db,
-        download_latest_inventory_pdf_from_supabase
-    )
-    
-    # 1. Sync Mappings (Cloud-First Sync)
+    global _warmup_task
+    import coordination
+    coordination.start_watcher()
+    _warmup_task = asyncio.create_task(_warm_up())
+
+async def _warm_up():
+    """Cloud sync (leader only) -> map the inventory (no second cloud check) -> ready -> resume the tip job."""
+    import coordination
+    from inventory_manager import inventory_manager
+
+    readiness.set_phase("syncing")
+    # Only one worker restores files from the cloud; the others wait for it and read what it wrote
+    async with coordination.elect("startup-sync") as leader:
+        if leader:
+            await _cloud_sync()
+
+    readiness.set_phase("warming")
+    started = time.time()
     try:
-        print("Syncing specs_mapping from Cloud...")
-        mapping = await get_specs_mapping_from_db()
-        if mapping:
-            with open(SPECS_MAPPING_FILE, "w", encoding="utf-8") as f:
-                json.dump(mapping, f, indent=4, ensure_ascii=False)
-            print(f"Synced {len(mapping)} image mappings from Supabase.")
-        else:
-            print("Cloud mapping empty. Keeping local if exists.")
+        df = await inventory_manager.warm_up()
+        readiness.record_step("inventory_load", "ok" if df is not None else "empty", started)
     except Exception as e:
-        print(f"Error syncing mapping: {e}")
-    
-    # 2. Sync Knowledge (Cloud-First Sync)
+        print(f"Error cargando inventario inicial: {e}")
+        readiness.record_step("inventory_load", "error", started, str(e))
+    readiness.set_phase("ready")
+
+    # Resume a bulk tip job interrupted by a restart
     try:
-        print("Syncing expert_knowledge from Cloud...")
-        knowledge = await get_knowledge_from_db()
-        if knowledge:
-            with open(KNOWLEDGE_FILE, "w", encoding="utf-8") as f:
-                json.dump(knowledge, f, indent=4, ensure_ascii=False)
-            print(f"Synced {len(knowledge)} expert knowledge items from Supabase.")
-        else:
-            print("Cloud knowledge empty. Keeping local if exists.")
+        from tip_job import resume_pending_tip_job
+        resume_pending_tip_job()
     except Exception as e:
-        print(f"Error syncing knowledge: {e}")
-                
-    # 3. Sync Inventory (Try DB first, it's faster than PDF)
+        print(f"Error resuming tip job: {e}")
+
+async def _run_sync_step(name: str, step, timeout: float):
+    """Runs one sync step with its own timeout; a slow or failing step never blocks the others."""
+    started = time.time()
     try:
-        inv_file = os.path.join(STORAGE_DIR, "processed_inventory.json")
-        from supabase_db import get_metadata_db
-        cloud_meta = await get_metadata_db()
-        should_sync = not os.path.exists(inv_file)
-        
-        if cloud_meta and cloud_meta.get("last_update"):
-            cloud_mtime = datetime.fromisoformat(cloud_meta["last_update"]).timestamp()
-            if os.path.exists(inv_file):
-                try:
-                    with open(inv_file, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                        if isinstance(data, dict) and "last_update" in data:
-                            local_mtime = datetime.fromisoformat(data["last_update"]).timestamp()
-                        else:
-                            local_mtime = os.path.getmtime(inv_file)
-                    
-                    if cloud_mtime > local_mtime + 5: # 5s buffer
-                        print(f"Cloud version ({cloud_meta['last_update']}) is newer than local. Syncing...")
-                        should_sync = True
-                except: 
-                    should_sync = True
-
-        if should_sync:
-            print("Attempting to restore inventory from Supabase DB...")
-            df = await get_inventory_from_db()
-            if df is not None and not df.empty:
-                # Store in new format with metadata
-                inventory_payload = {
-                    "last_update": cloud_meta.get("last_update") if cloud_meta else datetime.now().isoformat(),
-                    "records": df.to_dict('records')
-                }
-                with open(inv_file, "w", encoding="utf-8") as f:
-                    # FIX: ensure_ascii instead of force_ascii
-                    json.dump(inventory_payload, f, ensure_ascii=False, indent=4)
-                print(f"Restored {len(df)} items from DB.")
-            else:
-                # Try PDF as last resort
-                print("No DB inventory found. Attempting PDF download...")
-                await download_latest_inventory_pdf_from_supabase(STORAGE_DIR)
+        status = await asyncio.wait_for(step(), timeout=timeout)
+        readiness.record_step(name, status, started)
+    except asyncio.TimeoutError:
+        print(f"⚠ Sync '{name}' excedió {timeout:.0f}s. Se usa la copia local.")
+        readiness.record_step(name, "timeout", started)
     except Exception as e:
-        print(f"Error syncing inventory: {e}")
-    
-    print("Cleo AI Cloud Sync Process Finished.")
+        print(f"Error syncing {name}: {e}")
+        readiness.record_step(name, "error", started, str(e))
+
+async def _cloud_sync():
+    """
+    Restores specs_mapping.json, expert_knowledge.json and the inventory from Supabase,
+    concurrently and each with its own timeout.
+    """
+    from inventory_manager import inventory_manager
+    print("Starting Cleo AI Cloud Sync...")
+    started = time.time()
+    await asyncio.gather(
+        _run_sync_step("specs_mapping", _sync_specs_mapping, SYNC_TIMEOUT_S),
+        _run_sync_step("knowledge", _sync_knowledge, SYNC_TIMEOUT_S),
+        _run_sync_step("inventory", inventory_manager.sync_from_cloud, INVENTORY_SYNC_TIMEOUT_S)
+    )
+    print(f"Cleo AI Cloud Sync Process Finished ({time.time() - started:.1f}s).")
+
+async def _sync_specs_mapping():
+    from config import SPECS_MAPPING_FILE
+    from supabase_db import get_specs_mapping_from_db
+    mapping = await get_specs_mapping_from_db()
+    if not mapping:
+        print("Cloud mapping empty. Keeping local if exists.")
+        return "empty"
+    with open(SPECS_MAPPING_FILE, "w", encoding="utf-8") as f:
+        json.dump(mapping, f, indent=4, ensure_ascii=False)
+    print(f"Synced {len(mapping)} image mappings from Supabase.")
+    return "ok"
+
+async def _sync_knowledge():
+    import coordination
+    import knowledge_store
+    from supabase_db import get_knowledge_from_db, save_knowledge_items_to_db
+    knowledge = await get_knowledge_from_db()
+    if not knowledge:
+        print("Cloud knowledge empty. Keeping local if exists.")
+        return "empty"
+    async with coordination.locked("knowledge"):
+        local_only = knowledge_store.merge_from_cloud(knowledge)
+    if local_only:
+        print(f"{len(local_only)} expert knowledge items only existed locally. Pushing them to Supabase.")
+        await save_knowledge_items_to_db(local_only)
+    print(f"Synced {len(knowledge)} expert knowledge items from Supabase.")
+    return "ok"
 
 # Register Routers
 app.include_router(inventory.router, tags=["Inventory"])
@@ -126,6 +146,7 @@ app.include_router(chat.router, tags=["Chat"])
 app.include_router(specs.router, tags=["Specs"])
 app.include_router(quotas.router, tags=["Quotas"])
 app.include_router(knowledge.router, tags=["Knowledge"])
+app.include_router(jobs.router, tags=["Jobs"])
 from routers import sales
 app.include_router(sales.router, tags=["Sales"])
 
@@ -1,100 +1,138 @@
 import pandas as pd
+import numpy as np
 import json
 import os
 import gc
+from openpyxl import load_workbook
+import quota_engine
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STORAGE_DIR = os.path.join(BASE_DIR, "storage")
-INVENTORY_FILE = os.path.join(STORAGE_DIR, "processed_inventory.json")
 QUOTAS_EXCEL = os.path.join(STORAGE_DIR, "cuotas.xlsx")
 OUTPUT_MAPPING = os.path.join(STORAGE_DIR, "quota_mapping.json")
+HEADER_SCAN_ROWS = 30  # The 'Material' header must appear within the first rows of a sheet
 
-def process_quotas():
-    try:
-        with open(INVENTORY_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        # Handle new format {last_update, records} or legacy list
-        inventory_items = data.get("records", data) if isinstance(data, dict) else data
-        
-        active_materials = {str(item["Material"]).split('.')[0].strip() for item in inventory_items if "Material" in item}
-        print(f"📦 Inventario cargado: {len(active_materials)} materiales activos.")
+def _detect_quota_columns(header: list) -> dict:
+    """Months -> column index of the '... N Meses' columns (a later column wins, like before)."""
+    column_map = {}
+    for idx, col in enumerate(header):
+        str_col = str(col).strip().lower()
+        if "mes" not in str_col: continue
+        if "36" in str_col: column_map["36"] = idx
+        elif "24" in str_col: column_map["24"] = idx
+        elif "18" in str_col: column_map["18"] = idx
+        elif "12" in str_col: column_map["12"] = idx
+        elif "6" in str_col: column_map["6"] = idx
+    return column_map
 
-        if not os.path.exists(QUOTAS_EXCEL):
-            raise FileNotFoundError(f"No se encontró el archivo de cuotas en {QUOTAS_EXCEL}")
+def _find_column(header: list, name: str):
+    """Index of the first header cell that starts with `name` (case/line-break insensitive)."""
+    for idx, col in enumerate(header):
+        if " ".join(str(col).lower().split()).startswith(name):
+            return idx
+    return None
 
-        # 1. Load the Excel file to inspect sheets
-        xl = pd.ExcelFile(QUOTAS_EXCEL)
-        sheet_names = xl.sheet_names
-        print(f"📄 Hojas encontradas en el Excel: {sheet_names}")
-        
-        df = None
-        target_sheet = None
-        header_row_idx = None
-        
-        # 2. Iterate through sheets to find the one with 'Material'
-        for sheet in sheet_names:
-            temp_df = pd.read_excel(QUOTAS_EXCEL, sheet_name=sheet, header=None).head(30)
-            for i, row in temp_df.iterrows():
-                if "Material" in [str(v).strip() for v in row.values if pd.notna(v)]:
-                    target_sheet = sheet
-                    header_row_idx = i
-                    print(f"🎯 Hoja detectada: '{target_sheet}' (Encabezados en fila {header_row_idx})")
+def _read_quota_sheet(path: str):
+    """
+    Single streaming pass (openpyxl read-only): finds the sheet and row holding 'Material' and
+    keeps reading the same rows iterator for the data, collecting only the needed columns.
+    Returns (sheet name, header row index, header, {column index: values}).
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        print(f"📄 Hojas encontradas en el Excel: {wb.sheetnames}")
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            for i, row in enumerate(rows):
+                if i >= HEADER_SCAN_ROWS:
                     break
-            if target_sheet: break
-            
-        if not target_sheet:
-            raise ValueError("No se encontró ninguna hoja con la columna 'Material'.")
+                header = [str(v).strip() if v is not None else "" for v in row]
+                if "Material" not in header:
+                    continue
+                print(f"🎯 Hoja detectada: '{ws.title}' (Encabezados en fila {i})")
+                wanted = [header.index("Material")] + list(_detect_quota_columns(header).values())
+                wanted += [idx for idx in (_find_column(header, "saldo"), _find_column(header, "categoria"),
+                                           _find_column(header, "pago contado"))
+                           if idx is not None and idx not in wanted]
+                columns = {idx: [] for idx in wanted}
+                for data_row in rows:
+                    for idx in columns:
+                        columns[idx].append(data_row[idx] if idx < len(data_row) else None)
+                return ws.title, i, header, columns
+    finally:
+        wb.close()
+    raise ValueError("No se encontró ninguna hoja con la columna 'Material'.")
 
-        # 3. Load full target sheet
-        df = pd.read_excel(QUOTAS_EXCEL, sheet_name=target_sheet, header=header_row_idx)
-        
-        # Cleanup column names
-        df.columns = [str(c).strip() for c in df.columns]
-        
-        # Find critical columns
-        column_map = {}
-        for col in df.columns:
-            str_col = str(col).lower()
-            if "mes" not in str_col: continue
-            if "36" in str_col: column_map["36"] = col
-            elif "24" in str_col: column_map["24"] = col
-            elif "18" in str_col: column_map["18"] = col
-            elif "12" in str_col: column_map["12"] = col
-            elif "6" in str_col and "36" not in str_col: column_map["6"] = col
+def _to_amounts(values: list) -> pd.Series:
+    """'$1,234.5' / 1234.5 / 'No Aplica' -> 1234.5 / 1234.5 / NaN"""
+    text = pd.Series(values, dtype=object).astype(str).str.replace(r"[$,]", "", regex=True).str.strip()
+    return pd.to_numeric(text, errors="coerce")
 
-        print(f"🔍 Columnas de cuotas detectadas: {column_map}")
+def _save_rate_table(header: list, columns: dict, column_map: dict, valid: pd.Series):
+    """Infers the financing rates behind the book (needs the 'Saldo a diferir' column)."""
+    saldo_idx, category_idx = _find_column(header, "saldo"), _find_column(header, "categoria")
+    price_idx = _find_column(header, "pago contado")
+    if saldo_idx is None or not column_map:
+        print("⚠️ Sin columna 'Saldo a diferir': no se actualiza la tabla de tasas.")
+        return
+    mask = valid.to_numpy()
+    principal = _to_amounts(columns[saldo_idx]).to_numpy()[mask]
+    cuotas = np.column_stack([_to_amounts(columns[idx]).to_numpy()[mask] for idx in column_map.values()])
+    categories = np.asarray(columns[category_idx], dtype=object)[mask] if category_idx is not None else None
+    prices = _to_amounts(columns[price_idx]).to_numpy()[mask] if price_idx is not None else None
+    table = quota_engine.build_rate_table(principal, cuotas, [int(m) for m in column_map], categories, prices)
+    quota_engine.save_rate_table(table)
+    rates = {m: f"{info['monthly_rate'] * 100:.3f}%" for m, info in table["terms"].items()}
+    print(f"📐 Tasas mensuales inferidas: {rates} ({len(table['categories'])} categorías)")
+    if prices is None:
+        print("⚠️ Sin columna 'Pago Contado': las cuotas estimadas se calculan sobre el precio completo.")
+
+def process_quotas(excel_path: str = None):
+    """
+    Parses cuotas.xlsx (or excel_path) into {Material: {months: installment}} and swaps
+    quota_mapping.json atomically, so readers see either the old or the new mapping.
+    """
+    excel_path = excel_path or QUOTAS_EXCEL
+    try:
+        if not os.path.exists(excel_path):
+            raise FileNotFoundError(f"No se encontró el archivo de cuotas en {excel_path}")
+
+        _, _, header, columns = _read_quota_sheet(excel_path)
+        column_map = _detect_quota_columns(header)
+        print(f"🔍 Columnas de cuotas detectadas: { {m: header[idx] for m, idx in column_map.items()} }")
         if not column_map:
             print("⚠️ No se detectaron columnas de meses.")
 
+        # Vectorized cleaning: Material ids without the '.0' and one numeric column per plan
+        raw_materials = pd.Series(columns[header.index("Material")], dtype=object)
+        valid = raw_materials.notna() & (raw_materials.astype(str).str.strip() != "")
+        materials = raw_materials.astype(str).str.split('.').str[0].str.strip()
+        # Installments truncated like int(float(x))
+        plans = pd.DataFrame({months: np.trunc(_to_amounts(columns[idx])) for months, idx in column_map.items()},
+                             index=raw_materials.index)
+        plans = plans[valid]
+        materials = materials[valid]
+
         final_mapping = {}
         matched_count = 0
-
-        for _, row in df.iterrows():
-            if "Material" not in row or pd.isna(row["Material"]): continue
-            raw_mat = str(row["Material"]).split('.')[0].strip()
-            
-            plans = {}
-            for months, real_col in column_map.items():
-                val = row[real_col]
-                if pd.notna(val) and val != "No Aplica":
-                    try:
-                        if isinstance(val, str):
-                            val = val.replace("$", "").replace(",", "").strip()
-                        plans[months] = int(float(val))
-                    except: continue
-            
-            if plans:
-                final_mapping[raw_mat] = plans
+        month_keys = list(plans.columns)
+        for material, amounts in zip(materials.to_numpy(), plans.to_numpy()):
+            row_plans = {m: int(v) for m, v in zip(month_keys, amounts) if not np.isnan(v)}
+            if row_plans:
+                final_mapping[material] = row_plans
                 matched_count += 1
 
-        # 4. Save results
-        with open(OUTPUT_MAPPING, "w", encoding="utf-8") as f:
+        # Save results (write + rename: the chat never reads a half-written mapping)
+        tmp_file = f"{OUTPUT_MAPPING}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
             json.dump(final_mapping, f, indent=2)
+        os.replace(tmp_file, OUTPUT_MAPPING)
 
         print(f"✅ Proceso completado. Se mapearon cuotas para {matched_count} equipos.")
-        del df
+        _save_rate_table(header, columns, column_map, valid)
+        del columns, plans
         gc.collect()
+        return final_mapping
 
     except Exception as e:
         print(f"❌ Error procesando Excel: {e}")
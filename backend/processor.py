@@ -3,6 +3,7 @@ import pandas as pd
 import os
 import glob
 import asyncio
+import time
 import re
 from datetime import datetime
 from dotenv import load_dotenv
@@ -16,157 +17,298 @@ load_dotenv()
 # AI Pool will be injected from main.py
 _ai_pool = None
 
-# Global In-Memory Cache for performance
-_inventory_cache = None
-_inventory_cache_mtime = 0
-_inventory_lock = asyncio.Lock()
-
 # Import Supabase logic
-from supabase_db import save_inventory_to_db, get_inventory_from_db
+from supabase_db import save_inventory_to_db
+from config import get_ai_pool
+import shared_snapshot
+import coordination
 
 def set_ai_pool(pool):
     """Set the AI pool instance for normalization"""
     global _ai_pool
     _ai_pool = pool
 
+def get_inventory_version():
+    """Version (last_update timestamp) of the inventory currently held in memory."""
+    from inventory_manager import inventory_manager
+    return inventory_manager.version
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STORAGE_DIR = os.path.join(BASE_DIR, "storage")
 PROCESSED_DATA_FILE = os.path.join(STORAGE_DIR, "processed_inventory.json")
 NORMALIZATION_CACHE_FILE = os.path.join(STORAGE_DIR, "normalization_cache.json")
 MAX_FILES = 5
 
+AI_NORMALIZATION_ENABLED = os.getenv("AI_NORMALIZATION", "true").lower() == "true"
+# ~100 output tokens per item (3 short fields + the description as key): 8 items stay well
+# under the smallest provider output cap (Groq max_tokens=1024), so answers are not cut off
+NORMALIZATION_BATCH_SIZE = int(os.getenv("NORMALIZATION_BATCH_SIZE", "8"))
+NORMALIZATION_CONCURRENCY = int(os.getenv("NORMALIZATION_CONCURRENCY", "3"))
+# Descriptions the LLM answered badly (invalid JSON, skipped) are not retried before this
+NORMALIZATION_RETRY_AFTER_S = float(os.getenv("NORMALIZATION_RETRY_AFTER_S", str(7 * 24 * 3600)))
+
+def _load_normalization_cache():
+    if os.path.exists(NORMALIZATION_CACHE_FILE):
+        try:
+            with open(NORMALIZATION_CACHE_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Caché de normalización ilegible, se reconstruye: {e}")
+    return {}
+
+def _save_normalization_cache(cache):
+    tmp_file = NORMALIZATION_CACHE_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_file, NORMALIZATION_CACHE_FILE)
+
+def _is_failure(entry) -> bool:
+    return isinstance(entry, dict) and "_failed_at" in entry
+
 async def normalize_products_batch(descriptions):
     """
-    Desactivado a petición del usuario para evitar gastos de API y lentitud.
+    Cached AI normalization keyed by Subproducto.
+    Only descriptions never seen before go to the LLM, deduplicated, in batches of
+    NORMALIZATION_BATCH_SIZE with at most NORMALIZATION_CONCURRENCY calls in flight.
+    Descriptions in a batch whose answer was unusable (or that the answer left out) are cached
+    as failures for NORMALIZATION_RETRY_AFTER_S; provider errors are retried on the next upload.
     """
-    return {}
+    cache = _load_normalization_cache()
+    unique = list(dict.fromkeys(d for d in descriptions if d))
+    now = time.time()
+    missing = [d for d in unique if d not in cache
+               or (_is_failure(cache[d]) and now - cache[d]["_failed_at"] >= NORMALIZATION_RETRY_AFTER_S)]
+
+    if missing and AI_NORMALIZATION_ENABLED and not get_ai_pool():
+        print(f"⚠ AI Pool no disponible: {len(missing)} descripciones sin normalizar (se reintentan en la próxima carga).")
+    elif missing and AI_NORMALIZATION_ENABLED:
+        from services.ai_service import ai_service
+        semaphore = asyncio.Semaphore(NORMALIZATION_CONCURRENCY)
+        batches = [missing[i:i + NORMALIZATION_BATCH_SIZE] for i in range(0, len(missing), NORMALIZATION_BATCH_SIZE)]
+
+        async def run(batch):
+            async with semaphore:
+                return await ai_service.normalize_products_batch(batch)
+
+        print(f"🧠 Normalizando {len(missing)} descripciones nuevas ({len(unique) - len(missing)} en caché) en {len(batches)} lotes...")
+        results = await asyncio.gather(*[run(b) for b in batches], return_exceptions=True)
+
+        added, failed = 0, 0
+        for batch, result in zip(batches, results):
+            if isinstance(result, json.JSONDecodeError):
+                answered = {}
+            elif not isinstance(result, dict):
+                continue  # Provider error (rate limit, network...): retried on the next upload
+            else:
+                answered = {str(desc).strip().upper(): fields for desc, fields in result.items() if isinstance(fields, dict)}
+            for desc in batch:
+                fields = answered.get(desc.strip().upper())
+                if fields is not None:
+                    cache[desc] = fields
+                    added += 1
+                else:
+                    cache[desc] = {"_failed_at": now}
+                    failed += 1
+        if added or failed:
+            _save_normalization_cache(cache)
+        print(f"🧠 Normalización IA: {added}/{len(missing)} descripciones nuevas guardadas en caché ({failed} fallidas).")
+
+    return {d: cache[d] for d in unique if d in cache and not _is_failure(cache[d])}
+
+# Inventory brand abbreviations -> brand name (order matters: first match wins)
+BRAND_KEYWORDS = {
+    "SAMS": "Samsung", "SAMSUNG": "Samsung",
+    "HUAW": "Huawei", "HUAWEI": "Huawei",
+    "MOT": "Motorola", "MOTOROLA": "Motorola",
+    "XIAO": "Xiaomi", "XIAOMI": "Xiaomi",
+    "HEWP": "HP", "HP": "HP",
+    "LENO": "Lenovo", "LENOVO": "Lenovo",
+    "ASUS": "Asus",
+    "APPL": "Apple", "IPHONE": "Apple", "IPAD": "Apple", "APPLE": "Apple",
+    "TCL": "TCL",
+    "NIU": "NIU",
+    "HONOR": "Honor"
+}
+
+# Category keywords in priority order (first category with any keyword in the description wins)
+CATEGORY_RULES = [
+    ("TV", ["TV", "TELEVIS"]),
+    ("Laptop", ["PRT", "PORT", "LAPTOP"]),
+    ("Tablet", ["TAB", "IPAD"]),
+    ("Celular", ["CEL", "SMARTPHONE", "MOTO", "IPHONE"]),
+    ("Patineta", ["PATINETA"]),
+    ("Audífonos", ["AUD", "BUDS", "AURIC", "AUDF", "AUDIF"]),
+    ("Reloj", ["WATCH", "SMRT", "CLOCK"]),
+    ("Torre Sonido", ["TRRE", "TORRE"]),
+]
+
+class KeywordMatcher:
+    """
+    Multi-pattern matcher: every keyword compiled into ONE alternation regex (longest first).
+    The scan restarts one character after each hit, so overlapping keywords are all seen,
+    and the label with the best priority (lowest index) wins - identical to scanning the
+    keyword lists in order. With word_edge=True a hit only counts when the keyword is
+    preceded by start/space OR followed by space/end (the brand rule).
+    """
+    def __init__(self, rules, word_edge=False):
+        self.labels = []
+        self.priority = {}
+        for label, keywords in rules:
+            self.labels.append(label)
+            for k in keywords:
+                self.priority.setdefault(k, len(self.labels) - 1)
+        self.word_edge = word_edge
+        self.regex = re.compile("|".join(re.escape(k) for k in sorted(self.priority, key=len, reverse=True)))
+
+    def match(self, text_upper):
+        best = None
+        pos = 0
+        n = len(text_upper)
+        while True:
+            m = self.regex.search(text_upper, pos)
+            if not m:
+                break
+            start, end = m.span()
+            if not self.word_edge or start == 0 or text_upper[start - 1] == " " or end == n or text_upper[end] == " ":
+                idx = self.priority[m.group()]
+                if best is None or idx < best:
+                    best = idx
+                    if idx == 0:
+                        break
+            pos = start + 1
+        return self.labels[best] if best is not None else "N/A"
+
+    def match_series(self, upper_series: pd.Series) -> pd.Series:
+        """Vectorized over a column: each distinct value is matched once, then mapped back."""
+        labels = {text: self.match(text) for text in upper_series.unique()}
+        return upper_series.map(labels)
+
+_CATEGORY_MATCHER = KeywordMatcher(CATEGORY_RULES)
+_BRAND_MATCHER = KeywordMatcher([(brand, [k]) for k, brand in BRAND_KEYWORDS.items()], word_edge=True)
 
 def rule_based_normalization(desc):
     """Fallback logic for common brands and categories using keywords"""
     desc_upper = desc.upper()
-    res = {"categoria": "N/A", "marca": "N/A", "modelo_limpio": desc, "especificaciones": ""}
-    
-    # Category detection
-    if any(k in desc_upper for k in ["TV", "TELEVIS"]): res["categoria"] = "TV"
-    elif any(k in desc_upper for k in ["PRT", "PORT", "LAPTOP"]): res["categoria"] = "Laptop"
-    elif any(k in desc_upper for k in ["TAB", "IPAD"]): res["categoria"] = "Tablet"
-    elif any(k in desc_upper for k in ["CEL", "SMARTPHONE", "MOTO", "IPHONE"]): res["categoria"] = "Celular"
-    elif any(k in desc_upper for k in ["PATINETA"]): res["categoria"] = "Patineta"
-    elif any(k in desc_upper for k in ["AUD", "BUDS", "AURIC", "AUDF", "AUDIF"]): res["categoria"] = "Audífonos"
-    elif any(k in desc_upper for k in ["WATCH", "SMRT", "CLOCK"]): res["categoria"] = "Reloj"
-    elif any(k in desc_upper for k in ["TRRE", "TORRE"]): res["categoria"] = "Torre Sonido"
-    
-    # Brand detection
-    brands = {
-        "SAMS": "Samsung", "SAMSUNG": "Samsung",
-        "HUAW": "Huawei", "HUAWEI": "Huawei",
-        "MOT": "Motorola", "MOTOROLA": "Motorola",
-        "XIAO": "Xiaomi", "XIAOMI": "Xiaomi",
-        "HEWP": "HP", "HP": "HP",
-        "LENO": "Lenovo", "LENOVO": "Lenovo",
-        "ASUS": "Asus",
-        "APPL": "Apple", "IPHONE": "Apple", "IPAD": "Apple", "APPLE": "Apple",
-        "TCL": "TCL",
-        "NIU": "NIU",
-        "HONOR": "Honor"
+    return {
+        "categoria": _CATEGORY_MATCHER.match(desc_upper),
+        "marca": _BRAND_MATCHER.match(desc_upper),
+        "modelo_limpio": desc,
+        "especificaciones": ""
     }
-    for k, v in brands.items():
-        if f" {k}" in f" {desc_upper}" or f"{k} " in f"{desc_upper} " or desc_upper.endswith(k):
-            res["marca"] = v
-            break
-            
-    return res
 
-async def process_inventory_pdf(file_path):
-    """
-    Extracts data from PDF and normalizes it using AI for categorization/specs.
-    Returns a DataFrame.
-    """
-    try:
-        data = []
-        if not os.path.exists(file_path):
-            return None
+def rule_based_normalization_vectorized(descriptions: pd.Series) -> pd.DataFrame:
+    """Column-wise rule_based_normalization: returns a DataFrame with categoria and marca."""
+    upper = descriptions.astype(str).str.upper()
+    return pd.DataFrame({
+        "categoria": _CATEGORY_MATCHER.match_series(upper),
+        "marca": _BRAND_MATCHER.match_series(upper)
+    }, index=descriptions.index)
 
-        with pdfplumber.open(file_path) as pdf:
-            page_bodega = "CEM Bogotá - ZF" # Default
+def _extract_pdf_rows(file_path, report):
+    """Text extraction + line parsing (blocking pdfplumber work: callers run it in a thread)."""
+    data = []
+    with pdfplumber.open(file_path) as pdf:
+        page_bodega = "CEM Bogotá - ZF" # Default
+        total_pages = len(pdf.pages)
+        
+        for i, page in enumerate(pdf.pages):
+            text = page.extract_text()
+            report("parsing", page=i + 1, pages=total_pages, items=len(data))
+            if not text: continue
             
-            for i, page in enumerate(pdf.pages):
-                text = page.extract_text()
-                if not text: continue
-                
-                # Robust Bodega detection
-                text_upper = text.upper()
-                if any(k in text_upper for k in ["ZF", "BOGOTÁ", "BOGOTA", "CEM BOG"]):
-                    page_bodega = "CEM Bogotá - ZF"
-                elif any(k in text_upper for k in ["CAVA", "MEDELLÍN", "MEDELLIN"]):
-                    page_bodega = "CAVA Medellín"
+            # Robust Bodega detection
+            text_upper = text.upper()
+            if any(k in text_upper for k in ["ZF", "BOGOTÁ", "BOGOTA", "CEM BOG"]):
+                page_bodega = "CEM Bogotá - ZF"
+            elif any(k in text_upper for k in ["CAVA", "MEDELLÍN", "MEDELLIN"]):
+                page_bodega = "CAVA Medellín"
+            
+            # Process line by line
+            lines = text.split('\n')
+            page_count = 0
+            for line in lines:
+                # Robust Pattern 2-step: ID -> Name -> Total -> Disponible -> Categoria -> everything after "Aplica $"
+                # Group 5 is the native Category.
+                pattern_v3 = r"(\d{7,8})\s*(.+?)\s+(\d+)\s+(\d+)\s*(.*?)\s*Aplica\s+\$(.*)"
                 
-                # Process line by line
-                lines = text.split('\n')
-                page_count = 0
-                for line in lines:
-                    # Robust Pattern 2-step: ID -> Name -> Total -> Disponible -> Categoria -> everything after "Aplica $"
-                    # Group 5 is the native Category.
-                    pattern_v3 = r"(\d{7,8})\s*(.+?)\s+(\d+)\s+(\d+)\s*(.*?)\s*Aplica\s+\$(.*)"
-                    
-                    # Fallback for lines without "Aplica $" 
-                    pattern_flex = r"(\d{7,8})\s*(.+?)\s+(\d+)\s+(\d+)\s*(.*?)\s*\$?\s?(\d{1,3}(?:\.\d{3})*(?:,\d+)?|[-])"
+                # Fallback for lines without "Aplica $" 
+                pattern_flex = r"(\d{7,8})\s*(.+?)\s+(\d+)\s+(\d+)\s*(.*?)\s*\$?\s?(\d{1,3}(?:\.\d{3})*(?:,\d+)?|[-])"
 
-                    match = re.search(pattern_v3, line)
+                match = re.search(pattern_v3, line)
+                if match:
+                    material = match.group(1)
+                    subproducto = match.group(2).strip()
+                    stock = match.group(3) 
+                    categoria_nativa = match.group(5).strip()
+                    tail = match.group(6)
+                    
+                    # Find all number sequences in the tail (including single digits)
+                    # We prioritize the LAST one as the Total Value
+                    prices = re.findall(r"(\d[\d\.\s,]*\d|\d)", tail)
+                    if prices:
+                        price_raw = prices[-1]
+                    else:
+                        price_raw = "-" if "-" in tail else "0"
+                else:
+                    match = re.search(pattern_flex, line)
                     if match:
                         material = match.group(1)
                         subproducto = match.group(2).strip()
-                        stock = match.group(3) 
+                        stock = match.group(3)
                         categoria_nativa = match.group(5).strip()
-                        tail = match.group(6)
-                        
-                        # Find all number sequences in the tail (including single digits)
-                        # We prioritize the LAST one as the Total Value
-                        prices = re.findall(r"(\d[\d\.\s,]*\d|\d)", tail)
-                        if prices:
-                            price_raw = prices[-1]
-                        else:
-                            price_raw = "-" if "-" in tail else "0"
+                        price_raw = match.group(6).strip()
                     else:
-                        match = re.search(pattern_flex, line)
-                        if match:
-                            material = match.group(1)
-                            subproducto = match.group(2).strip()
-                            stock = match.group(3)
-                            categoria_nativa = match.group(5).strip()
-                            price_raw = match.group(6).strip()
-                        else:
-                            continue
+                        continue
+                
+                # Handle hyphenated prices
+                if price_raw == "-":
+                    precio_clean = "0"
+                else:
+                    # Clean spaces and handle decimals (commas)
+                    # Example: "3 .299.900,0" -> "3.299.900"
+                    p_no_spaces = price_raw.replace(" ", "")
+                    if "," in p_no_spaces:
+                        p_no_spaces = p_no_spaces.split(",")[0]
                     
-                    # Handle hyphenated prices
-                    if price_raw == "-":
-                        precio_clean = "0"
-                    else:
-                        # Clean spaces and handle decimals (commas)
-                        # Example: "3 .299.900,0" -> "3.299.900"
-                        p_no_spaces = price_raw.replace(" ", "")
-                        if "," in p_no_spaces:
-                            p_no_spaces = p_no_spaces.split(",")[0]
-                        
-                        precio_clean = re.sub(r'[^\d]', '', p_no_spaces)
-                        
-                        # Safety check for concatenated values (standard price is ~7 digits)
-                        if len(precio_clean) > 8:
-                            precio_clean = precio_clean[:7]
+                    precio_clean = re.sub(r'[^\d]', '', p_no_spaces)
                     
-                    data.append({
-                        "Bodega": page_bodega,
-                        "Material": material,
-                        "Subproducto": subproducto,
-                        "categoria_nativa": categoria_nativa,
-                        "CantDisponible": float(stock) if stock else 0,
-                        "Precio Contado": float(precio_clean) if precio_clean else 0
-                    })
-                    page_count += 1
+                    # Safety check for concatenated values (standard price is ~7 digits)
+                    if len(precio_clean) > 8:
+                        precio_clean = precio_clean[:7]
                 
-                if page_count > 0:
-                    print(f"📄 Página {i+1}: Encontrados {page_count} productos ({page_bodega})")
-        
+                data.append({
+                    "Bodega": page_bodega,
+                    "Material": material,
+                    "Subproducto": subproducto,
+                    "categoria_nativa": categoria_nativa,
+                    "CantDisponible": float(stock) if stock else 0,
+                    "Precio Contado": float(precio_clean) if precio_clean else 0
+                })
+                page_count += 1
+            
+            if page_count > 0:
+                print(f"📄 Página {i+1}: Encontrados {page_count} productos ({page_bodega})")
+    return data
+
+async def process_inventory_pdf(file_path, progress=None):
+    """
+    Extracts data from PDF and normalizes it using AI for categorization/specs.
+    Returns a DataFrame.
+    progress: optional callback(dict) with stage/page/pages/items, called after every page and stage.
+    """
+    def report(stage, **info):
+        if progress:
+            try:
+                progress({"stage": stage, **info})
+            except Exception as e:
+                print(f"Error reportando progreso: {e}")
+
+    try:
+        if not os.path.exists(file_path):
+            return None
+
+        # pdfplumber is blocking: off the event loop so heartbeats and requests keep running
+        data = await asyncio.to_thread(_extract_pdf_rows, file_path, report)
         print(f"📊 DEBUG: Total items extraídos del PDF: {len(data)}")
         if not data:
             return None
@@ -185,25 +327,42 @@ async def process_inventory_pdf(file_path):
         df = df.drop_duplicates(subset=["Material", "Subproducto", "CantDisponible"])
         
         # --- Lightweight Normalization ---
-        # Skip AI and get native categories, use simple rule-based for the rest
+        # Native categories + rule-based brand as the baseline
         df["categoria"] = df["categoria_nativa"]
-        df["marca"] = df["Subproducto"].apply(lambda x: rule_based_normalization(x).get("marca", "N/A"))
+        df["marca"] = rule_based_normalization_vectorized(df["Subproducto"])["marca"]
         df["modelo_limpio"] = df["Subproducto"]
         df["especificaciones"] = "-"
         df["tip_venta"] = "-"
 
+        # --- Cached AI Normalization (only unseen descriptions hit the LLM) ---
+        report("normalizing", items=len(df))
+        # Native categories are kept: they are the official values the chat filters on
+        normalized = await normalize_products_batch(df["Subproducto"].tolist())
+        if normalized:
+            for field in ["modelo_limpio", "especificaciones", "tip_venta"]:
+                values = {d: str(v[field]) for d, v in normalized.items() if v.get(field)}
+                df[field] = df["Subproducto"].map(values).fillna(df[field])
+            ai_brands = df["Subproducto"].map({d: str(v["marca"]) for d, v in normalized.items() if v.get("marca")})
+            df["marca"] = df["marca"].where(df["marca"] != "N/A", ai_brands.fillna("N/A"))
+
         # Save in new format with metadata
+        report("saving", items=len(df))
         now = datetime.now().isoformat()
         inventory_payload = {
             "last_update": now,
             "records": df.to_dict('records')
         }
-        with open(PROCESSED_DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(inventory_payload, f, ensure_ascii=False, indent=4)
+        def persist():
+            # Write + rename: workers reading processed_inventory.json never see half a file
+            tmp_file = f"{PROCESSED_DATA_FILE}.{os.getpid()}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(inventory_payload, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_file, PROCESSED_DATA_FILE)
+            publish_inventory_snapshot(df, datetime.fromisoformat(now).timestamp())
+        await asyncio.to_thread(persist)
         
-        # Invalidate cache so it's reloaded on next call
-        global _inventory_cache
-        _inventory_cache = None
+        # Every worker (this one included) drops its caches and maps the new snapshot
+        coordination.bump_version("inventory")
         
         # PERSISTENCE: Save to Supabase (Wait for it)
         await save_inventory_to_db(df)
@@ -220,6 +379,26 @@ async def process_inventory_pdf(file_path):
         print(f"Error en procesamiento híbrido: {e}")
         return None
 
+def publish_inventory_snapshot(df, version):
+    """Publishes the inventory as a shared mmap snapshot for every worker. Never fails the caller."""
+    try:
+        source_mtime = os.path.getmtime(PROCESSED_DATA_FILE) if os.path.exists(PROCESSED_DATA_FILE) else 0
+        shared_snapshot.publish(inventory=df, inventory_info={"version": version, "source_mtime": source_mtime})
+    except Exception as e:
+        print(f"! No se pudo publicar el snapshot compartido: {e}")
+
+def load_inventory_snapshot():
+    """
+    Maps the shared inventory snapshot if it is at least as new as processed_inventory.json.
+    Returns (df, version, snapshot name) or (None, None, None).
+    """
+    df, meta = shared_snapshot.load_inventory()
+    if df is None:
+        return None, None, None
+    if os.path.exists(PROCESSED_DATA_FILE) and meta.get("source_mtime", 0) < os.path.getmtime(PROCESSED_DATA_FILE):
+        return None, None, None
+    return df, meta.get("version", 0), shared_snapshot.current_name()
+
 def rotate_inventories():
     """
     Keeps only the most recent 5 files.
@@ -240,96 +419,9 @@ def rotate_inventories():
 
 async def get_latest_inventory():
     """
-    Returns the most recent processed DataFrame with in-memory caching and request deduplication.
+    Returns the most recent processed DataFrame (cloud sync, shared snapshot or local JSON).
+    Usually mapped from the shared snapshot: treat it as read-only (see shared_snapshot).
+    See inventory_manager.InventorySnapshotManager.
     """
-    global _inventory_cache, _inventory_cache_mtime
-    
-    async with _inventory_lock:
-        local_pdfs = glob.glob(os.path.join(STORAGE_DIR, "*.pdf"))
-        latest_pdf = max(local_pdfs, key=os.path.getmtime) if local_pdfs else None
-        
-        # 1. SUPABASE SYNC CHECK (Source of Truth)
-        # Check if Supabase has a newer version than our local JSON
-        from supabase_db import get_metadata_db, get_inventory_from_db
-        try:
-            metadata = await get_metadata_db()
-            if metadata and metadata.get("last_update"):
-                cloud_mtime = datetime.fromisoformat(metadata["last_update"]).timestamp()
-                
-                # If cloud is newer OR we are missing local JSON, sync it
-                should_sync = not os.path.exists(PROCESSED_DATA_FILE)
-                if not should_sync:
-                    try:
-                        with open(PROCESSED_DATA_FILE, "r", encoding="utf-8") as f:
-                            local_data = json.load(f)
-                            if isinstance(local_data, dict) and "last_update" in local_data:
-                                local_mtime = datetime.fromisoformat(local_data["last_update"]).timestamp()
-                            else:
-                                local_mtime = os.path.getmtime(PROCESSED_DATA_FILE)
-                            
-                            if cloud_mtime > local_mtime + 5: # 5s buffer
-                                print("☁ Supabase tiene una versión más reciente. Sincronizando...")
-                                should_sync = True
-                    except:
-                        should_sync = True
-                
-                if should_sync:
-                    print("☁ Sincronizando inventario desde Supabase DB...")
-                    cloud_df = await get_inventory_from_db(columns="*")
-                    if cloud_df is not None and not cloud_df.empty:
-                        inventory_payload = {
-                            "last_update": metadata.get("last_update"),
-                            "records": cloud_df.to_dict('records')
-                        }
-                        with open(PROCESSED_DATA_FILE, "w", encoding="utf-8") as f:
-                            json.dump(inventory_payload, f, ensure_ascii=False, indent=4)
-                        _inventory_cache = cloud_df
-                        _inventory_cache_mtime = cloud_mtime
-                        return _inventory_cache
-        except Exception as e:
-            print(f"! Error sincronizando con Supabase: {e}")
-
-        # 2. IN-MEMORY CACHE
-        if _inventory_cache is not None:
-            if latest_pdf:
-                pdf_mtime = os.path.getmtime(latest_pdf)
-                if _inventory_cache_mtime >= pdf_mtime:
-                    return _inventory_cache
-
-        # 3. LOCAL JSON (Disk Cache)
-        if os.path.exists(PROCESSED_DATA_FILE):
-            try:
-                with open(PROCESSED_DATA_FILE, "r", encoding="utf-8") as f:
-                    local_data = json.load(f)
-                
-                if isinstance(local_data, dict) and "records" in local_data:
-                    local_df = pd.DataFrame(local_data["records"])
-                    json_mtime = datetime.fromisoformat(local_data.get("last_update", datetime.now().isoformat())).timestamp()
-                else:
-                    local_df = pd.DataFrame(local_data) # Legacy support
-                    json_mtime = os.path.getmtime(PROCESSED_DATA_FILE)
-
-                if latest_pdf:
-                    pdf_mtime = os.path.getmtime(latest_pdf)
-                    if json_mtime >= pdf_mtime:
-                        print("✓ Cargando inventario local (Caché disco).")
-                        _inventory_cache = local_df
-                        _inventory_cache_mtime = json_mtime
-                        return _inventory_cache
-                else:
-                    print("✓ Cargando inventario local (Caché disco - sin PDF).")
-                    _inventory_cache = local_df
-                    _inventory_cache_mtime = json_mtime
-                    return _inventory_cache
-            except Exception as e:
-                print(f"Error cargando JSON local: {e}")
-
-        # 4. LOCAL PDF PROCESSING (Last resort)
-        if latest_pdf:
-            print(f"Procesando PDF local más reciente: {latest_pdf}")
-            _inventory_cache = await process_inventory_pdf(latest_pdf)
-            if _inventory_cache is not None:
-                _inventory_cache_mtime = os.path.getmtime(latest_pdf)
-            return _inventory_cache
-
-        return None
+    from inventory_manager import inventory_manager
+    return await inventory_manager.get()
@@ -0,0 +1,194 @@
+"""
+Installment engine (French amortization: cuota = P * i / (1 - (1 + i)^-n)).
+process_quotas infers the monthly rate behind every (material, term) of cuotas.xlsx with
+vectorized Newton iterations over the whole book at once, and stores the median rate per
+category and term in quota_rates.json, along with the median share of the cash price that
+is financed (the book's 'Saldo a diferir' is the price minus the initial payment).
+Installments for any price (SKUs missing from the book included) are then closed-form.
+"""
+
+import os
+import json
+import time
+import numpy as np
+from config import STORAGE_DIR
+
+TERMS = [6, 12, 18, 24, 36]
+RATES_FILE = os.path.join(STORAGE_DIR, "quota_rates.json")
+NEWTON_ITERATIONS = 30
+NEWTON_TOLERANCE = 1e-12
+
+_stamp = None
+_table = None
+
+
+def installments(principal, rate, n):
+    """Closed-form installment, vectorized over any broadcastable principal/rate/n."""
+    principal, rate, n = np.asarray(principal, float), np.asarray(rate, float), np.asarray(n, float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amortized = principal * rate / (1 - (1 + rate) ** -n)
+    return np.where(rate > 0, amortized, principal / n)
+
+
+def infer_rates(principal, cuotas, terms) -> np.ndarray:
+    """
+    Monthly rate for every cell of cuotas (rows = materials, columns = terms), solved for all
+    cells at once with Newton's method. NaN where there is no valid plan.
+    """
+    principal = np.asarray(principal, float)[:, None]
+    cuotas = np.asarray(cuotas, float)
+    n = np.asarray(terms, float)[None, :]
+
+    valid = (principal > 0) & (cuotas > 0) & (cuotas * n >= principal)
+    p = np.where(valid, principal, 1.0)
+    c = np.where(valid, cuotas, 1.0)
+    # Small-rate approximation of the amortization formula as the starting point
+    rate = np.maximum(2 * (c * n / p - 1) / (n + 1), 1e-9)
+    for _ in range(NEWTON_ITERATIONS):
+        v = (1 + rate) ** -n
+        d = 1 - v
+        f = p * rate / d - c
+        df = p * (d - rate * n * v / (1 + rate)) / d ** 2
+        step = f / df
+        rate = np.maximum(rate - step, 1e-9)
+        if np.all(np.abs(step[valid]) < NEWTON_TOLERANCE):
+            break
+    rate = np.where(c * n - p < 0.5, 0.0, rate)  # Interest-free plans
+    return np.where(valid, rate, np.nan)
+
+
+def _summarize(rates: np.ndarray, terms: list) -> dict:
+    summary = {}
+    for j, term in enumerate(terms):
+        column = rates[:, j]
+        column = column[~np.isnan(column)]
+        if len(column):
+            summary[str(term)] = {"monthly_rate": float(np.median(column)), "samples": int(len(column))}
+    return summary
+
+
+def _median_ratio(ratios: np.ndarray):
+    ratios = ratios[~np.isnan(ratios)]
+    return float(np.median(ratios)) if len(ratios) else None
+
+
+def build_rate_table(principal, cuotas, terms, categories=None, prices=None) -> dict:
+    """
+    Median inferred rate per term, overall and per category. With the cash prices, also the
+    median financed share of the price (principal / price), overall and per category.
+    """
+    rates = infer_rates(principal, cuotas, terms)
+    table = {"updated_at": time.time(), "terms": _summarize(rates, terms), "categories": {}}
+    ratios = None
+    if prices is not None:
+        principal_arr, prices_arr = np.asarray(principal, float), np.asarray(prices, float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = np.where((prices_arr > 0) & (principal_arr > 0) & (principal_arr <= prices_arr),
+                              principal_arr / prices_arr, np.nan)
+        table["financed_ratio"] = {"all": _median_ratio(ratios), "categories": {}}
+    if categories is not None:
+        categories = np.asarray([str(c).strip().upper() for c in categories], dtype=object)
+        for category in sorted(set(categories) - {"", "NONE", "NAN"}):
+            summary = _summarize(rates[categories == category], terms)
+            if summary:
+                table["categories"][category] = summary
+            if ratios is not None:
+                ratio = _median_ratio(ratios[categories == category])
+                if ratio is not None:
+                    table["financed_ratio"]["categories"][category] = ratio
+
+    # Fit check: how far the table's rate lands from the book's own installments
+    fitted = installments(np.asarray(principal, float)[:, None],
+                          np.array([table["terms"].get(str(t), {}).get("monthly_rate", np.nan) for t in terms]),
+                          np.asarray(terms)[None, :])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        error = np.abs(fitted - cuotas) / cuotas
+    error = error[~np.isnan(rates) & ~np.isnan(error)]
+    table["median_error_pct"] = float(np.median(error) * 100) if len(error) else None
+    return table
+
+
+def save_rate_table(table: dict):
+    tmp_file = f"{RATES_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(table, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_file, RATES_FILE)
+
+
+def load_rate_table() -> dict:
+    """The stored rate table, re-read only when the file changes (None if never built)."""
+    global _stamp, _table
+    try:
+        st = os.stat(RATES_FILE)
+    except FileNotFoundError:
+        _stamp, _table = None, None
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+    if stamp != _stamp:
+        try:
+            with open(RATES_FILE, "r", encoding="utf-8") as f:
+                _table = json.load(f)
+            _stamp = stamp
+        except Exception as e:
+            print(f"Error leyendo tabla de tasas: {e}")
+    return _table
+
+
+def _rates_for(table: dict, category: str = None) -> dict:
+    rates = {term: info["monthly_rate"] for term, info in table.get("terms", {}).items()}
+    if category:
+        by_category = table.get("categories", {}).get(str(category).strip().upper(), {})
+        rates.update({term: info["monthly_rate"] for term, info in by_category.items()})
+    return rates
+
+
+def _financed_ratio(table: dict, category: str = None) -> float:
+    """Typical financed share of the cash price (1.0 for tables built without prices)."""
+    ratios = table.get("financed_ratio") or {}
+    if category:
+        ratio = ratios.get("categories", {}).get(str(category).strip().upper())
+        if ratio is not None:
+            return ratio
+    return ratios.get("all") or 1.0
+
+
+def compute(prices, categories=None, down_payment=None) -> list:
+    """
+    Estimated {term: cuota} for each cash price. The financed amount is price - down_payment
+    when a down payment is given, otherwise the price times the category's typical financed
+    share (the book's rates were fitted on 'Saldo a diferir', not on the full price).
+    Returns None entries for non-positive amounts, or every entry None if no table exists.
+    """
+    table = load_rate_table()
+    prices = np.asarray(prices, float)
+    if table is None:
+        return [None] * len(prices)
+    categories = categories if categories is not None else [None] * len(prices)
+
+    results = [None] * len(prices)
+    groups = {}
+    for idx, category in enumerate(categories):
+        groups.setdefault(category, []).append(idx)
+    for category, idxs in groups.items():
+        rates = _rates_for(table, category)
+        terms = [t for t in map(str, TERMS) if t in rates]
+        if not terms:
+            continue
+        if down_payment is None:
+            financed = prices[idxs] * _financed_ratio(table, category)
+        else:
+            financed = prices[idxs] - float(down_payment)
+        values = installments(financed[:, None], np.array([rates[t] for t in terms])[None, :],
+                              np.array([int(t) for t in terms])[None, :])
+        for row, idx in enumerate(idxs):
+            if financed[row] > 0 and np.isfinite(financed[row]):
+                results[idx] = {t: int(np.rint(v)) for t, v in zip(terms, values[row])}
+    return results
+
+
+def estimate(price, category=None):
+    """Single-price shortcut of compute()."""
+    try:
+        return compute([float(price)], [category])[0]
+    except (TypeError, ValueError):
+        return None
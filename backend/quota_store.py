@@ -0,0 +1,74 @@
+"""
+In-memory index over quota_mapping.json ({material: {months: cuota}}).
+Reloaded only when the file changes (it is swapped atomically by process_quotas), so every
+worker serves batch lookups from a dict instead of re-reading or shipping the whole book.
+"""
+
+import os
+import json
+import hashlib
+from config import QUOTA_MAPPING_FILE
+
+_stamp = None
+_mapping = {}
+_index = {}    # material without leading zeros -> plans
+_etag = None
+
+
+def _normalize(material) -> str:
+    """'0007019643.0 ' -> '7019643'"""
+    return str(material).strip().split('.')[0].lstrip('0')
+
+
+def _load():
+    global _stamp, _mapping, _index, _etag
+    try:
+        st = os.stat(QUOTA_MAPPING_FILE)
+    except FileNotFoundError:
+        _stamp, _mapping, _index, _etag = None, {}, {}, None
+        return
+    stamp = (st.st_mtime_ns, st.st_ino, st.st_size)
+    if stamp == _stamp:
+        return
+    try:
+        with open(QUOTA_MAPPING_FILE, "rb") as f:
+            raw = f.read()
+        mapping = json.loads(raw)
+    except Exception as e:
+        print(f"Error leyendo mapeo de cuotas: {e}")
+        return  # Keep serving the previous book
+    _mapping = mapping
+    _index = {_normalize(k): v for k, v in _mapping.items()}
+    _etag = f'"{hashlib.md5(raw).hexdigest()}"'
+    _stamp = stamp
+
+
+def get_mapping() -> dict:
+    _load()
+    return _mapping
+
+
+def version() -> str:
+    """ETag of the current quota book (None if there is none)."""
+    _load()
+    return _etag
+
+
+def find(material):
+    """Plans for one material: exact id, then digits only / without leading zeros."""
+    _load()
+    key = str(material).strip()
+    if key in _mapping:
+        return _mapping[key]
+    normalized = _normalize("".join(c for c in key if c.isdigit() or c == "."))
+    return _index.get(normalized) if normalized else None
+
+
+def lookup(materials: list) -> dict:
+    """{requested id: plans} for the materials that have quotas."""
+    found = {}
+    for material in materials:
+        plans = find(material)
+        if plans:
+            found[str(material)] = plans
+    return found
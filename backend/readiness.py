@@ -0,0 +1,55 @@
+"""
+Per-worker readiness state.
+The server answers /health as soon as it boots; the cloud sync and the inventory warm-up run
+in the background, and inventory-dependent endpoints answer 503 (with Retry-After) until
+this worker has its inventory snapshot mapped.
+"""
+
+import time
+from fastapi import HTTPException
+
+RETRY_AFTER_SECONDS = 5
+
+_state = {
+    "phase": "starting",  # starting | syncing | warming | ready
+    "started_at": time.time(),
+    "ready_at": None,
+    "steps": {}
+}
+
+
+def set_phase(phase: str):
+    _state["phase"] = phase
+    if phase == "ready":
+        _state["ready_at"] = time.time()
+        print(f"✓ Worker listo en {_state['ready_at'] - _state['started_at']:.1f}s")
+
+
+def record_step(name: str, status: str, started: float, error: str = None):
+    """status: ok | empty | timeout | error | skipped"""
+    _state["steps"][name] = {
+        "status": status,
+        "duration_ms": round((time.time() - started) * 1000),
+        "error": error
+    }
+
+
+def is_ready() -> bool:
+    return _state["phase"] == "ready"
+
+
+def get_state() -> dict:
+    state = dict(_state)
+    state["ready"] = is_ready()
+    state["uptime_s"] = round(time.time() - _state["started_at"], 1)
+    return state
+
+
+async def require_ready():
+    """FastAPI dependency for endpoints that need the inventory loaded."""
+    if not is_ready():
+        raise HTTPException(
+            status_code=503,
+            detail="Cleo está cargando el inventario. Intenta de nuevo en unos segundos.",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+        )
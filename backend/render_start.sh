@@ -2,7 +2,20 @@
 # Startup script for Render to avoid WORKER TIMEOUT and OOM
 echo "🚀 Starting Cleo AI Backend with Optimized Gunicorn Config..."
 
-# -w 1: Only 1 worker to save RAM on Render 512MB
-# --timeout 300: Very long timeout to allow AI Pool initialization AND Cloud Sync without SIGABRT
+# Exported so the ingest worker sees it too: the AI pool splits per-key rate limits across
+# WEB_CONCURRENCY + 1 processes (see ai_pool.py)
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-3}
+
+# Ingest worker: separate process consuming storage/jobs.db (PDF and quota parsing off the web workers).
+# Restarted automatically if it crashes; queued/running jobs are resumed from the queue.
+(while true; do python ingest_worker.py; echo "⚠ Ingest worker terminó. Reiniciando..."; sleep 2; done) &
+
+# -w 3: Workers share the inventory, spec-match table and embeddings through the mmap'd
+#       snapshot in storage/snapshots (see shared_snapshot.py), so extra workers add
+#       concurrency without duplicating the data. Override with WEB_CONCURRENCY (3-4 fits 512MB).
+# --timeout 60: Cloud Sync and inventory warm-up run in the background after boot (see /ready),
+#              and web workers never parse PDFs (a newer PDF is queued for the ingest worker
+#              while the previous inventory keeps being served), so no request runs for minutes
 # -k uvicorn.workers.UvicornWorker: Standard FastAPI worker
-gunicorn -w 1 -k uvicorn.workers.UvicornWorker --timeout 300 --bind 0.0.0.0:$PORT main:app
+WORKERS=$WEB_CONCURRENCY
+gunicorn -w $WORKERS -k uvicorn.workers.UvicornWorker --timeout 60 --bind 0.0.0.0:$PORT main:app
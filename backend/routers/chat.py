@@ -1,13 +1,27 @@
 import os
+import json
+import asyncio
 import pandas as pd
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from config import CLEO_PROMPT, SYNONYMS
-from utils import log_debug
+from utils import log_debug, estimate_tokens
+from llm_scheduler import SchedulerQueueFull, SchedulerDeadlineExceeded
 from services.ai_service import ai_service
 from services.inventory_service import inventory_service
+from services.response_cache import response_cache
+from services.intent_service import intent_service
+from readiness import require_ready
 
 router = APIRouter()
 
+CHAT_RESPONSE_MODE = os.getenv("CHAT_RESPONSE_MODE", "llm")
+PROMPT_WRAPPER_TOKENS = 100  # Fixed text around the context in the /chat prompt
+MIN_CONTEXT_TOKENS = 500  # Floor for the inventory context when the prompt overhead eats the budget
+STRUCTURED_MAX_ROWS = int(os.getenv("CHAT_STRUCTURED_MAX_ROWS", "200"))  # Rows in the structured table (`total` counts all matches)
+
+_search_stats = {"fast_path": 0, "ai_path": 0, "fallback": 0, "speculative": 0}
+
 @router.get("/api/pool-stats")
 async def get_pool_stats():
     """Get AI pool performance statistics"""
@@ -17,6 +31,11 @@ async def get_pool_stats():
         return pool.get_stats()
     return {"error": "AI Pool not initialized", "fallback_mode": "single_gemini_model"}
 
+@router.get("/api/cache-stats")
+async def get_cache_stats():
+    """Hit/miss statistics for the chat response cache"""
+    return {**response_cache.get_stats(), "intent": intent_service.stats, "search": _search_stats}
+
 @router.post("/generate-tip")
 async def generate_tip(data: dict):
     model_name = data.get("model")
@@ -27,8 +46,68 @@ async def generate_tip(data: dict):
     tip = await ai_service.generate_sales_tip(model_name, specs)
     return {"tip": tip}
 
-@router.get("/chat")
-async def chat(query: str):
+async def _intent_search(query: str, df: pd.DataFrame, inventory_version) -> pd.DataFrame:
+    intent = await intent_service.resolve_intent(query, df, inventory_version)
+    log_debug(f"Intención: {intent}")
+    results = inventory_service.apply_intent_filters(df, intent)
+    log_debug(f"AI PATH: {len(results)} resultados encontrados.")
+    return results
+
+async def _search_inventory(query: str, df: pd.DataFrame, valid_keywords: list, inventory_version) -> pd.DataFrame:
+    """
+    Runs the keyword fast path in a worker thread and, when the query is ambiguous (intent would
+    need the LLM), starts the AI path at the same time instead of after the fast path fails.
+    The first usable result set wins and the other task is cancelled.
+    Fast path is usable with 0 < matches < 100; AI path with any match.
+    """
+    fast_task = asyncio.create_task(
+        asyncio.to_thread(inventory_service.filter_inventory, df, valid_keywords)
+    ) if valid_keywords else None
+    intent_task = None
+    if fast_task is None or intent_service.is_ambiguous(query, df, inventory_version):
+        if fast_task:
+            log_debug("AI PATH especulativo: consulta ambigua, intención en paralelo con fast path.")
+            _search_stats["speculative"] += 1
+        else:
+            log_debug("AI PATH: Analizando intención de búsqueda...")
+        intent_task = asyncio.create_task(_intent_search(query, df, inventory_version))
+
+    direct_matches = None
+    pending = {t for t in (fast_task, intent_task) if t}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if fast_task in done:
+                direct_matches = fast_task.result()
+                if 0 < len(direct_matches) < 100:
+                    log_debug(f"FAST PATH: {len(direct_matches)} coincidencias directas.")
+                    _search_stats["fast_path"] += 1
+                    return direct_matches
+                if intent_task is None:
+                    log_debug("AI PATH: Analizando intención de búsqueda...")
+                    intent_task = asyncio.create_task(_intent_search(query, df, inventory_version))
+                    pending.add(intent_task)
+            if intent_task in done and not intent_task.result().empty:
+                _search_stats["ai_path"] += 1
+                return intent_task.result()
+
+        # Fallback if AI filtering fails but we have keywords (reuses the fast path result)
+        _search_stats["fallback"] += 1
+        if direct_matches is None:
+            return pd.DataFrame()
+        log_debug(f"AI PATH VACÍO: Fallback a palabras clave, {len(direct_matches)} resultados.")
+        return direct_matches
+    finally:
+        for task in (fast_task, intent_task):
+            if task and not task.done():
+                task.cancel()
+
+async def _prepare_chat(query: str, structured: bool = False) -> dict:
+    """
+    Shared /chat pipeline up to the final LLM call.
+    Returns {"response": ...} when the answer is already known (no inventory, cache hit),
+    {"results": ...} in structured mode, or {"prompt": ..., "cache_query": ..., "inventory_version": ...}.
+    """
     df = await inventory_service.get_latest_inventory_df()
     if df is None:
         return {"response": "Sube un inventario PDF para comenzar."}
@@ -70,34 +149,26 @@ async def chat(query: str):
                 valid_keywords[i] = k + '\"'
     
     log_debug(f"Keywords procesadas: {valid_keywords}")
+
+    # 0. Response cache: same keywords + same inventory + same prompt => same answer
+    cache_query = response_cache.normalize_query(" ".join(valid_keywords) or query)
+    inventory_version = inventory_service.get_inventory_version()
+    cached_response = None if structured else await response_cache.get(cache_query, inventory_version)
+    if cached_response is not None:
+        log_debug(f"CACHE HIT: {cache_query}")
+        return {"response": cached_response, "cached": True}
     
-    results = pd.DataFrame()
-    fast_path_used = False
-    
-    # 1. Fast Path: Keyword matching
-    if valid_keywords:
-        direct_matches = inventory_service.filter_inventory(df, valid_keywords)
-        if 0 < len(direct_matches) < 100:
-            log_debug(f"FAST PATH: {len(direct_matches)} coincidencias directas.")
-            results = direct_matches
-            fast_path_used = True
-
-    # 2. AI Path: Intent analysis
-    if not fast_path_used:
-        log_debug("AI PATH: Analizando intención de búsqueda...")
-        intent = await ai_service.analyze_intent(query)
-        log_debug(f"Intención: {intent}")
-        results = inventory_service.apply_intent_filters(df, intent)
-        log_debug(f"AI PATH: {len(results)} resultados encontrados.")
-
-        # Fallback if AI filtering fails but we have keywords
-        if results.empty and valid_keywords:
-            log_debug("AI PATH VACÍO: Aplicando fallback a palabras clave.")
-            results = inventory_service.filter_inventory(df, valid_keywords)
-            log_debug(f"Fallback: {len(results)} resultados.")
-
-    # 3. Format context and generate response
-    inventory_context = inventory_service.format_inventory_context(results)
+    # 1-2. Fast path (keywords) raced against the AI path (intent analysis)
+    results = await _search_inventory(query, df, valid_keywords, inventory_version)
+
+    if structured:
+        return {"results": results}
+
+    # 3. Format context within the target model's prompt budget and generate response
+    token_budget = ai_service.get_prompt_token_budget()
+    if token_budget:
+        token_budget = max(MIN_CONTEXT_TOKENS, token_budget - estimate_tokens(CLEO_PROMPT) - estimate_tokens(query) - PROMPT_WRAPPER_TOKENS)
+    inventory_context, omitted = await asyncio.to_thread(inventory_service.build_inventory_context, results, valid_keywords, token_budget)
     
     # Restore the v1.9.0 recommendation rule
     full_prompt = f"""
@@ -112,14 +183,99 @@ async def chat(query: str):
     REGLA: Si no hay inventario, sugiere productos similares si los ves, o di que no hay stock disponible.
     """
 
+    return {"prompt": full_prompt, "cache_query": cache_query, "inventory_version": inventory_version, "omitted": omitted}
+
+def _error_message(e: Exception) -> str:
+    error_msg = str(e)
+    if "429" in error_msg or "quota" in error_msg.lower():
+        return "Cleo ha alcanzado el límite de consultas. Por favor, espera unos minutos o añade más APIs."
+    if isinstance(e, (SchedulerQueueFull, SchedulerDeadlineExceeded)):
+        return "Cleo está atendiendo muchas consultas en este momento. Intenta de nuevo en unos segundos."
+    return "Lo siento, tuve un problema analizando el inventario."
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _structured_chat(query: str, commentary: bool) -> dict:
+    """Renders the product table in the backend; the LLM is only used for the optional commentary."""
+    prepared = await _prepare_chat(query, structured=True)
+    if "response" in prepared:
+        return prepared
+
+    # A broad query can match thousands of products: build only the first STRUCTURED_MAX_ROWS
+    # (most stock first), off the event loop, and report every match in `total`
+    results = prepared["results"]
+    total = int(results["Material"].nunique()) if not results.empty else 0
+    rows = await asyncio.to_thread(inventory_service.build_inventory_rows, results, STRUCTURED_MAX_ROWS)
+    table = inventory_service.render_markdown_table(rows)
+    if total > len(rows):
+        table += f"\n\nSe muestran {len(rows)} de {total} productos (los de más stock primero)."
+    note = await ai_service.generate_commentary(query, rows) if commentary and rows else ""
+    return {
+        "response": f"{table}\n\n{note}" if note else table,
+        "rows": rows,
+        "commentary": note or None,
+        "total": total,
+        "omitted": total - len(rows),
+        "mode": "structured"
+    }
+
+@router.get("/chat", dependencies=[Depends(require_ready)])
+async def chat(query: str, mode: str = CHAT_RESPONSE_MODE, commentary: bool = False):
+    """
+    mode=llm (default): Cleo writes the full answer.
+    mode=structured: the table is rendered deterministically and returned as JSON rows too.
+    """
+    if mode == "structured":
+        return await _structured_chat(query, commentary)
+
+    prepared = await _prepare_chat(query)
+    if "response" in prepared:
+        return prepared
+
     try:
-        response_text = await ai_service.generate_response(full_prompt)
+        response_text = await ai_service.generate_response(prepared["prompt"])
         if not response_text:
              return {"response": "Lo siento, el sistema de IA no está disponible."}
-        return {"response": response_text}
+        response_cache.set(prepared["cache_query"], prepared["inventory_version"], response_text)
+        return {"response": response_text, "omitted": prepared["omitted"]}
     except Exception as e:
         print(f"Error Cleo: {e}")
-        error_msg = str(e)
-        if "429" in error_msg or "quota" in error_msg.lower():
-            return {"response": "Cleo ha alcanzado el límite de consultas. Por favor, espera unos minutos o añade más APIs."}
-        return {"response": "Lo siento, tuve un problema analizando el inventario."}
+        return {"response": _error_message(e)}
+
+@router.get("/chat/stream", dependencies=[Depends(require_ready)])
+async def chat_stream(query: str):
+    """
+    Server-sent events variant of /chat.
+    Emits `token` events with text chunks as the provider generates them, then `done` (or `error`).
+    """
+    prepared = await _prepare_chat(query)
+
+    async def events():
+        if "response" in prepared:
+            yield _sse("token", {"text": prepared["response"]})
+            yield _sse("done", {"cached": prepared.get("cached", False)})
+            return
+
+        chunks = []
+        try:
+            async for chunk in ai_service.generate_response_stream(prepared["prompt"]):
+                chunks.append(chunk)
+                yield _sse("token", {"text": chunk})
+        except Exception as e:
+            print(f"Error Cleo (stream): {e}")
+            yield _sse("error", {"text": _error_message(e)})
+            return
+
+        response_text = "".join(chunks).strip()
+        if not response_text:
+            yield _sse("error", {"text": "Lo siento, el sistema de IA no está disponible."})
+            return
+        response_cache.set(prepared["cache_query"], prepared["inventory_version"], response_text)
+        yield _sse("done", {"cached": False, "omitted": prepared["omitted"]})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
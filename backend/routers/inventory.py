@@ -2,39 +2,33 @@ import os
 import shutil
 import pandas as pd
 from datetime import datetime
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from config import STORAGE_DIR
-from processor import process_inventory_pdf, rotate_inventories, get_latest_inventory
-from supabase_db import upload_inventory_pdf_to_supabase
+from processor import get_latest_inventory
+from readiness import require_ready
+import ingest_worker
+from ingest_worker import UPLOADS_DIR
 
 router = APIRouter()
 
-async def background_inventory_processing(file_path: str, filename: str):
-    """Heavy lifting done in the background to avoid HTTP timeouts"""
-    try:
-        rotate_inventories()
-        await process_inventory_pdf(file_path)
-        # Cloud Storage Upload (Raw PDF)
-        await upload_inventory_pdf_to_supabase(file_path, filename)
-        print(f"✓ Inventario {filename} procesado y sincronizado en segundo plano.")
-    except Exception as e:
-        print(f"✗ ERROR en procesamiento de fondo: {e}")
-
 @router.post("/upload-inventory")
-async def upload_inventory(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def upload_inventory(file: UploadFile = File(...)):
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Solo se permiten archivos PDF.")
     
-    file_path = os.path.join(STORAGE_DIR, file.filename)
+    # Staged in storage/uploads, invisible to get_latest_inventory until processed (see ingest_worker)
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    file_path = os.path.join(UPLOADS_DIR, file.filename)
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
-    # Add to background tasks
-    background_tasks.add_task(background_inventory_processing, file_path, file.filename)
+    # Queue the job for the ingest worker process (it waits in the queue if the worker is down)
+    job_id = ingest_worker.submit("inventory", {"file_path": file_path, "filename": file.filename})
     
     return {
         "message": "Archivo recibido. Cleo está actualizando el inventario en segundo plano. Podrás ver los cambios en unos segundos.",
-        "filename": file.filename
+        "filename": file.filename,
+        "job_id": job_id
     }
 
 @router.get("/inventory-metadata")
@@ -46,7 +40,7 @@ async def get_inventory_metadata():
         return {"last_update": dt.isoformat(), "status": "active"}
     return {"last_update": None, "status": "no_data"}
 
-@router.get("/find-product")
+@router.get("/find-product", dependencies=[Depends(require_ready)])
 async def find_product(material: str):
     try:
         df = await get_latest_inventory()
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, HTTPException
+import job_queue
+import ingest_worker
+
+router = APIRouter()
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Status, per-page progress, attempts and durations of a background job."""
+    job = job_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado.")
+    return job
+
+@router.get("/jobs")
+async def list_jobs(limit: int = 20, kind: str = None):
+    """Most recent jobs, plus whether the ingest worker process is alive."""
+    return {
+        "jobs": job_queue.list_jobs(limit=limit, kind=kind),
+        "worker_alive": ingest_worker.is_available(kind or "inventory")
+    }
@@ -1,94 +1,101 @@
-import os
-import json
-import pandas as pd
-from fastapi import APIRouter, HTTPException
-from config import KNOWLEDGE_FILE
+import time
+from fastapi import APIRouter, HTTPException, Depends
 from processor import get_latest_inventory
-from supabase_db import save_knowledge_to_db, get_knowledge_from_db
+from readiness import require_ready
+from supabase_db import save_knowledge_items_to_db, get_knowledge_from_db
+import knowledge_store
+import coordination
 
 router = APIRouter()
 
 @router.get("/knowledge")
 async def get_knowledge():
-    if not os.path.exists(KNOWLEDGE_FILE):
+    knowledge = knowledge_store.entries()
+    if not knowledge:
         try:
             cloud_knowledge = await get_knowledge_from_db()
             if cloud_knowledge:
-                with open(KNOWLEDGE_FILE, "w", encoding="utf-8") as f:
-                    json.dump(cloud_knowledge, f, indent=4, ensure_ascii=False)
+                async with coordination.locked("knowledge"):
+                    knowledge_store.merge_from_cloud(cloud_knowledge)
+                knowledge = knowledge_store.entries()
         except: pass
-        
-    try:
-        with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return []
+    return knowledge
 
 @router.post("/update-knowledge")
 async def update_knowledge(entry: dict):
     try:
-        with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        sku = entry.get("sku")
-        found = False
-        for i, item in enumerate(data):
-            if item.get("sku") == sku:
-                data[i] = entry
-                found = True
-                break
-        
-        if not found:
-            data.append(entry)
-            
-        with open(KNOWLEDGE_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+        async with coordination.locked("knowledge"):
+            knowledge_store.upsert(entry)
+            knowledge_store.save()
+        coordination.bump_version("knowledge")
             
-        # Sync to Supabase
-        await save_knowledge_to_db(data)
+        # Sync to Supabase (just this SKU)
+        await save_knowledge_items_to_db([entry])
             
         return {"message": "Conocimiento actualizado correctamente."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/apply-auto-tips")
+@router.post("/apply-auto-tips", dependencies=[Depends(require_ready)])
 async def apply_auto_tips(data: dict):
+    """
+    Applies one tip to every SKU of a category that has none: vectorized category mask,
+    set-based merge into the knowledge store, one file save and one Supabase upsert.
+    """
     category = data.get("category")
     tip = data.get("tip")
     if not category or not tip:
         raise HTTPException(status_code=400, detail="Categoría y tip son obligatorios.")
     
     try:
+        started = time.perf_counter()
         df = await get_latest_inventory()
-        mask = df['categoria'].astype(str).str.upper() == category.upper()
-        targets = df[mask]
+        mask = (df['categoria'].astype(str).str.upper() == category.upper()).to_numpy()
+        targets = df.loc[mask].drop_duplicates(subset=['Material'])
+        skus = targets['Material'].astype(str).to_numpy()
+        specs = targets['especificaciones'].to_numpy() if 'especificaciones' in targets else ['-'] * len(targets)
+        products = {sku: {"model": model, "specs": spec} for sku, model, spec in zip(skus, targets['Subproducto'].to_numpy(), specs)}
+        selected = time.perf_counter()
         
-        with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
-            expert_data = json.load(f)
-        
-        applied_count = 0
-        for _, row in targets.iterrows():
-            sku = str(row['Material'])
-            existing = next((item for item in expert_data if item.get("sku") == sku), None)
-            if existing:
-                if not existing.get("tip_venta") or existing.get("tip_venta") == "-":
-                    existing["tip_venta"] = tip
-                    applied_count += 1
-            else:
-                expert_data.append({
-                    "sku": sku,
-                    "model": row['Subproducto'],
-                    "specs": row.get('especificaciones', '-'),
-                    "tip_venta": tip
-                })
-                applied_count += 1
-        
-        with open(KNOWLEDGE_FILE, "w", encoding="utf-8") as f:
-            json.dump(expert_data, f, indent=4, ensure_ascii=False)
+        async with coordination.locked("knowledge"):
+            filled, created = knowledge_store.merge_tips(dict.fromkeys(products, tip), products)
+            if filled or created:
+                knowledge_store.save()
+        merged = time.perf_counter()
+        if filled or created:
+            coordination.bump_version("knowledge")
             
-        # Sync to Supabase
-        await save_knowledge_to_db(expert_data)
+            # Sync to Supabase (only the SKUs that changed)
+            await save_knowledge_items_to_db(filled + created)
+        finished = time.perf_counter()
             
-        return {"message": "Tips aplicados correctamente.", "applied": applied_count}
+        applied = len(filled) + len(created)
+        print(f"💡 Tip aplicado a {applied}/{len(products)} SKUs de {category} en {(finished - started) * 1000:.0f} ms.")
+        return {
+            "message": "Tips aplicados correctamente.",
+            "applied": applied,
+            "matched": len(products),
+            "filled": len(filled),
+            "created": len(created),
+            "skipped": len(products) - applied,
+            "timing_ms": {
+                "select": round((selected - started) * 1000, 1),
+                "merge": round((merged - selected) * 1000, 1),
+                "sync": round((finished - merged) * 1000, 1),
+                "total": round((finished - started) * 1000, 1)
+            }
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/generate-missing-tips")
+async def generate_missing_tips(data: dict = None):
+    """Starts (or reports) the background job that precomputes tips for SKUs without one."""
+    from tip_job import start_tip_job
+    resume = (data or {}).get("resume", True)
+    return start_tip_job(resume=resume)
+
+@router.get("/generate-missing-tips/status")
+async def generate_missing_tips_status():
+    from tip_job import get_tip_job_status
+    return get_tip_job_status()
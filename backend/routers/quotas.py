@@ -1,82 +1,111 @@
 import os
+import time
 import shutil
 import json
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from config import STORAGE_DIR
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from config import STORAGE_DIR, QUOTA_MAPPING_FILE
+import quota_store
+import quota_engine
+import ingest_worker
+from ingest_worker import UPLOADS_DIR
 
 router = APIRouter()
 
-@router.get("/quotas")
-async def get_quotas_mapping():
-    """Returns the mapping of Material ID -> Installment Plans"""
-    mapping_file = os.path.join(STORAGE_DIR, "quota_mapping.json")
-    
-    # 1. Sync from Supabase if local is missing
-    if not os.path.exists(mapping_file):
-        from supabase_db import get_quotas_from_db
-        try:
-            cloud_mapping = await get_quotas_from_db()
-            if cloud_mapping:
-                with open(mapping_file, "w", encoding="utf-8") as f:
-                    json.dump(cloud_mapping, f, indent=2)
-                return cloud_mapping
-        except: pass
+MAX_LOOKUP_MATERIALS = 500
 
+async def _ensure_local_mapping():
+    """Restores quota_mapping.json from Supabase if it is missing locally."""
+    mapping_file = QUOTA_MAPPING_FILE
     if os.path.exists(mapping_file):
-        with open(mapping_file, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+        return
+    from supabase_db import get_quotas_from_db
+    try:
+        cloud_mapping = await get_quotas_from_db()
+        if cloud_mapping:
+            tmp_file = f"{mapping_file}.{os.getpid()}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(cloud_mapping, f, indent=2)
+            os.replace(tmp_file, mapping_file)
+    except: pass
+
+@router.get("/quotas")
+async def get_quotas_mapping(request: Request):
+    """Returns the mapping of Material ID -> Installment Plans (304 if the client's ETag is current)"""
+    await _ensure_local_mapping()
+    etag = quota_store.version()
+    if etag and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=quota_store.get_mapping(), headers={"ETag": etag} if etag else None)
+
+@router.get("/quotas/summary")
+async def get_quotas_summary():
+    """Size and version of the quota book, without the book itself"""
+    await _ensure_local_mapping()
+    return {"count": len(quota_store.get_mapping()), "version": quota_store.version()}
+
+@router.post("/quotas/lookup")
+async def lookup_quotas(data: dict):
+    """Batch lookup: {"materials": [...]} -> plans for just those materials"""
+    materials = data.get("materials") or []
+    if not isinstance(materials, list):
+        raise HTTPException(status_code=400, detail="'materials' debe ser una lista.")
+    if len(materials) > MAX_LOOKUP_MATERIALS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_LOOKUP_MATERIALS} materiales por consulta.")
+    await _ensure_local_mapping()
+    return {"version": quota_store.version(), "quotas": quota_store.lookup(materials)}
+
+@router.get("/quotas/rates")
+async def get_quota_rates():
+    """Monthly rates per term (overall and per category) inferred from cuotas.xlsx"""
+    table = quota_engine.load_rate_table()
+    if table is None:
+        raise HTTPException(status_code=404, detail="Aún no hay tabla de tasas. Sube o reprocesa cuotas.xlsx.")
+    return table
+
+@router.post("/quotas/compute")
+async def compute_quotas(data: dict):
+    """
+    Estimated installments for any price:
+    {"items": [{"material", "price", "category"?}], "down_payment"?} -> {material: {months: cuota}}
+    """
+    items = data.get("items") or []
+    if not isinstance(items, list) or len(items) > MAX_LOOKUP_MATERIALS:
+        raise HTTPException(status_code=400, detail=f"'items' debe ser una lista de máximo {MAX_LOOKUP_MATERIALS} elementos.")
+    if quota_engine.load_rate_table() is None:
+        raise HTTPException(status_code=404, detail="Aún no hay tabla de tasas. Sube o reprocesa cuotas.xlsx.")
+    try:
+        prices = [float(item.get("price") or 0) for item in items]
+        # Without a down payment the category's typical initial payment is assumed
+        down_payment = float(data["down_payment"]) if data.get("down_payment") is not None else None
+    except (TypeError, ValueError, AttributeError):
+        raise HTTPException(status_code=400, detail="Precios inválidos.")
+    plans = quota_engine.compute(prices, [item.get("category") for item in items], down_payment)
+    return {
+        "estimated": True,
+        "quotas": {str(item.get("material", i)): p for i, (item, p) in enumerate(zip(items, plans)) if p}
+    }
 
 @router.post("/upload-quotas")
-async def upload_quotas(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
-    """Upload cuotas.xlsx and auto-process it"""
+async def upload_quotas(file: UploadFile = File(...)):
+    """Upload cuotas.xlsx and queue its processing (poll GET /jobs/{job_id})"""
     if not file.filename.endswith(".xlsx"):
         raise HTTPException(status_code=400, detail="Solo se permiten archivos .xlsx")
     
-    quotas_path = os.path.join(STORAGE_DIR, "cuotas.xlsx")
-    with open(quotas_path, "wb") as buffer:
+    # Staged until it parses: a broken workbook never replaces the current cuotas.xlsx
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    staged_path = os.path.join(UPLOADS_DIR, f"cuotas-{int(time.time() * 1000)}.xlsx")
+    with open(staged_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
-    try:
-        from process_quotas import process_quotas
-        process_quotas()
-        
-        mapping_file = os.path.join(STORAGE_DIR, "quota_mapping.json")
-        if os.path.exists(mapping_file):
-            with open(mapping_file, "r", encoding="utf-8") as f:
-                result = json.load(f)
-            
-            # Sync to Supabase in background
-            from supabase_db import save_quotas_to_db, upload_inventory_pdf_to_supabase # We reuse upload_inventory_pdf_to_supabase for xlsx or specific one
-            from fastapi import BackgroundTasks
-            
-            # Let's add a specialized xlsx upload if needed, or reuse
-            from supabase_db import upload_spec_to_supabase # Storage logic is generic enough
-            
-            # Save mapping to DB
-            background_tasks.add_task(save_quotas_to_db, result)
-            # Save raw file to storage (bucket: inventories or a new one)
-            background_tasks.add_task(upload_spec_to_supabase, quotas_path, "cuotas.xlsx")
-            
-            return {"message": f"Cuotas procesadas exitosamente. {len(result)} equipos mapeados.", "count": len(result)}
-        return {"message": "Archivo subido pero no se pudo procesar.", "count": 0}
-    except Exception as e:
-        return {"message": f"Archivo subido. Error al procesar: {str(e)}", "count": 0}
+    job_id = ingest_worker.submit("quotas", {"file_path": staged_path, "filename": file.filename})
+    return {"message": "Archivo recibido. Procesando cuotas en segundo plano...", "job_id": job_id}
 
 @router.post("/process-quotas")
 async def trigger_process_quotas():
-    """Re-run quota processing with existing cuotas.xlsx"""
+    """Re-run quota processing with existing cuotas.xlsx (poll GET /jobs/{job_id})"""
     quotas_path = os.path.join(STORAGE_DIR, "cuotas.xlsx")
     if not os.path.exists(quotas_path):
         raise HTTPException(status_code=404, detail="No hay archivo cuotas.xlsx en el servidor.")
-    try:
-        from process_quotas import process_quotas
-        process_quotas()
-        mapping_file = os.path.join(STORAGE_DIR, "quota_mapping.json")
-        if os.path.exists(mapping_file):
-            with open(mapping_file, "r", encoding="utf-8") as f:
-                result = json.load(f)
-            return {"message": f"Cuotas reprocesadas. {len(result)} equipos mapeados.", "count": len(result)}
-        return {"message": "Error: no se generó el archivo de mapeo.", "count": 0}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    job_id = ingest_worker.submit("quotas", {"file_path": quotas_path, "filename": "cuotas.xlsx"})
+    return {"message": "Reprocesando cuotas en segundo plano...", "job_id": job_id}
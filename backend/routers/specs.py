@@ -2,11 +2,14 @@ import os
 import json
 import asyncio
 import shutil
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from fastapi.responses import FileResponse, RedirectResponse
 from config import STORAGE_DIR, SPECS_DIR, SPECS_MAPPING_FILE
 from processor import get_latest_inventory
-from utils import resolve_spec_match, clear_spec_cache
+from readiness import require_ready
+from utils import resolve_spec_match
+import shared_snapshot
+import coordination
 from supabase_db import (
     get_spec_url_supabase, 
     list_specs_supabase, 
@@ -69,7 +72,8 @@ async def link_spec(data: dict):
     if not material_id or not filename:
         raise HTTPException(status_code=400, detail="Faltan material_id o filename.")
     
-    async with _mapping_lock:
+    # Process-local lock + file lock: other workers may be editing the same mapping file
+    async with _mapping_lock, coordination.locked("specs_mapping"):
         try:
             mapping = {}
             if os.path.exists(SPECS_MAPPING_FILE):
@@ -81,21 +85,28 @@ async def link_spec(data: dict):
             with open(SPECS_MAPPING_FILE, "w", encoding="utf-8") as f:
                 json.dump(mapping, f, indent=4, ensure_ascii=False)
                 
-            # Invalidate caches
-            clear_spec_cache()
-            
             # Persist to Supabase
             await save_specs_mapping_to_db(mapping)
             
             cache_file = os.path.join(STORAGE_DIR, "specs_resolved_cache.json")
             if os.path.exists(cache_file):
                 os.remove(cache_file)
+
+            # Invalidate caches in every worker
+            coordination.bump_version("specs")
                 
             return {"message": f"Material {material_id} vinculado correctamente a {filename}"}
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error al guardar el vínculo: {str(e)}")
 
-@router.get("/specs-mapping")
+def _spec_sources_info(inv_file: str) -> dict:
+    """Mtimes the resolved spec table depends on (inventory + manual links)."""
+    return {
+        "inventory_mtime": os.path.getmtime(inv_file) if os.path.exists(inv_file) else 0,
+        "mapping_mtime": os.path.getmtime(SPECS_MAPPING_FILE) if os.path.exists(SPECS_MAPPING_FILE) else 0
+    }
+
+@router.get("/specs-mapping", dependencies=[Depends(require_ready)])
 async def get_specs_mapping():
     """Endpoint for frontend to get the resolved MaterialID -> Filename map."""
     df = await get_latest_inventory()
@@ -103,6 +114,12 @@ async def get_specs_mapping():
     
     cache_file = os.path.join(STORAGE_DIR, "specs_resolved_cache.json")
     inv_file = os.path.join(STORAGE_DIR, "processed_inventory.json")
+
+    # 0. Shared snapshot table (mapped once for all workers), valid while inventory and manual links are unchanged
+    source_info = _spec_sources_info(inv_file)
+    shared, meta = shared_snapshot.load_spec_matches()
+    if shared is not None and all(meta.get(k) == v for k, v in source_info.items()):
+        return shared
     
     # 1. Try persistent disk cache first (fastest) - OUTSIDE LOCK
     if os.path.exists(cache_file) and os.path.exists(inv_file):
@@ -151,6 +168,7 @@ async def get_specs_mapping():
         with open(cache_file, "w", encoding="utf-8") as f:
             # Add a meta field for versioning the whole mapping if useful
             json.dump(resolved, f, indent=4)
+        shared_snapshot.publish(spec_matches=resolved, spec_info=_spec_sources_info(inv_file))
     except Exception as e:
         print(f"Cache write error: {e}")
 
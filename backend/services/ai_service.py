@@ -1,5 +1,10 @@
+import os
 import json
-from config import get_ai_pool
+import asyncio
+from config import get_ai_pool, OFFICIAL_CATEGORIES
+from llm_scheduler import Priority
+
+DEFAULT_SALES_TIP = "Destaca la excelente relación calidad-precio y la garantía de Claro."
 
 class AIService:
     @staticmethod
@@ -10,6 +15,43 @@ class AIService:
             return ""
         return await pool.generate(prompt)
 
+    @staticmethod
+    def get_prompt_token_budget() -> int:
+        """Prompt token budget that fits any provider the pool may use for the next call."""
+        pool = get_ai_pool()
+        return pool.get_prompt_token_budget() if pool else None
+
+    @staticmethod
+    async def generate_response_stream(prompt: str):
+        """Streams a response from the AI pool chunk by chunk."""
+        pool = get_ai_pool()
+        if not pool:
+            return
+        async for chunk in pool.generate_stream(prompt):
+            yield chunk
+
+    @staticmethod
+    async def generate_commentary(query: str, rows: list) -> str:
+        """Short optional commentary for a table the backend already rendered."""
+        summary = "\n".join(
+            f"- {r['Subproducto']} | {r['Precio Contado']} | {r['CantDisponible']} und" for r in rows[:10]
+        )
+        prompt = f"""
+        Eres Cleo, asistente de ventas de Claro Tecnología TMK.
+        El asesor buscó: "{query}". Se encontraron {len(rows)} productos; los primeros son:
+        {summary}
+
+        Escribe UN comentario breve (máximo 30 palabras) con la recomendación más útil para vender.
+        No repitas la tabla, no saludes. Responde ÚNICAMENTE con el comentario.
+        """
+        try:
+            pool = get_ai_pool()
+            if pool:
+                return (await pool.generate(prompt)).strip()
+        except Exception as e:
+            print(f"Error AIService.generate_commentary: {e}")
+        return ""
+
     @staticmethod
     async def analyze_intent(query: str) -> dict:
         """Analyzes the user's search intent."""
@@ -17,7 +59,7 @@ class AIService:
         Eres un experto en clasificar intenciones de búsqueda para un inventario de tecnología.
         
         CAMPOS DISPONIBLES EN BD:
-        - categoria: OBLIGATORIO usar EXACTAMENTE uno de estos valores: TELEVISOR, AUDIFONOS, CONSOLA, TABLET, ASPIRADORA, PATINETA, BARRA SONIDO, PORTATIL, TORRE SONIDO, SMARTWATCH, PARLANTE, COMBO, CAMARA, COMPUTADOR, CELULAR. (Si no coincide, usa null).
+        - categoria: OBLIGATORIO usar EXACTAMENTE uno de estos valores: {', '.join(OFFICIAL_CATEGORIES)}. (Si no coincide, usa null).
         - marca: (Samsung, Apple, HP, Lenovo, Xiaomi, Huawei, Honor, Sony, etc.)
         - modelo: (Referencia específica o palabras clave del producto)
         
@@ -51,7 +93,7 @@ class AIService:
         try:
             pool = get_ai_pool()
             if pool:
-                response_text = await pool.generate(intent_prompt)
+                response_text = await pool.generate(intent_prompt, priority=Priority.INTENT)
                 if "```json" in response_text:
                     response_text = response_text.split("```json")[1].split("```")[0].strip()
                 elif "```" in response_text:
@@ -64,56 +106,144 @@ class AIService:
 
     @staticmethod
     async def generate_sales_tip(model_name: str, specs: str) -> str:
-        """Generates a brief sales tip for a product."""
+        """Generates a brief sales tip for a product (coalesced with concurrent requests into one LLM call)."""
+        return await _tip_batcher.submit(model_name, specs)
+
+    @staticmethod
+    async def generate_sales_tips_batch(items: list, priority: Priority = Priority.BACKGROUND) -> list:
+        """
+        Generates tips for several products with a single structured prompt.
+        items: [{"model": ..., "specs": ...}]. Returns tips aligned with items ("" where missing).
+        Bulk callers (tip job) run as background; /generate-tip passes INTERACTIVE.
+        """
+        pool = get_ai_pool()
+        if not items or not pool:
+            return [""] * len(items)
+
+        products = {str(i): {"producto": it.get("model"), "especificaciones": it.get("specs") or "No disponibles"}
+                    for i, it in enumerate(items)}
         prompt = f"""
-        Eres un experto en ventas de tecnología para Claro. 
-        Crea un "Tip de Venta" o "Speech" breve (máximo 20 palabras) para este producto:
-        PRODUCTO: {model_name}
-        ESPECIFICACIONES: {specs if specs else 'No disponibles'}
-        
+        Eres un experto en ventas de tecnología para Claro.
+        Crea un "Tip de Venta" o "Speech" breve (máximo 20 palabras) para CADA producto de esta lista.
         El tip debe ser persuasivo, técnico pero fácil de entender, y resaltar un beneficio clave.
-        Responde ÚNICAMENTE con el texto del tip, sin comillas ni introducciones.
+
+        PRODUCTOS: {json.dumps(products, ensure_ascii=False)}
+
+        Responde ÚNICAMENTE en JSON con el mismo id como llave y el texto del tip como valor.
+        Ejemplo: {{"0": "tip del producto 0", "1": "tip del producto 1"}}
         """
-        
+
         try:
-            pool = get_ai_pool()
-            if pool:
-                response = await pool.generate(prompt)
-                return response.strip()
+            response_text = await pool.generate(prompt, priority=priority)
+            if "```json" in response_text:
+                response_text = response_text.split("```json")[1].split("```")[0].strip()
+            elif "```" in response_text:
+                response_text = response_text.split("```")[1].split("```")[0].strip()
+            tips = json.loads(response_text)
+            return [str(tips.get(str(i)) or "").strip().strip('"') for i in range(len(items))]
         except Exception as e:
-            print(f"Error AIService.generate_sales_tip: {e}")
-            
-        return "Destaca la excelente relación calidad-precio y la garantía de Claro."
+            print(f"Error AIService.generate_sales_tips_batch: {e}")
+
+        return [""] * len(items)
 
     @staticmethod
     async def normalize_products_batch(descriptions: list) -> dict:
-        """Normalizes product descriptions in batch."""
-        pool = get_ai_pool()
-        if not descriptions or not pool:
+        """
+        Normalizes product descriptions in batch (marca, modelo_limpio, especificaciones).
+        Raises on provider errors (including no pool configured) and on an answer that is not
+        valid JSON (e.g. cut off at the provider's output limit), so the caller can tell the two apart.
+        """
+        if not descriptions:
             return {}
+        pool = get_ai_pool()
+        if not pool:
+            raise RuntimeError("AI Pool no disponible")
 
         prompt = """
         Analiza esta lista de descripciones de productos tecnológicos.
         Para cada uno, extrae:
-        - categoria: (TV, Celular, Laptop, Reloj, Audífonos, Parlante, Patineta, Tablet, Accesorio, Otro)
         - marca: La marca (Samsung, Huawei, etc.)
         - modelo_limpio: Nombre del modelo
-        - especificaciones: Características clave
-        - tip_venta: Un argumento de venta breve (máx 15 palabras) resaltando una ventaja técnica clave.
+        - especificaciones: Características clave (máx 12 palabras)
         Responde ÚNICAMENTE en JSON con las descripciones originales como llaves.
         LISTA: """ + json.dumps(descriptions)
 
+        response_text = await pool.generate(prompt, priority=Priority.BACKGROUND)
+        if "```json" in response_text:
+            response_text = response_text.split("```json")[1].split("```")[0].strip()
+        elif "```" in response_text:
+            response_text = response_text.split("```")[1].split("```")[0].strip()
         try:
-            pool = get_ai_pool()
-            response_text = await pool.generate(prompt)
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
             return json.loads(response_text)
+        except json.JSONDecodeError as e:
+            print(f"Error AIService.normalize_products_batch: respuesta no es JSON ({len(response_text)} chars): {e}")
+            raise
+
+class TipBatcher:
+    """
+    Micro-batches sales tip requests: calls arriving within `window_ms` are sent as one
+    multi-product prompt and identical in-flight requests share the same result.
+    """
+    def __init__(self, window_ms: float = 50, max_batch: int = 25):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._inflight = {}   # (model, specs) -> Future
+        self._queue = []
+        self._flush_task = None
+        self._tasks = set()   # Strong references: the loop only keeps weak ones to running tasks
+        self.stats = {"requests": 0, "deduplicated": 0, "batches": 0}
+
+    async def submit(self, model_name: str, specs: str) -> str:
+        self.stats["requests"] += 1
+        key = (str(model_name).strip().upper(), str(specs or "").strip().upper())
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            self._queue.append((key, model_name, specs))
+            if len(self._queue) >= self.max_batch:
+                self._flush()
+            elif self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_later())
+        else:
+            self.stats["deduplicated"] += 1
+        return await asyncio.shield(future)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._flush_task = None
+        self._flush()
+
+    def _flush(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        batch, self._queue = self._queue, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list):
+        """Resolves every future of the batch, whatever happens (error, short answer, cancellation)."""
+        self.stats["batches"] += 1
+        tips = []
+        try:
+            tips = await AIService.generate_sales_tips_batch([{"model": m, "specs": sp} for _, m, sp in batch],
+                                                             priority=Priority.INTERACTIVE)
         except Exception as e:
-            print(f"Error AIService.normalize_products_batch: {e}")
-            
-        return {}
+            print(f"Error TipBatcher: {e}")
+        finally:
+            tips = list(tips or [])
+            for i, (key, _, _) in enumerate(batch):
+                future = self._inflight.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_result((tips[i] if i < len(tips) else None) or DEFAULT_SALES_TIP)
+
+
+_tip_batcher = TipBatcher(
+    window_ms=float(os.getenv("TIP_BATCH_WINDOW_MS", "50")),
+    max_batch=int(os.getenv("TIP_BATCH_MAX_SIZE", "25"))
+)
 
 ai_service = AIService()
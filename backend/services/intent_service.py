@@ -0,0 +1,174 @@
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+import pandas as pd
+from config import SYNONYMS, OFFICIAL_CATEGORIES
+from processor import BRAND_KEYWORDS
+from utils import log_debug
+import coordination
+from services.ai_service import ai_service
+
+# Query tokens (after SYNONYMS) -> official category
+CATEGORY_KEYWORDS = {
+    "tv": "TELEVISOR", "televisor": "TELEVISOR", "televisores": "TELEVISOR", "television": "TELEVISOR",
+    "aud": "AUDIFONOS", "audifono": "AUDIFONOS", "audifonos": "AUDIFONOS", "audf": "AUDIFONOS",
+    "reloj": "SMARTWATCH", "relojes": "SMARTWATCH", "smartwatch": "SMARTWATCH",
+    "prt": "PORTATIL", "portatil": "PORTATIL", "laptop": "PORTATIL", "compu": "PORTATIL",
+    "pc": "COMPUTADOR", "computador": "COMPUTADOR", "computadores": "COMPUTADOR",
+    "tab": "TABLET", "tablet": "TABLET", "tableta": "TABLET", "ipad": "TABLET",
+    "celular": "CELULAR", "telefono": "CELULAR", "smartphone": "CELULAR", "iphone": "CELULAR",
+    "ptn": "PATINETA", "patineta": "PATINETA", "scooter": "PATINETA",
+    "barra": "BARRA SONIDO", "torre": "TORRE SONIDO", "parlante": "PARLANTE", "bafle": "PARLANTE",
+    "consola": "CONSOLA", "ps5": "CONSOLA", "xbox": "CONSOLA", "nintendo": "CONSOLA",
+    "aspiradora": "ASPIRADORA", "camara": "CAMARA", "combo": "COMBO",
+}
+for _cat in OFFICIAL_CATEGORIES:
+    CATEGORY_KEYWORDS.setdefault(_cat.split()[0].lower(), _cat)
+
+STOP_WORDS = {"de", "con", "el", "la", "los", "las", "un", "una", "en", "para", "por", "y", "smart", "pulgadas", "pulgada"}
+
+
+class IntentService:
+    """
+    Resolves search intent (categoria/marca/modelo) locally from known vocabulary and
+    only asks the LLM (AIService.analyze_intent) when the local confidence is low.
+    Both paths are memoized.
+    """
+    def __init__(self, min_confidence: float = 0.6, max_entries: int = 512):
+        self.min_confidence = min_confidence
+        self.max_entries = max_entries
+        self._local_memo: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._llm_memo: "OrderedDict[str, dict]" = OrderedDict()
+        self._vocab = None
+        self._vocab_version = None
+        self.stats = {"local": 0, "llm": 0, "memo_hits": 0}
+
+    @staticmethod
+    def _tokenize(query: str) -> list:
+        text = unicodedata.normalize("NFKD", str(query).lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        text = re.sub(r'\s*(pulgadas|pulgada|pulgs)\b', '"', text)
+        tokens = []
+        for t in re.sub(r'[^\w\s"]', ' ', text).split():
+            # Glued forms like "tv55" or "tab11"
+            m = re.fullmatch(r'([a-z]+)(\d+"?)', t)
+            if m and m.group(1) in CATEGORY_KEYWORDS:
+                tokens.extend([m.group(1), m.group(2)])
+            elif t not in STOP_WORDS:
+                tokens.append(t)
+        return tokens
+
+    def _build_vocabulary(self, df: pd.DataFrame, inventory_version):
+        """Distinct categories, brands and model words present in the current inventory."""
+        if self._vocab is not None and self._vocab_version == inventory_version:
+            return self._vocab
+
+        categories = set(df["categoria"].dropna().astype(str).str.upper().unique()) if "categoria" in df.columns else set()
+        brands = {b.lower(): b for b in df["marca"].dropna().astype(str).unique() if b and b != "N/A"} if "marca" in df.columns else {}
+        inventory_brands = set(brands)
+        for k, v in BRAND_KEYWORDS.items():
+            brands.setdefault(k.lower(), v)
+        words = set()
+        if "Subproducto" in df.columns:
+            words = set(df["Subproducto"].astype(str).str.lower().str.split().explode().dropna().unique())
+
+        self._vocab = {"categories": categories, "brands": brands, "inventory_brands": inventory_brands, "words": words}
+        self._vocab_version = inventory_version
+        return self._vocab
+
+    def classify_local(self, query: str, df: pd.DataFrame, inventory_version=None) -> tuple:
+        """Rule-based intent. Returns (intent, confidence between 0 and 1)."""
+        vocab = self._build_vocabulary(df, inventory_version)
+        intent = {"categoria": None, "marca": None, "modelo": None, "intencion_general": "local"}
+        confidence = 0.0
+        model_tokens, unknown = [], 0
+
+        for token in self._tokenize(query):
+            base = token.rstrip('s') if token.endswith('s') and len(token) > 3 else token
+            mapped = SYNONYMS.get(base, SYNONYMS.get(token, base))
+
+            category = CATEGORY_KEYWORDS.get(token) or CATEGORY_KEYWORDS.get(base) or CATEGORY_KEYWORDS.get(mapped)
+            brand = vocab["brands"].get(token) or vocab["brands"].get(mapped)
+
+            if category and not intent["categoria"]:
+                intent["categoria"] = category
+                if token == "iphone":
+                    model_tokens.append(token)
+            if brand and not intent["marca"]:
+                intent["marca"] = brand
+            if category or brand:
+                continue
+
+            if mapped != token and mapped in vocab["words"]:
+                model_tokens.append(mapped)
+            elif any(c.isdigit() for c in token) or token in vocab["words"]:
+                model_tokens.append(token)
+            else:
+                unknown += 1
+
+        if intent["categoria"]:
+            confidence += 0.45
+            if any(intent["categoria"] in c or c in intent["categoria"] for c in vocab["categories"]):
+                confidence += 0.15
+        if intent["marca"]:
+            confidence += 0.35
+            if intent["marca"].lower() in vocab["inventory_brands"]:
+                confidence += 0.1
+        if intent["categoria"] or intent["marca"]:
+            confidence += 0.2 if unknown == 0 else -0.25 * unknown
+
+        if model_tokens:
+            if intent["categoria"] == "TELEVISOR":
+                model_tokens = [t + '"' if t.isdigit() else t for t in model_tokens]
+            intent["modelo"] = " ".join(model_tokens)
+
+        return intent, max(0.0, min(1.0, confidence))
+
+    def is_ambiguous(self, query: str, df: pd.DataFrame, inventory_version=None) -> bool:
+        """True when resolve_intent would have to ask the LLM (not memoized, low local confidence)."""
+        norm_query = " ".join(self._tokenize(query))
+        if (norm_query, str(inventory_version)) in self._local_memo or norm_query in self._llm_memo:
+            return False
+        return self.classify_local(query, df, inventory_version)[1] < self.min_confidence
+
+    def _remember(self, memo: OrderedDict, key, value):
+        memo[key] = value
+        memo.move_to_end(key)
+        while len(memo) > self.max_entries:
+            memo.popitem(last=False)
+
+    async def resolve_intent(self, query: str, df: pd.DataFrame, inventory_version=None) -> dict:
+        """Local classification first; LLM only when confidence is below min_confidence."""
+        norm_query = " ".join(self._tokenize(query))
+        key = (norm_query, str(inventory_version))
+        if key in self._local_memo:
+            self.stats["memo_hits"] += 1
+            self._local_memo.move_to_end(key)
+            return self._local_memo[key]
+        if norm_query in self._llm_memo:
+            self.stats["memo_hits"] += 1
+            self._llm_memo.move_to_end(norm_query)
+            return self._llm_memo[norm_query]
+
+        intent, confidence = self.classify_local(query, df, inventory_version)
+        log_debug(f"INTENT LOCAL: {intent} (confianza {confidence:.2f})")
+        if confidence >= self.min_confidence:
+            self.stats["local"] += 1
+            self._remember(self._local_memo, key, intent)
+            return intent
+
+        self.stats["llm"] += 1
+        intent = await ai_service.analyze_intent(query)
+        if any(intent.get(k) for k in ("categoria", "marca", "modelo")):
+            self._remember(self._llm_memo, norm_query, intent)
+        return intent
+
+    def clear(self):
+        self._local_memo.clear()
+        self._vocab = None
+        self._vocab_version = None
+
+
+intent_service = IntentService(min_confidence=float(os.getenv("INTENT_LOCAL_MIN_CONFIDENCE", "0.6")))
+coordination.register_invalidator(lambda reason: intent_service.clear(), ["inventory"])
@@ -1,8 +1,11 @@
 import os
 import json
 import pandas as pd
-from config import STORAGE_DIR, SPECS_DIR, KNOWLEDGE_FILE, SPECS_MAPPING_FILE, QUOTA_MAPPING_FILE
-from utils import normalize_str, resolve_spec_match, log_debug
+from config import STORAGE_DIR, SPECS_DIR, SPECS_MAPPING_FILE
+from utils import normalize_str, resolve_spec_match, log_debug, estimate_tokens
+import quota_store
+import quota_engine
+import knowledge_store
 
 class InventoryService:
     @staticmethod
@@ -15,6 +18,12 @@ class InventoryService:
         from processor import get_latest_inventory
         return await get_latest_inventory()
 
+    @staticmethod
+    def get_inventory_version():
+        """Returns the version of the inventory snapshot currently loaded."""
+        from processor import get_inventory_version
+        return get_inventory_version()
+
     @staticmethod
     def filter_inventory(df: pd.DataFrame, valid_keywords: list) -> pd.DataFrame:
         """Filters the inventory based on keywords."""
@@ -73,40 +82,37 @@ class InventoryService:
         return results
 
     @staticmethod
-    def format_inventory_context(results: pd.DataFrame) -> str:
-        """Formats the filtered inventory results into a human-readable string for the AI prompt."""
+    def build_inventory_rows(results: pd.DataFrame, limit: int = 500) -> list:
+        """
+        Enriches the filtered inventory (ficha, imagen, tip, cuotas) into one dict per product.
+        Shared by the LLM context and the deterministic table renderer.
+        """
         if results.empty:
-            return "No se encontraron productos que coincidan exactamente con la búsqueda."
+            return []
 
         try:
             available_specs = os.listdir(SPECS_DIR)
             with open(SPECS_MAPPING_FILE, "r", encoding="utf-8") as f:
                 manual_map = json.load(f)
-            with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
-                expert_data = json.load(f)
-                expert_tips = {item['sku']: item.get('tip_venta') for item in expert_data if item.get('tip_venta')}
-            
-            quotas_map = {}
-            if os.path.exists(QUOTA_MAPPING_FILE):
-                with open(QUOTA_MAPPING_FILE, "r", encoding="utf-8") as f:
-                    quotas_map = json.load(f)
+            expert_tips = knowledge_store.tips()
         except:
-            available_specs, manual_map, expert_tips, quotas_map = [], {}, {}, {}
+            available_specs, manual_map, expert_tips = [], {}, {}
 
         # Sort and limit
         results = results.sort_values(by=["CantDisponible"], ascending=False)
         results = results.drop_duplicates(subset=["Material"], keep="first")
-        results = results.sort_values(by=["CantDisponible", "Precio Contado"], ascending=[False, False]).head(500)
+        results = results.sort_values(by=["CantDisponible", "Precio Contado"], ascending=[False, False])
+        if limit:
+            results = results.head(limit)
         
-        inventory_context = ""
+        rows = []
         for _, item in results.iterrows():
             match = resolve_spec_match(item['Material'], item['Subproducto'], available_specs, manual_map)
-            has_image = "NO"
+            has_image = False
             if match and isinstance(match, str):
                 if any(match.lower().endswith(ext) for ext in [".jpg", ".jpeg", ".png", ".webp"]):
-                    has_image = "SI"
+                    has_image = True
             
-            ficha_tag = "SI" if match else "NO"
             try:
                 raw_price = item.get('Precio Contado', 0)
                 precio = f"${float(raw_price):,.0f}" if pd.notnull(raw_price) and str(raw_price).replace('.','',1).isdigit() else str(raw_price)
@@ -119,17 +125,137 @@ class InventoryService:
             try: stock_val = int(float(item.get('CantDisponible', 0)))
             except: stock_val = 0
 
-            # Get quotas for this material
-            mat_id_str = str(item['Material'])
-            item_quotas = quotas_map.get(mat_id_str) or quotas_map.get(mat_id_str.strip().lstrip('0'))
+            # Get quotas for this material (estimated from the rate table if it is not in the book)
+            item_quotas = quota_store.find(sku_str)
+            quotas_estimated = False
+            if not item_quotas:
+                item_quotas = quota_engine.estimate(item.get('Precio Contado'), item.get('categoria'))
+                quotas_estimated = bool(item_quotas)
             quotas_info = "N/A"
             if item_quotas:
                 # Format: 6:$X, 12:$Y...
                 quotas_info = ", ".join([f"{m}m: ${val:,.0f}" for m, val in item_quotas.items()])
+                if quotas_estimated:
+                    quotas_info += " (estimadas)"
 
-            line = f"- [ID: {item['Material']}] MODELO: {item['Subproducto']} | FICHA: {ficha_tag} | IMG: {has_image} | CATEGORIA: {item['categoria']} | MARCA: {item['marca']} | DESC: {item.get('especificaciones', '-')} | STOCK: {stock_val} | PRECIO CONTADO: {precio} | CUOTAS: {quotas_info} | TIP: {final_tip}\n"
-            inventory_context += line
-            
-        return inventory_context
+            def clean(v):
+                return "-" if v is None or (isinstance(v, float) and pd.isna(v)) else v
+
+            rows.append({
+                "Material": sku_str,
+                "Subproducto": clean(item['Subproducto']),
+                "categoria": clean(item['categoria']),
+                "Marca": clean(item['marca']),
+                "Caracteristicas": clean(item.get('especificaciones', '-')),
+                "CantDisponible": stock_val,
+                "Precio Contado": precio,
+                "cuotas": item_quotas or None,
+                "cuotas_estimadas": quotas_estimated,
+                "cuotas_texto": quotas_info,
+                "ficha": match if isinstance(match, str) else None,
+                "hasSpec": bool(match),
+                "hasImage": has_image,
+                "tip": final_tip
+            })
+        return rows
+
+    @staticmethod
+    def build_inventory_context(results: pd.DataFrame, keywords: list = None, token_budget: int = None) -> tuple:
+        """
+        Builds the prompt context within a token budget.
+        Rows are ranked by keyword relevance and stock, fields shared by every row are stated once,
+        empty fields are dropped. Returns (context, omitted_rows).
+        """
+        if results.empty:
+            return "No se encontraron productos que coincidan exactamente con la búsqueda.", 0
+
+        rows = InventoryService.build_inventory_rows(results)
+
+        # Relevance: keyword hits in name/reference; the stable sort keeps the stock/price order on ties
+        if keywords:
+            def relevance(row):
+                text = normalize_str(f"{row['Material']} {row['Subproducto']}")
+                return sum(1 for k in keywords if k in text)
+            rows = sorted(rows, key=lambda r: -relevance(r))
+
+        header = []
+        shared = {}
+        if len(rows) > 1:
+            for field, label in [("categoria", "CATEGORIA"), ("Marca", "MARCA")]:
+                values = {str(r[field]) for r in rows}
+                if len(values) == 1:
+                    shared[field] = True
+                    header.append(f"{label}: {values.pop()} (común a todos los productos)")
+
+        def line(row):
+            parts = [
+                f"- [ID: {row['Material']}] MODELO: {row['Subproducto']}",
+                f"FICHA: {'SI' if row['hasSpec'] else 'NO'}",
+                f"IMG: {'SI' if row['hasImage'] else 'NO'}"
+            ]
+            if "categoria" not in shared:
+                parts.append(f"CATEGORIA: {row['categoria']}")
+            if "Marca" not in shared:
+                parts.append(f"MARCA: {row['Marca']}")
+            if row["Caracteristicas"] not in ("-", "", None):
+                parts.append(f"DESC: {row['Caracteristicas']}")
+            parts.append(f"STOCK: {row['CantDisponible']}")
+            parts.append(f"PRECIO CONTADO: {row['Precio Contado']}")
+            if row["cuotas_texto"] != "N/A":
+                parts.append(f"CUOTAS: {row['cuotas_texto']}")
+            if row["tip"] != "-":
+                parts.append(f"TIP: {row['tip']}")
+            return " | ".join(parts) + "\n"
+
+        context = "".join(h + "\n" for h in header)
+        used = estimate_tokens(context)
+        included = 0
+        for row in rows:
+            text = line(row)
+            cost = estimate_tokens(text)
+            if token_budget and used + cost > token_budget:
+                break
+            context += text
+            used += cost
+            included += 1
+
+        omitted = len(rows) - included
+        if omitted:
+            context += f"NOTA: Se muestran {included} de {len(rows)} productos (los más relevantes y con más stock); se omitieron {omitted} por límite de contexto.\n"
+            log_debug(f"CONTEXTO: {omitted} filas omitidas (presupuesto {token_budget} tokens)")
+        return context, omitted
+
+    @staticmethod
+    def format_inventory_context(results: pd.DataFrame, keywords: list = None, token_budget: int = None) -> str:
+        """Formats the filtered inventory results into a human-readable string for the AI prompt."""
+        context, _ = InventoryService.build_inventory_context(results, keywords, token_budget)
+        return context
+
+    @staticmethod
+    def render_markdown_table(rows: list) -> str:
+        """Renders rows as the Referencia/Ficha/Imagen/... table defined in CLEO_PROMPT, without the LLM."""
+        if not rows:
+            return "No encontré equipos con esa descripción en Bogotá. ¿Deseas buscar otra categoría?"
+
+        def cell(value):
+            return str(value).replace("|", "/").replace("\n", " ").strip() or "-"
+
+        lines = [
+            "| Referencia | Ficha | Imagen | Marca | Modelo | Precio | Unidades | Caracteristicas | Tip |",
+            "|---|---|---|---|---|---|---|---|---|"
+        ]
+        for row in rows:
+            lines.append("| " + " | ".join([
+                cell(row["Material"]),
+                "SI" if row["hasSpec"] else "NO",
+                "VER" if row["hasImage"] else "-",
+                cell(row["Marca"]),
+                cell(row["Subproducto"]),
+                cell(row["Precio Contado"]),
+                cell(row["CantDisponible"]),
+                cell(row["Caracteristicas"]),
+                cell(row["tip"])
+            ]) + " |")
+        return "\n".join(lines)
 
 inventory_service = InventoryService()
@@ -0,0 +1,136 @@
+import os
+import re
+import time
+import asyncio
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+from config import PROMPT_VERSION
+import coordination
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache for Cleo answers.
+    Keys combine the normalized query, the inventory snapshot version and the prompt version,
+    so a new inventory upload or a prompt change never serves stale answers.
+    """
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 900,
+                 semantic: bool = False, semantic_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic = semantic
+        self.semantic_threshold = semantic_threshold
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._embeddings: "OrderedDict[str, list]" = OrderedDict()
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Lowercase, strip accents/punctuation and collapse whitespace."""
+        text = unicodedata.normalize("NFKD", str(query).lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        text = re.sub(r'[^\w\s"]', ' ', text)
+        return " ".join(text.split())
+
+    @staticmethod
+    def _make_key(norm_query: str, inventory_version) -> tuple:
+        return (norm_query, str(inventory_version), PROMPT_VERSION)
+
+    def _get_exact(self, key: tuple) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry["response"]
+
+    def _remember_embedding(self, norm_query: str, vector: list):
+        self._embeddings[norm_query] = vector
+        self._embeddings.move_to_end(norm_query)
+        while len(self._embeddings) > self.max_entries:
+            self._embeddings.popitem(last=False)
+
+    async def _get_semantic(self, norm_query: str, inventory_version) -> Optional[str]:
+        """Near-duplicate lookup using EmbeddingsService (only among entries of the same versions)."""
+        try:
+            from embeddings_service import embeddings_service
+        except Exception as e:
+            print(f"ResponseCache: embeddings no disponibles ({e}). Desactivando modo semántico.")
+            self.semantic = False
+            return None
+
+        vector = self._embeddings.get(norm_query)
+        if vector is None:
+            vector = await asyncio.to_thread(embeddings_service.get_embedding, norm_query)
+            if not vector:
+                return None
+            self._remember_embedding(norm_query, vector)
+
+        now = time.time()
+        best_key, best_score = None, 0.0
+        for key, entry in self._entries.items():
+            if key[1:] != (str(inventory_version), PROMPT_VERSION) or entry["expires_at"] < now:
+                continue
+            other = self._embeddings.get(key[0])
+            if not other:
+                continue
+            score = embeddings_service.cosine_similarity(vector, other)
+            if score > best_score:
+                best_key, best_score = key, score
+
+        if best_key is not None and best_score >= self.semantic_threshold:
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key]["response"]
+        return None
+
+    async def get(self, norm_query: str, inventory_version) -> Optional[str]:
+        """Returns a cached response for the query, or None on a miss."""
+        response = self._get_exact(self._make_key(norm_query, inventory_version))
+        if response is not None:
+            self.stats["hits"] += 1
+            return response
+
+        if self.semantic and self._entries:
+            response = await self._get_semantic(norm_query, inventory_version)
+            if response is not None:
+                self.stats["semantic_hits"] += 1
+                return response
+
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, norm_query: str, inventory_version, response: str):
+        """Stores a response, evicting the least recently used entries beyond max_entries."""
+        key = self._make_key(norm_query, inventory_version)
+        self._entries[key] = {"response": response, "expires_at": time.time() + self.ttl_seconds}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        """Drops every cached response (called when a new inventory is processed)."""
+        self._entries.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "semantic": self.semantic,
+            "prompt_version": PROMPT_VERSION
+        }
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256")),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "900")),
+    semantic=os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true",
+    semantic_threshold=float(os.getenv("RESPONSE_CACHE_SEMANTIC_THRESHOLD", "0.95"))
+)
+# Any data change (inventory, specs, knowledge, quotas) in any worker can change answers
+coordination.register_invalidator(lambda reason: response_cache.clear())
@@ -0,0 +1,223 @@
+"""
+Read-only snapshot files shared by every gunicorn worker.
+The processed inventory, the resolved spec-match table and the image embedding matrix are
+written once as .npy columns (strings as categorical codes + a categories list) and
+mapped with np.load(mmap_mode="r"), so N workers share the same pages instead of each
+holding its own pandas copy. A new snapshot is a new directory; the CURRENT pointer file
+is swapped with os.replace, so readers always see a complete snapshot.
+
+Only the numeric arrays and the category codes are shared pages. Each worker loads the
+categories into its own Python strings (pandas cannot hold str over a mapped buffer without
+pyarrow), so near-unique columns (Material, Subproducto, modelo_limpio...) are a per-worker
+copy: measured ~2.4 MB RSS per worker for a 3,000-row inventory, ~9 MB for 20,000 rows.
+meta.json records the size of the strings per column (per_worker_bytes, about half of that RSS:
+the rest is the categories' hash tables) and publish() logs the total.
+
+Mapped frames are read-only: numeric columns are read-only mmaps (writes raise ValueError)
+and string columns are Categorical (a value outside the categories raises TypeError, e.g.
+fillna("-")). Callers that modify a frame work on df.copy() with .astype(object) columns.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import numpy as np
+import pandas as pd
+from config import STORAGE_DIR
+
+SNAPSHOT_DIR = os.path.join(STORAGE_DIR, "snapshots")
+CURRENT_POINTER = os.path.join(SNAPSHOT_DIR, "CURRENT")
+KEEP_SNAPSHOTS = 3  # Older snapshots may still be mapped by a worker that has not reloaded yet
+
+PARTS = {
+    "inventory": ["inventory."],
+    "spec_matches": ["spec_matches."],
+    "embeddings": ["embeddings."]
+}
+
+_pointer_stat = None
+_pointer_name = None
+_mapped = {}  # (snapshot name, part) -> loaded object
+
+
+def current_name():
+    """Name of the published snapshot directory (re-read only when the pointer file changes)."""
+    global _pointer_stat, _pointer_name
+    try:
+        st = os.stat(CURRENT_POINTER)
+    except FileNotFoundError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_ino, st.st_size)
+    if stamp != _pointer_stat:
+        with open(CURRENT_POINTER, "r", encoding="utf-8") as f:
+            _pointer_name = f.read().strip() or None
+        _pointer_stat = stamp
+    return _pointer_name
+
+
+def _read_meta(name):
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, name, "meta.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _write_frame(df: pd.DataFrame, directory: str, prefix: str) -> list:
+    """Numeric columns as raw arrays, everything else as categorical codes + categories."""
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        base = os.path.join(directory, f"{prefix}{i}")
+        if pd.api.types.is_numeric_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype):
+            np.save(base + ".npy", series.to_numpy())
+            columns.append({"name": str(name), "kind": "numeric"})
+        else:
+            cat = pd.Categorical(series.astype(object).where(series.notna(), None))
+            np.save(base + ".codes.npy", cat.codes)
+            categories = cat.categories.tolist()
+            with open(base + ".categories.json", "w", encoding="utf-8") as f:
+                json.dump(categories, f, ensure_ascii=False, default=str)
+            # Not shared: every worker that maps the frame holds its own copy of the categories
+            per_worker = sys.getsizeof(categories) + sum(sys.getsizeof(c) for c in categories)
+            columns.append({"name": str(name), "kind": "categorical", "per_worker_bytes": per_worker})
+    return columns
+
+
+def _map_frame(directory: str, prefix: str, columns: list) -> pd.DataFrame:
+    """Rebuilds the DataFrame on top of the mmap'd arrays (no copy of numeric data or codes)."""
+    data = {}
+    for i, col in enumerate(columns):
+        base = os.path.join(directory, f"{prefix}{i}")
+        if col["kind"] == "numeric":
+            data[col["name"]] = pd.Series(np.load(base + ".npy", mmap_mode="r"), copy=False)
+        else:
+            with open(base + ".categories.json", "r", encoding="utf-8") as f:
+                categories = json.load(f)
+            codes = np.load(base + ".codes.npy", mmap_mode="r")
+            data[col["name"]] = pd.Series(pd.Categorical.from_codes(codes, categories=categories), copy=False)
+    return pd.DataFrame(data, copy=False)
+
+
+def _carry_over(previous: str, directory: str, part: str):
+    """Hard-links an unchanged part from the previous snapshot (falls back to a copy)."""
+    src_dir = os.path.join(SNAPSHOT_DIR, previous)
+    for fname in os.listdir(src_dir):
+        if any(fname.startswith(p) for p in PARTS[part]):
+            src, dst = os.path.join(src_dir, fname), os.path.join(directory, fname)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+
+
+def publish(inventory: pd.DataFrame = None, inventory_info: dict = None,
+            spec_matches: dict = None, spec_info: dict = None,
+            embeddings: dict = None, embeddings_info: dict = None) -> str:
+    """
+    Writes a new snapshot with the given parts (the rest is carried over from the current one)
+    and atomically points CURRENT at it. Returns the new snapshot name.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    previous = current_name()
+    previous_meta = _read_meta(previous) if previous else {}
+    name = f"v{time.time_ns()}-{os.getpid()}"
+    directory = os.path.join(SNAPSHOT_DIR, name)
+    os.makedirs(directory)
+
+    meta = {"created_at": time.time()}
+    if inventory is not None:
+        meta["inventory"] = {**(inventory_info or {}), "rows": len(inventory),
+                             "columns": _write_frame(inventory, directory, "inventory.")}
+    if spec_matches is not None:
+        table = pd.DataFrame({"Material": list(spec_matches.keys()), "file": list(spec_matches.values())})
+        meta["spec_matches"] = {**(spec_info or {}), "rows": len(table),
+                                "columns": _write_frame(table, directory, "spec_matches.")}
+    if embeddings is not None:
+        keys = list(embeddings.keys())
+        matrix = np.asarray([embeddings[k] for k in keys], dtype=np.float32)
+        np.save(os.path.join(directory, "embeddings.matrix.npy"), matrix)
+        with open(os.path.join(directory, "embeddings.keys.json"), "w", encoding="utf-8") as f:
+            json.dump(keys, f, ensure_ascii=False)
+        meta["embeddings"] = {**(embeddings_info or {}), "rows": len(keys)}
+
+    for part in PARTS:
+        if part not in meta and part in previous_meta:
+            _carry_over(previous, directory, part)
+            meta[part] = previous_meta[part]
+
+    with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    tmp_pointer = f"{CURRENT_POINTER}.{os.getpid()}.tmp"
+    with open(tmp_pointer, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(tmp_pointer, CURRENT_POINTER)
+    per_worker = sum(col.get("per_worker_bytes", 0) for part in meta.values()
+                     if isinstance(part, dict) for col in part.get("columns", []))
+    print(f"🗂 Snapshot compartido publicado: {name} (strings por worker: {per_worker / 1024:.0f} KB)")
+
+    _cleanup(keep=name)
+    return name
+
+
+def _cleanup(keep: str):
+    """Removes old snapshot directories beyond KEEP_SNAPSHOTS (mapped files stay valid until unmapped)."""
+    try:
+        names = sorted((d for d in os.listdir(SNAPSHOT_DIR) if d.startswith("v") and d != keep),
+                       key=lambda d: os.path.getmtime(os.path.join(SNAPSHOT_DIR, d)))
+        for old in names[:max(0, len(names) - (KEEP_SNAPSHOTS - 1))]:
+            shutil.rmtree(os.path.join(SNAPSHOT_DIR, old), ignore_errors=True)
+    except Exception as e:
+        print(f"Warning: limpieza de snapshots falló: {e}")
+
+
+def _load_part(part: str):
+    """Returns (name, meta of the part, mapped object) for the current snapshot, memoized per snapshot."""
+    name = current_name()
+    if not name:
+        return None, None, None
+    if (name, part) in _mapped:
+        return name, *_mapped[(name, part)]
+
+    meta = _read_meta(name).get(part)
+    if not meta:
+        return name, None, None
+    directory = os.path.join(SNAPSHOT_DIR, name)
+    try:
+        if part == "embeddings":
+            with open(os.path.join(directory, "embeddings.keys.json"), "r", encoding="utf-8") as f:
+                keys = json.load(f)
+            obj = (keys, np.load(os.path.join(directory, "embeddings.matrix.npy"), mmap_mode="r"))
+        else:
+            obj = _map_frame(directory, f"{part}.", meta["columns"])
+    except FileNotFoundError:
+        return name, None, None  # Snapshot removed while we were reading; caller falls back
+
+    # Drop mappings of older snapshots of this part so their pages can be released
+    for key in [k for k in _mapped if k[1] == part]:
+        del _mapped[key]
+    _mapped[(name, part)] = (meta, obj)
+    return name, meta, obj
+
+
+def load_inventory():
+    """(DataFrame, meta) of the published inventory, or (None, None). The DataFrame is read-only."""
+    _, meta, df = _load_part("inventory")
+    return df, meta
+
+
+def load_spec_matches():
+    """({Material: file}, meta) of the published spec-match table, or (None, None)."""
+    _, meta, table = _load_part("spec_matches")
+    if table is None:
+        return None, None
+    return dict(zip(table["Material"].astype(str), table["file"].astype(str))), meta
+
+
+def load_embeddings():
+    """((keys, float32 matrix), meta) of the published image embeddings, or (None, None)."""
+    _, meta, obj = _load_part("embeddings")
+    return obj, meta
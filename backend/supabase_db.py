@@ -1,5 +1,6 @@
 import os
 import json
+import asyncio
 import pandas as pd
 from datetime import datetime
 from supabase import create_client, Client
@@ -13,13 +14,15 @@ key = os.environ.get("SUPABASE_KEY")
 supabase: Client = create_client(url, key) if url and key else None
 
 # --- DATABASE LOGIC ---
+# Reads run the blocking supabase-py call in a thread so the event loop keeps serving
+# (and the startup syncs in main.py can actually overlap).
 
 async def save_inventory_to_db(df: pd.DataFrame):
     if supabase is None: return
     
     # 1. Prepare safe records (only send columns that exist in the remote schema)
     # Based on discovery, remote only has: Material, Subproducto, categoria, marca, modelo_limpio, especificaciones
-    verified_cols = ['Material', 'Subproducto', 'CantDisponible', 'Precio Contado', 'categoria', 'marca', 'modelo_limpio', 'especificaciones', 'tip_venta']
+    verified_cols = list(INVENTORY_COLUMNS)
     
     safe_df = df.copy()
     available_cols = [c for c in verified_cols if c in safe_df.columns]
@@ -29,13 +32,13 @@ async def save_inventory_to_db(df: pd.DataFrame):
     
     # 2. Clear previous inventory
     try:
-        supabase.table('inventory').delete().neq('Material', '0').execute()
+        await asyncio.to_thread(supabase.table('inventory').delete().neq('Material', '0').execute)
         
         # 3. Batch insert
         chunk_size = 500
         for i in range(0, len(records), chunk_size):
             chunk = records[i:i + chunk_size]
-            supabase.table('inventory').insert(chunk).execute()
+            await asyncio.to_thread(supabase.table('inventory').insert(chunk).execute)
             
         # 4. Update metadata
         await update_metadata_db()
@@ -43,13 +46,83 @@ async def save_inventory_to_db(df: pd.DataFrame):
     except Exception as e:
         print(f"✗ Error guardando en Supabase: {e}")
 
-async def get_inventory_from_db(columns: str = "*"):
+# Columns the app serves from the inventory (chat, tips, specs) and their dtypes
+INVENTORY_COLUMNS = {
+    "Material": "object", "Subproducto": "object", "CantDisponible": "float64",
+    "Precio Contado": "float64", "categoria": "object", "marca": "object",
+    "modelo_limpio": "object", "especificaciones": "object", "tip_venta": "object"
+}
+INVENTORY_PAGE_SIZE = int(os.getenv("INVENTORY_PAGE_SIZE", "1000"))  # Must not exceed PostgREST max-rows
+INVENTORY_READ_CONCURRENCY = int(os.getenv("INVENTORY_READ_CONCURRENCY", "4"))
+
+def _inventory_page_frame(rows: list, columns: list) -> pd.DataFrame:
+    """One page of rows as a typed DataFrame (the raw dicts can be dropped right after)."""
+    page = pd.DataFrame.from_records(rows, columns=columns)
+    for col in columns:
+        dtype = INVENTORY_COLUMNS.get(col)
+        if dtype == "float64":
+            page[col] = pd.to_numeric(page[col], errors="coerce").astype("float64")
+        elif dtype:
+            page[col] = page[col].astype(object)
+    return page
+
+async def _read_pages(table: str, select: str, order: list, convert):
+    """
+    Reads a whole table in ranges, INVENTORY_READ_CONCURRENCY at a time (a single select()
+    silently stops at the PostgREST max-rows limit). `order` must be unique (end it with the
+    primary key) or rows tied at a page boundary can be read twice or skipped. The first page
+    sets the stride, so a PAGE_SIZE above the server's max-rows cannot leave gaps.
+    convert(rows) turns each page into its final form as it arrives.
+    Returns (converted pages in order, total rows) or (None, 0).
+    """
+    def fetch(start, size, count=None):
+        query = supabase.table(table).select(select, count=count)
+        for col in order:
+            query = query.order(col)
+        return query.range(start, start + size - 1).execute()
+
+    first = await asyncio.to_thread(fetch, 0, INVENTORY_PAGE_SIZE, "exact")
+    if not first.data:
+        return None, 0
+    stride = len(first.data)  # What the server actually returns per range request
+    pages = {0: convert(first.data)}
+    total = first.count if first.count is not None else len(first.data)
+
+    semaphore = asyncio.Semaphore(INVENTORY_READ_CONCURRENCY)
+    async def read_page(start):
+        async with semaphore:
+            response = await asyncio.to_thread(fetch, start, stride)
+        pages[start] = convert(response.data or [])
+
+    await asyncio.gather(*[read_page(start) for start in range(stride, total, stride)])
+    return [pages[k] for k in sorted(pages)], total
+
+async def get_inventory_from_db(columns: list = None):
+    """
+    Reads the whole inventory table page by page into a typed DataFrame,
+    projecting only `columns` (default INVENTORY_COLUMNS; "*" for every column).
+    """
     if supabase is None: return None
+    if columns is None:
+        columns = list(INVENTORY_COLUMNS)
+    select = columns if isinstance(columns, str) else ",".join(f'"{c}"' if " " in c else c for c in columns)
+
     try:
-        # Optimization: Fetching only what we need reduces memory usage on Render
-        response = supabase.table('inventory').select(columns).execute()
-        if response.data:
-            return pd.DataFrame(response.data)
+        frame_columns = None
+        def convert(rows):
+            nonlocal frame_columns
+            if frame_columns is None:
+                frame_columns = list(rows[0].keys())
+            return _inventory_page_frame(rows, frame_columns)
+
+        pages, total = await _read_pages('inventory', select, ['Material', 'id'], convert)
+        if pages is None:
+            return None
+        df = pd.concat(pages, ignore_index=True)
+        if len(df) != total:
+            print(f"⚠ Inventario en Supabase cambió durante la lectura: {len(df)} de {total} filas.")
+        print(f"✓ {len(df)} productos leídos de Supabase en {len(pages)} páginas.")
+        return df
     except Exception as e:
         print(f"✗ Error leyendo de Supabase: {e}")
     return None
@@ -65,7 +138,7 @@ async def update_metadata_db():
 async def get_metadata_db():
     if supabase is None: return None
     try:
-        response = supabase.table('metadata').select("*").eq("id", 1).execute()
+        response = await asyncio.to_thread(supabase.table('metadata').select("*").eq("id", 1).execute)
         if response.data:
             return response.data[0]
     except Exception as e:
@@ -73,21 +146,42 @@ async def get_metadata_db():
     return None
 
 async def save_quotas_to_db(mapping: dict):
+    """
+    Stores the quota book as one row per (material, months) in quota_plans, without a window
+    where the table holds a partial book: every row is upserted tagged with a new book id and
+    only then are the rows of previous books (plans no longer offered) deleted.
+    """
     if supabase is None: return
     try:
-        # We store the quota mapping as a single JSON object in a dedicated table 'quotas'
-        # with id=1 for simplicity (or we could store it as records per SKU)
-        # Let's use a simple key-value approach for the whole JSON for speed
-        payload = {"id": 1, "data": mapping, "updated_at": datetime.now().isoformat()}
-        supabase.table('quotas').upsert(payload).execute()
-        print(f"✓ Mapeo de cuotas ({len(mapping)} equipos) guardado en Supabase.")
+        book = datetime.now().isoformat()
+        rows = [
+            {"material": material, "months": int(months), "cuota": int(cuota), "book": book}
+            for material, plans in mapping.items() for months, cuota in plans.items()
+        ]
+        if not rows:
+            print("⚠ Libro de cuotas vacío: se conservan las cuotas de Supabase.")
+            return
+        chunk_size = 500
+        for i in range(0, len(rows), chunk_size):
+            await asyncio.to_thread(supabase.table('quota_plans').upsert(rows[i:i + chunk_size]).execute)
+        await asyncio.to_thread(supabase.table('quota_plans').delete().neq('book', book).execute)
+        await asyncio.to_thread(supabase.table('quota_plans').delete().is_('book', 'null').execute)
+        print(f"✓ Cuotas de {len(mapping)} equipos ({len(rows)} planes) guardadas en Supabase.")
     except Exception as e:
         print(f"✗ Error guardando cuotas en Supabase: {e}")
 
 async def get_quotas_from_db():
+    """{material: {months: cuota}} from quota_plans (legacy single-document 'quotas' table as fallback)."""
     if supabase is None: return None
     try:
-        response = supabase.table('quotas').select("data").eq("id", 1).execute()
+        pages, _ = await _read_pages('quota_plans', 'material,months,cuota', ['material', 'months'], lambda rows: rows)
+        if pages:
+            mapping = {}
+            for rows in pages:
+                for row in rows:
+                    mapping.setdefault(row["material"], {})[str(row["months"])] = row["cuota"]
+            return mapping
+        response = await asyncio.to_thread(supabase.table('quotas').select("data").eq("id", 1).execute)
         if response.data:
             return response.data[0]["data"]
     except Exception as e:
@@ -108,28 +202,46 @@ async def save_specs_mapping_to_db(mapping: dict):
 async def get_specs_mapping_from_db():
     if supabase is None: return None
     try:
-        response = supabase.table('specs_mapping').select("data").eq("id", 1).execute()
+        response = await asyncio.to_thread(supabase.table('specs_mapping').select("data").eq("id", 1).execute)
         if response.data:
             return response.data[0]["data"]
     except Exception as e:
         print(f"✗ Error leyendo mapeo de imágenes de Supabase: {e}")
     return None
 
-async def save_knowledge_to_db(knowledge: list):
-    if supabase is None: return
+async def save_knowledge_items_to_db(entries: list):
+    """Upserts only the given knowledge entries, one expert_knowledge_items row per SKU."""
+    if supabase is None or not entries: return
     try:
-        payload = {"id": 1, "data": knowledge, "updated_at": datetime.now().isoformat()}
-        supabase.table('expert_knowledge').upsert(payload).execute()
-        print(f"✓ Conocimiento experto sincronizado con Supabase.")
+        now = datetime.now().isoformat()
+        rows = {}
+        for item in entries:  # A batch may not upsert the same key twice
+            rows.setdefault(str(item.get("sku")), {"sku": str(item.get("sku")), "data": item, "updated_at": now})
+        rows = list(rows.values())
+        chunk_size = 500
+        for i in range(0, len(rows), chunk_size):
+            await asyncio.to_thread(supabase.table('expert_knowledge_items').upsert(rows[i:i + chunk_size]).execute)
+        print(f"✓ {len(rows)} fichas de conocimiento experto sincronizadas con Supabase.")
     except Exception as e:
         print(f"✗ Error sincronizando conocimiento experto: {e}")
 
 async def get_knowledge_from_db():
+    """
+    Knowledge list from expert_knowledge_items, layered over the legacy single-document table
+    while that row still exists: a partially migrated items table can never hide the rest.
+    """
     if supabase is None: return None
     try:
-        response = supabase.table('expert_knowledge').select("data").eq("id", 1).execute()
+        merged = {}
+        response = await asyncio.to_thread(supabase.table('expert_knowledge').select("data").eq("id", 1).execute)
         if response.data:
-            return response.data[0]["data"]
+            for item in response.data[0]["data"] or []:
+                merged.setdefault(str(item.get("sku")), item)
+        pages, _ = await _read_pages('expert_knowledge_items', 'sku,data', ['sku'], lambda rows: rows)
+        for rows in pages or []:
+            for row in rows:
+                merged[row["sku"]] = row["data"]
+        return list(merged.values()) or None
     except Exception as e:
         print(f"✗ Error leyendo conocimiento experto de Supabase: {e}")
     return None
@@ -183,7 +295,7 @@ async def download_latest_inventory_pdf_from_supabase(local_dir: str):
     if supabase is None: return None
     try:
         # Get list of files in 'inventories' bucket
-        files = supabase.storage.from_('inventories').list()
+        files = await asyncio.to_thread(supabase.storage.from_('inventories').list)
         if not files: return None
         
         # Sort by creation date (if metadata available) or just take one for now
@@ -192,8 +304,8 @@ async def download_latest_inventory_pdf_from_supabase(local_dir: str):
         latest_filename = files[0]['name']
         
         local_path = os.path.join(local_dir, latest_filename)
+        res = await asyncio.to_thread(supabase.storage.from_('inventories').download, latest_filename)
         with open(local_path, 'wb') as f:
-            res = supabase.storage.from_('inventories').download(latest_filename)
             f.write(res)
         
         print(f"✓ PDF {latest_filename} descargado de Supabase Storage.")
@@ -23,7 +23,16 @@ CREATE TABLE IF NOT EXISTS public.metadata (
     status TEXT
 );
 
--- 3. Quotas Mapping
+-- 3. Quotas: one row per material and term (the primary key indexes lookups by material)
+CREATE TABLE IF NOT EXISTS public.quota_plans (
+    material TEXT NOT NULL,
+    months INT NOT NULL,
+    cuota BIGINT NOT NULL,
+    book TEXT,  -- Upload that wrote the row: a new book is upserted first, then older rows are deleted
+    PRIMARY KEY (material, months)
+);
+
+-- Legacy single-document quotas (read only as a fallback until quota_plans is filled)
 CREATE TABLE IF NOT EXISTS public.quotas (
     id INT PRIMARY KEY,
     data JSONB,
@@ -38,20 +47,39 @@ CREATE TABLE IF NOT EXISTS public.specs_mapping (
 );
 
 -- 5. Expert Knowledge
+CREATE TABLE IF NOT EXISTS public.expert_knowledge_items (
+    sku TEXT PRIMARY KEY,
+    data JSONB NOT NULL,
+    updated_at TEXT
+);
+
+-- Legacy single-document knowledge. The backend still reads it underneath expert_knowledge_items
+-- (rows win per SKU); once the migration below has run, the row can be deleted.
 CREATE TABLE IF NOT EXISTS public.expert_knowledge (
     id INT PRIMARY KEY,
     data JSONB,
     updated_at TEXT
 );
 
+-- One-time migration: legacy document -> one row per SKU (first entry per SKU, existing rows kept)
+INSERT INTO public.expert_knowledge_items (sku, data, updated_at)
+SELECT DISTINCT ON (e.item->>'sku') e.item->>'sku', e.item, NOW()::TEXT
+FROM public.expert_knowledge k, jsonb_array_elements(k.data) WITH ORDINALITY AS e(item, pos)
+WHERE k.id = 1 AND jsonb_typeof(k.data) = 'array' AND e.item->>'sku' IS NOT NULL
+ORDER BY e.item->>'sku', e.pos
+ON CONFLICT (sku) DO NOTHING;
+
 -- Disable RLS for easier backend access
 ALTER TABLE public.inventory DISABLE ROW LEVEL SECURITY;
 ALTER TABLE public.metadata DISABLE ROW LEVEL SECURITY;
+ALTER TABLE public.quota_plans DISABLE ROW LEVEL SECURITY;
 ALTER TABLE public.quotas DISABLE ROW LEVEL SECURITY;
 ALTER TABLE public.specs_mapping DISABLE ROW LEVEL SECURITY;
+ALTER TABLE public.expert_knowledge_items DISABLE ROW LEVEL SECURITY;
 ALTER TABLE public.expert_knowledge DISABLE ROW LEVEL SECURITY;
 
 -- Migration helper: If columns are missing, run these individually:
 -- ALTER TABLE public.inventory ADD COLUMN IF NOT EXISTS "CantDisponible" FLOAT;
 -- ALTER TABLE public.inventory ADD COLUMN IF NOT EXISTS "Precio Contado" FLOAT;
 -- ALTER TABLE public.inventory ADD COLUMN IF NOT EXISTS "tip_venta" TEXT;
+-- ALTER TABLE public.quota_plans ADD COLUMN IF NOT EXISTS book TEXT;
@@ -0,0 +1,168 @@
+"""
+Background job that precomputes tip_venta for every inventory SKU without one.
+Tips are generated in batches (one multi-product prompt per batch), paced to the number
+of keys in the AI Pool, checkpointed to disk so a restart resumes where it stopped,
+and written into the expert knowledge store.
+"""
+
+import os
+import json
+import time
+import asyncio
+from datetime import datetime
+import pandas as pd
+from config import STORAGE_DIR, get_ai_pool
+from services.ai_service import ai_service
+from supabase_db import save_knowledge_items_to_db
+import knowledge_store
+import coordination
+
+CHECKPOINT_FILE = os.path.join(STORAGE_DIR, "tip_job_checkpoint.json")
+BATCH_SIZE = int(os.getenv("TIP_JOB_BATCH_SIZE", "20"))
+RPM_PER_KEY = float(os.getenv("TIP_JOB_RPM_PER_KEY", "5"))
+SYNC_EVERY = int(os.getenv("TIP_JOB_SYNC_EVERY", "5"))  # batches between Supabase syncs
+
+_job_task = None
+_job_state = {"status": "idle", "total": 0, "done": 0, "failed": 0, "started_at": None, "finished_at": None, "error": None}
+
+
+def _load_checkpoint() -> dict:
+    if os.path.exists(CHECKPOINT_FILE):
+        try:
+            with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Checkpoint de tips ilegible, se ignora: {e}")
+    return {"tips": {}, "failed": []}
+
+
+def _save_checkpoint(checkpoint: dict):
+    checkpoint["updated_at"] = datetime.now().isoformat()
+    tmp_file = CHECKPOINT_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_file, CHECKPOINT_FILE)
+
+
+async def _merge_tips(tips: dict, products: dict) -> list:
+    """Writes generated tips into the knowledge store without overwriting manual ones."""
+    async with coordination.locked("knowledge"):
+        filled, created = knowledge_store.merge_tips(tips, products)
+        if filled or created:
+            knowledge_store.save()
+    return filled + created
+
+
+def find_skus_without_tip(df: pd.DataFrame) -> list:
+    """SKUs with neither an expert tip nor an inventory tip_venta."""
+    with_tip = knowledge_store.skus_with_tip()
+    items = df.drop_duplicates(subset=["Material"])
+    pending = []
+    for material, model, specs, tip in zip(
+        items["Material"].astype(str),
+        items["Subproducto"],
+        items.get("especificaciones", pd.Series("-", index=items.index)),
+        items.get("tip_venta", pd.Series("-", index=items.index))
+    ):
+        if material in with_tip or (isinstance(tip, str) and tip.strip() not in ("", "-")):
+            continue
+        pending.append({"sku": material, "model": model, "specs": specs if isinstance(specs, str) else "-"})
+    return pending
+
+
+async def run_tip_job(resume: bool = True):
+    """Generates missing tips for the whole inventory (in one worker at a time)."""
+    async with coordination.elect("tip-job", wait=False) as leader:
+        if not leader:
+            print("💡 Tip job ya está corriendo en otro worker.")
+            _job_state.update({"status": "running_elsewhere", "error": None})
+            return
+        await _run_tip_job(resume)
+
+
+async def _run_tip_job(resume: bool):
+    from processor import get_latest_inventory
+
+    _job_state.update({"status": "running", "done": 0, "failed": 0, "error": None,
+                       "started_at": datetime.now().isoformat(), "finished_at": None})
+    try:
+        df = await get_latest_inventory()
+        pool = get_ai_pool()
+        if df is None or pool is None:
+            raise Exception("Inventario o AI Pool no disponibles.")
+
+        checkpoint = _load_checkpoint() if resume else {"tips": {}, "failed": []}
+        unsynced = {}  # sku -> entry changed since the last Supabase sync
+
+        # Tips generated before a restart but not yet persisted
+        pending = find_skus_without_tip(df)
+        products = {p["sku"]: p for p in pending}
+        if checkpoint["tips"]:
+            for entry in await _merge_tips(checkpoint["tips"], products):
+                unsynced[entry["sku"]] = entry
+            pending = [p for p in pending if p["sku"] not in checkpoint["tips"]]
+
+        _job_state["total"] = len(pending)
+        print(f"💡 Tip job: {len(pending)} SKUs sin tip ({len(checkpoint['tips'])} recuperados del checkpoint).")
+
+        # Pace batches so the whole pool stays under RPM_PER_KEY per key
+        interval = 60.0 / (RPM_PER_KEY * max(1, len(pool.providers)))
+        batches = [pending[i:i + BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)]
+
+        for n, batch in enumerate(batches, 1):
+            started = time.time()
+            tips = await ai_service.generate_sales_tips_batch(batch)
+            generated = {item["sku"]: tip for item, tip in zip(batch, tips) if tip}
+
+            checkpoint["tips"].update(generated)
+            checkpoint["failed"] = sorted(set(checkpoint["failed"]) | {item["sku"] for item in batch if item["sku"] not in generated})
+            _save_checkpoint(checkpoint)
+
+            for entry in await _merge_tips(generated, products):
+                unsynced[entry["sku"]] = entry
+            if n % SYNC_EVERY == 0:
+                await save_knowledge_items_to_db(list(unsynced.values()))
+                unsynced.clear()
+
+            _job_state["done"] += len(generated)
+            _job_state["failed"] += len(batch) - len(generated)
+            print(f"💡 Tip job: lote {n}/{len(batches)} ({len(generated)}/{len(batch)} tips)")
+
+            elapsed = time.time() - started
+            if n < len(batches) and elapsed < interval:
+                await asyncio.sleep(interval - elapsed)
+
+        await save_knowledge_items_to_db(list(unsynced.values()))
+        coordination.bump_version("knowledge")
+        if os.path.exists(CHECKPOINT_FILE):
+            os.remove(CHECKPOINT_FILE)
+        _job_state["status"] = "finished"
+    except Exception as e:
+        print(f"✗ Error en tip job: {e}")
+        _job_state.update({"status": "failed", "error": str(e)})
+    finally:
+        _job_state["finished_at"] = datetime.now().isoformat()
+
+
+def start_tip_job(resume: bool = True) -> dict:
+    """Starts the job in the background unless it is already running."""
+    global _job_task
+    if _job_task is None or _job_task.done():
+        _job_task = asyncio.create_task(run_tip_job(resume=resume))
+    return get_tip_job_status()
+
+
+def resume_pending_tip_job():
+    """Called at startup: resumes a job interrupted by a restart."""
+    if os.path.exists(CHECKPOINT_FILE):
+        print("💡 Reanudando tip job interrumpido...")
+        start_tip_job(resume=True)
+
+
+def get_tip_job_status() -> dict:
+    return {**_job_state, "checkpoint": os.path.exists(CHECKPOINT_FILE)}
+
+
+if __name__ == "__main__":
+    asyncio.run(run_tip_job())
+    print(get_tip_job_status())
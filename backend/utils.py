@@ -4,6 +4,7 @@ import json
 from datetime import datetime
 from config import SPECS_DIR, NOISE_WORDS, SPECS_MAPPING_FILE
 from embeddings_service import embeddings_service
+import coordination
 
 # In-request cache for spec resolution to avoid redundant calls
 _spec_match_cache = {}
@@ -13,6 +14,8 @@ def clear_spec_cache():
     global _spec_match_cache
     _spec_match_cache = {}
 
+coordination.register_invalidator(lambda reason: clear_spec_cache(), ["specs", "inventory"])
+
 def log_debug(msg):
     """Log debug information to a local file"""
     try:
@@ -21,6 +24,10 @@ def log_debug(msg):
     except:
         pass
 
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) used to budget prompts"""
+    return len(str(text)) // 4 + 1
+
 def normalize_str(s):
     """Basic string normalization for comparisons"""
     return str(s).lower().strip() if s else ""
@@ -36,7 +36,6 @@ const ChatApp = () => {
   const [knowledge, setKnowledge] = useState([]);
   const [specsList, setSpecsList] = useState([]);
   const [specsMapping, setSpecsMapping] = useState({});
-  const [quotasMapping, setQuotasMapping] = useState({});
   const [fichasSearch, setFichasSearch] = useState('');
   const [selectedImage, setSelectedImage] = useState(null);
   const [isBotLoading, setIsBotLoading] = useState(false);
@@ -82,20 +81,17 @@ const ChatApp = () => {
       knowledgeData,
       specsData,
       mappingData,
-      inventoryMeta,
-      quotasData
+      inventoryMeta
     ] = await Promise.all([
       safeFetch(() => chatService.getKnowledge(), []),
       safeFetch(() => chatService.getSpecsList(), []),
       safeFetch(() => chatService.getSpecsMapping(), {}),
-      safeFetch(() => chatService.getInventoryMetadata(), null),
-      safeFetch(() => chatService.getQuotas(), {})
+      safeFetch(() => chatService.getInventoryMetadata(), null)
     ]);
 
     setKnowledge(knowledgeData);
     setSpecsList(specsData);
     setSpecsMapping(mappingData);
-    setQuotasMapping(quotasData);
 
     if (inventoryMeta && inventoryMeta.last_update) {
       const date = new Date(inventoryMeta.last_update);
@@ -111,16 +107,14 @@ const ChatApp = () => {
 
   const refreshData = async () => {
     try {
-      const [knowledgeData, specsData, mappingData, quotasData] = await Promise.all([
+      const [knowledgeData, specsData, mappingData] = await Promise.all([
         chatService.getKnowledge(),
         chatService.getSpecsList(),
-        chatService.getSpecsMapping(),
-        chatService.getQuotas()
+        chatService.getSpecsMapping()
       ]);
       setKnowledge(knowledgeData);
       setSpecsList(specsData);
       setSpecsMapping(mappingData);
-      setQuotasMapping(quotasData);
 
       // Force cache-busting for images by incrementing session version
       const currentV = parseInt(sessionStorage.getItem('cleo_mapping_v') || '1');
@@ -184,7 +178,13 @@ const ChatApp = () => {
     }]);
 
     try {
-      const data = await chatService.sendMessage(input);
+      const data = await chatService.streamMessage(input, (partialText) => {
+        setMessages(prev => prev.map(msg =>
+          msg.id === loadingId
+            ? { ...msg, text: partialText, loading: false }
+            : msg
+        ));
+      });
       setMessages(prev => prev.map(msg =>
         msg.id === loadingId
           ? { ...msg, text: data.response, loading: false }
@@ -208,8 +208,30 @@ const ChatApp = () => {
     try {
       const response = await chatService.uploadInventory(file);
       if (response.ok) {
-        setUploadStatus('¡Inventario procesado con éxito! Cleo ya tiene los datos actualizados.');
+        const { job_id } = await response.json();
         setFile(null);
+        // Processing runs in the ingest worker: poll the job until it finishes
+        let job = null;
+        while (true) {
+          await new Promise(resolve => setTimeout(resolve, 1500));
+          job = await chatService.getJob(job_id);
+          if (job.status === 'succeeded' || job.status === 'failed') break;
+          const p = job.progress || {};
+          if (p.stage === 'parsing' && p.pages) {
+            setUploadStatus(`Procesando PDF... página ${p.page} de ${p.pages}`);
+          } else if (p.stage) {
+            setUploadStatus(`Procesando inventario (${p.stage})...`);
+          } else if (job.status === 'queued' && job.attempts > 0) {
+            setUploadStatus(`Reintentando procesamiento (intento ${job.attempts + 1} de ${job.max_attempts})...`);
+          } else {
+            setUploadStatus('En cola para procesamiento...');
+          }
+        }
+        if (job.status === 'failed') {
+          setUploadStatus(`Error procesando el inventario: ${job.error || 'desconocido'}`);
+          return;
+        }
+        setUploadStatus('¡Inventario procesado con éxito! Cleo ya tiene los datos actualizados.');
         // Refresh metadata and stats to show the new date
         const inventoryMeta = await chatService.getInventoryMetadata();
         if (inventoryMeta && inventoryMeta.last_update) {
@@ -339,7 +361,6 @@ const ChatApp = () => {
               isBotLoading={isBotLoading}
               specsList={specsList}
               specsMapping={specsMapping}
-              quotasMapping={quotasMapping}
               onViewSpec={handleViewSpec}
             />
           )}
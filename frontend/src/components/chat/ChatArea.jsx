@@ -2,7 +2,7 @@ import React, { useState, useEffect, useMemo } from 'react';
 import MessageBubble from './MessageBubble';
 import useFuzzySearch from '../../hooks/useFuzzySearch';
 
-const ChatArea = ({ messages, chatEndRef, lastMessageRef, input, setInput, handleSend, specsList, specsMapping, quotasMapping, onViewSpec, isBotLoading }) => {
+const ChatArea = ({ messages, chatEndRef, lastMessageRef, input, setInput, handleSend, specsList, specsMapping, onViewSpec, isBotLoading }) => {
     const [suggestion, setSuggestion] = useState(null);
 
     const dictionary = useMemo(() => {
@@ -49,7 +49,6 @@ const ChatArea = ({ messages, chatEndRef, lastMessageRef, input, setInput, handl
                             msg={msg}
                             specsList={specsList}
                             specsMapping={specsMapping}
-                            quotasMapping={quotasMapping}
                             onViewSpec={onViewSpec}
                         />
                     ))}
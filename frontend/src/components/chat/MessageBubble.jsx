@@ -1,12 +1,33 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
 import ProductCard from './ProductCard';
 import CleoAvatar from './CleoAvatar';
 import { parseMarkdownTable } from '../../services/parser';
+import { chatService } from '../../services/api';
 
-const MessageBubble = React.forwardRef(({ msg, specsList = [], specsMapping = {}, quotasMapping = {}, onViewSpec }, ref) => {
+const MessageBubble = React.forwardRef(({ msg, specsList = [], specsMapping = {}, onViewSpec }, ref) => {
     const parsedData = msg.sender === 'bot' && !msg.loading ? parseMarkdownTable(msg.text) : null;
+    const [quotas, setQuotas] = useState({});
+
+    // Installments for just the products in this answer (the server normalizes the ids);
+    // products missing from the quota book get an estimate from the inferred rates
+    useEffect(() => {
+        const products = (parsedData?.products || []).filter(p => p && String(p.Material || '').trim());
+        if (products.length === 0) return;
+        const materials = products.map(p => String(p.Material).trim());
+        chatService.lookupQuotas(materials).then(async (found) => {
+            const missing = products
+                .filter(p => !found[String(p.Material).trim()])
+                .map(p => ({
+                    material: String(p.Material).trim(),
+                    price: parseFloat(String(p['Precio Contado'] || 0).replace(/[^\d]/g, '')) || 0
+                }))
+                .filter(item => item.price > 0);
+            const estimated = missing.length ? await chatService.computeQuotas(missing) : {};
+            setQuotas({ ...estimated, ...found });
+        }).catch(() => setQuotas({}));
+    }, [msg.text, msg.loading]);
 
     const checkHasSpec = (materialId, modelName) => {
         // Priority 1: Backend mapping
@@ -50,19 +71,7 @@ const MessageBubble = React.forwardRef(({ msg, specsList = [], specsMapping = {}
                                                     CantDisponible: parseInt(String(product.CantDisponible || 0).replace(/[^\d]/g, '')) || 0,
                                                     "Precio Contado": parseFloat(String(product['Precio Contado'] || 0).replace(/[^\d]/g, '')) || 0,
                                                     hasSpec: checkHasSpec(product.Material, product.Subproducto),
-                                                    quotas: (() => {
-                                                        const rawId = String(product.Material || '').trim();
-                                                        const cleanId = rawId.replace(/[^\d]/g, '');
-                                                        const normalizedId = cleanId.replace(/^0+/, ''); // Strip leading zeros
-
-                                                        if (!cleanId) return null;
-
-                                                        // Priority lookup: Exact -> Cleaned -> Normalized (No leading zeros)
-                                                        const result = quotasMapping[rawId] ||
-                                                            quotasMapping[cleanId] ||
-                                                            quotasMapping[normalizedId];
-                                                        return result;
-                                                    })()
+                                                    quotas: quotas[String(product.Material || '').trim()] || null
                                                 }}
                                                 specsMapping={specsMapping}
                                                 onViewSpec={onViewSpec}
@@ -96,8 +96,21 @@ const ExpertKnowledge = ({ specFile, setSpecFile, specName, setSpecName, handleS
         setQuotasStatus('Subiendo y procesando cuotas...');
         try {
             const result = await chatService.uploadQuotas(quotasFile);
-            setQuotasStatus(result.message || 'Proceso completado.');
             setQuotasFile(null);
+            if (!result.job_id) {
+                setQuotasStatus(result.message || result.detail || 'Error al subir el archivo.');
+                return;
+            }
+            // Parsing runs as a background job: poll it until it finishes
+            setQuotasStatus(result.message);
+            let job = null;
+            do {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                job = await chatService.getJob(result.job_id);
+            } while (job.status === 'queued' || job.status === 'running');
+            setQuotasStatus(job.status === 'succeeded'
+                ? (job.result?.message || 'Proceso completado.')
+                : `Error al procesar cuotas: ${job.error || 'desconocido'}`);
         } catch (e) {
             setQuotasStatus('Error al subir el archivo.');
         } finally {
@@ -2,23 +2,27 @@ import React, { useState, useEffect } from 'react';
 import { chatService } from '../../services/api';
 
 const QuotasLookup = () => {
-    const [quotasMapping, setQuotasMapping] = useState({});
+    const [totalEquipos, setTotalEquipos] = useState(0);
     const [query, setQuery] = useState('');
     const [result, setResult] = useState(null);
     const [searched, setSearched] = useState(false);
     const [loading, setLoading] = useState(true);
 
     useEffect(() => {
-        chatService.getQuotas().then(data => {
-            setQuotasMapping(data || {});
+        chatService.getQuotasSummary().then(data => {
+            setTotalEquipos(data?.count || 0);
             setLoading(false);
         }).catch(() => setLoading(false));
     }, []);
 
-    const handleSearch = () => {
-        const cleanId = String(query).replace(/[^\d]/g, '').trim();
-        const found = quotasMapping[cleanId] || quotasMapping[query.trim()];
-        setResult(found || null);
+    const handleSearch = async () => {
+        const material = query.trim();
+        try {
+            const found = await chatService.lookupQuotas([material]);
+            setResult(found[material] || null);
+        } catch (e) {
+            setResult(null);
+        }
         setSearched(true);
     };
 
@@ -26,8 +30,6 @@ const QuotasLookup = () => {
         if (e.key === 'Enter') handleSearch();
     };
 
-    const totalEquipos = Object.keys(quotasMapping).length;
-
     return (
         <div className="chat-area" style={{ color: 'white', padding: '24px', maxWidth: '700px', margin: '0 auto' }}>
             {/* Header */}
@@ -6,6 +6,40 @@ export const chatService = {
         return response.json();
     },
 
+    async streamMessage(query, onToken) {
+        const response = await fetch(`${BASE_URL}/chat/stream?query=${encodeURIComponent(query)}`);
+        if (!response.ok || !response.body) throw new Error(`Stream error ${response.status}`);
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE events are separated by a blank line
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const raw of events) {
+                const event = raw.match(/^event: (.*)$/m)?.[1];
+                const data = raw.match(/^data: (.*)$/m)?.[1];
+                if (!event || !data) continue;
+                const payload = JSON.parse(data);
+                if (event === 'token') {
+                    text += payload.text;
+                    onToken(text);
+                } else if (event === 'error') {
+                    text = payload.text;
+                    onToken(text);
+                }
+            }
+        }
+        return { response: text };
+    },
+
     async uploadInventory(file) {
         const formData = new FormData();
         formData.append('file', file);
@@ -16,6 +50,12 @@ export const chatService = {
         return response;
     },
 
+    async getJob(jobId) {
+        const response = await fetch(`${BASE_URL}/jobs/${jobId}`);
+        if (!response.ok) throw new Error('Job no encontrado');
+        return response.json();
+    },
+
     async uploadSpec(file) {
         const formData = new FormData();
         formData.append('file', file);
@@ -46,11 +86,32 @@ export const chatService = {
         return response.json();
     },
 
-    async getQuotas() {
-        const response = await fetch(`${BASE_URL}/quotas`);
+    async getQuotasSummary() {
+        const response = await fetch(`${BASE_URL}/quotas/summary`);
         return response.json();
     },
 
+    async lookupQuotas(materials) {
+        const response = await fetch(`${BASE_URL}/quotas/lookup`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ materials })
+        });
+        const data = await response.json();
+        return data.quotas || {};
+    },
+
+    async computeQuotas(items) {
+        const response = await fetch(`${BASE_URL}/quotas/compute`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ items })
+        });
+        if (!response.ok) return {};
+        const data = await response.json();
+        return data.quotas || {};
+    },
+
     async uploadQuotas(file) {
         const formData = new FormData();
         formData.append('file', file);